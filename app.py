@@ -1,18 +1,47 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 import asyncio
+import nest_asyncio
+from client.image_pipeline import IMAGES, UnsupportedImage
+from client.llm_gateway import GATEWAY
 from client.openai_client import MCPOpenAIClient
-from router.router import call_agent
+from router.router import call_agent, iter_call_agent
+from router.streaming import format_sse
+from telemetry.log_writer import LOGS
+from router.agent_pool import AGENT_HOST_MODE, POOL
+from router.registry import REGISTRY
+from telemetry.metrics import HTTP_SECONDS, METRICS
 
+import json
 import os
-import uuid
+import time
 from datetime import datetime
-import json
+
+# Flask handlers are sync, so every route drives the shared loop itself
+nest_asyncio.apply()
 
 app = Flask(__name__)
 client = MCPOpenAIClient()
 loop = asyncio.new_event_loop()
 asyncio.set_event_loop(loop)
 
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    # Streamed responses are timed to their first byte here; asgi.py times them fully
+    endpoint = request.url_rule.rule if request.url_rule else "other"
+    HTTP_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint,
+                         method=request.method, status=str(response.status_code))
+    return response
+
+@app.route("/metrics")
+def metrics():
+    remote = (loop.run_until_complete(POOL.metrics_snapshots(pool="router"))
+              + loop.run_until_complete(client.pool.metrics_snapshots(pool="client")))
+    return Response(METRICS.render(remote), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.route("/tool-chaining", methods=["POST"])
 def ask():
     query = request.json.get("query", "")
@@ -21,9 +50,30 @@ def ask():
 
     return jsonify({
         "response": result["response"],
-        "trace": result["trace"]  # contains tool_name, args, tool_response
+        "trace": result["trace"],  # contains tool_name, args, tool_response
+        "trace_id": result["trace_id"],
     })
 
+def stream_events(events):
+    """Drive an async event generator on the shared loop, one SSE frame at a time."""
+    def generate():
+        try:
+            while True:
+                try:
+                    event = loop.run_until_complete(events.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield format_sse(event)
+        except Exception as e:
+            yield format_sse({"event": "error", "data": {"error": str(e)}})
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.route("/tool-chaining/stream", methods=["POST"])
+def ask_stream():
+    query = request.json.get("query", "")
+    user_id = request.json.get("user_id", "default")
+    return stream_events(client.iter_query(query, user_id, stream_tokens=True))
+
 @app.route("/")
 def hello():
     return "MCP + OpenAI Supply Chain Assistant is live."
@@ -37,28 +87,25 @@ def analyze_image_route():
     question = request.form["question"]
     image_bytes = image_file.read()
 
-    # Save image locally
-    image_id = str(uuid.uuid4())
-    image_ext = os.path.splitext(image_file.filename)[-1]
-    image_path = f"logs/{image_id}{image_ext}"
-    with open(image_path, "wb") as f:
-        f.write(image_bytes)
+    # Hash, store once per unique image and downscale for upload
+    try:
+        image = IMAGES.prepare(image_bytes)
+    except UnsupportedImage as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Call GPT-4o
-    response_text = loop.run_until_complete(client.analyze_image(image_bytes, question))
+    # Call GPT-4o, unless this image and question were already answered
+    result = loop.run_until_complete(client.analyze_image(image, question))
 
     # Log metadata
     log = {
         "timestamp": datetime.now().isoformat(),
         "question": question,
-        "image_path": image_path,
-        "response": response_text,
+        **result,
     }
 
-    with open("logs/image_logs.jsonl", "a") as f:
-        f.write(json.dumps(log) + "\n")
+    LOGS.write("logs/image_logs.jsonl", log)
 
-    return jsonify({"response": response_text})
+    return jsonify({"response": result["response"], "image_hash": image.hash, "cache_hit": result["cache_hit"]})
 
 @app.route("/multi-agent", methods=["POST"])
 def multi_agent():
@@ -67,12 +114,34 @@ def multi_agent():
 
     return jsonify({
         "response": result["response"],
-        "trace": result["trace"]
+        "trace": result["trace"],
+        "trace_id": result["trace_id"],
     })
 
+@app.route("/multi-agent/stream", methods=["POST"])
+def multi_agent_stream():
+    query = request.json.get("query", "")
+    return stream_events(iter_call_agent(query, stream_tokens=True))
+
 if __name__ == "__main__":
-    loop.run_until_complete(client.connect_to_servers({
-        "SupplyChainServer": "server/supply_data_server.py",
-        "ForecastAgent": "server/forecast_agent_server.py"
-    }))
-    app.run(port=5001)
+    if AGENT_HOST_MODE:
+        # The same two tool sets, served by one process over one dataset
+        servers = {"AgentHost": ["server/agent_host.py", "--agents", "DelayStatsAgent,ForecastAgent"]}
+    else:
+        servers = {
+            "SupplyChainServer": "server/supply_data_server.py",
+            "ForecastAgent": "server/forecast_agent_server.py"
+        }
+    if os.getenv("MCP_CLIENT_SERVERS"):
+        servers = json.loads(os.getenv("MCP_CLIENT_SERVERS"))
+    loop.run_until_complete(client.connect_to_servers(servers))
+    # Discover agent tools before serving so the first request skips it
+    loop.run_until_complete(REGISTRY.refresh())
+    try:
+        app.run(port=5001)
+    finally:
+        # Stop the pooled agent subprocesses and the client's stdio sessions
+        loop.run_until_complete(POOL.shutdown())
+        loop.run_until_complete(client.cleanup())
+        loop.run_until_complete(GATEWAY.close())
+        LOGS.close()
@@ -0,0 +1,304 @@
+"""Async serving mode for the assistant API.
+
+Exposes the same routes and payloads as app.py, but on a native ASGI
+server: every request runs on one shared event loop with one shared
+MCPOpenAIClient, so slow LLM calls no longer serialize other users.
+Requests beyond API_MAX_CONCURRENCY wait in a bounded queue
+(API_MAX_QUEUE); once that is full the API answers 429.
+
+    python asgi.py            # or: uvicorn asgi:app --port 5001
+"""
+import asyncio
+import contextlib
+import json
+import os
+import time
+from datetime import datetime
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from client.image_pipeline import IMAGES, UnsupportedImage
+from client.llm_cache import LLM_CACHE
+from client.llm_gateway import GATEWAY
+from client.openai_client import MCPOpenAIClient
+from router.agent_pool import AGENT_HOST_MODE, POOL
+from router.registry import REGISTRY
+from router.router import call_agent, iter_call_agent
+from router.streaming import format_sse
+from telemetry.log_writer import LOGS
+from telemetry.metrics import HTTP_SECONDS, METRICS
+
+MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "16"))
+MAX_QUEUE = int(os.getenv("API_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "30"))
+
+CLIENT_SERVERS = {
+    "SupplyChainServer": "server/supply_data_server.py",
+    "ForecastAgent": "server/forecast_agent_server.py",
+}
+if AGENT_HOST_MODE:
+    # The same two tool sets, served by one process over one dataset
+    CLIENT_SERVERS = {"AgentHost": ["server/agent_host.py", "--agents", "DelayStatsAgent,ForecastAgent"]}
+if os.getenv("MCP_CLIENT_SERVERS"):
+    # e.g. {"SupplyChainServer": ["http://node1:8050/sse", "http://node2:8050/sse"], ...}
+    CLIENT_SERVERS = json.loads(os.getenv("MCP_CLIENT_SERVERS"))
+
+
+class Saturated(Exception):
+    pass
+
+
+class AdmissionLimiter:
+    """Concurrency limit with a bounded wait queue (backpressure, not buffering)."""
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if not self._sem.locked():
+            # Free slot: acquire() returns without suspending
+            await self._sem.acquire()
+        elif self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Saturated()
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._sem.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Saturated()
+            finally:
+                self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._sem.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
+
+
+client = MCPOpenAIClient()
+limiter = AdmissionLimiter(MAX_CONCURRENCY, MAX_QUEUE, QUEUE_TIMEOUT)
+
+
+def busy_response() -> JSONResponse:
+    return JSONResponse(
+        {"error": "Server is busy, retry shortly"},
+        status_code=429,
+        headers={"Retry-After": "1"},
+    )
+
+
+def limited(handler):
+    async def wrapper(request: Request):
+        try:
+            async with limiter.slot():
+                return await handler(request)
+        except Saturated:
+            return busy_response()
+    return wrapper
+
+
+class LimitedStreamingResponse(StreamingResponse):
+    """A streaming response that takes its limiter slot only once it is being
+    sent and gives it back however sending ends (finished, failed or client
+    gone), or answers 429 if the server is saturated."""
+
+    async def __call__(self, scope, receive, send):
+        try:
+            async with limiter.slot():
+                await super().__call__(scope, receive, send)
+        except Saturated:
+            await busy_response()(scope, receive, send)
+
+
+async def sse_response(events):
+    """Stream events as SSE, holding a limiter slot until the stream ends."""
+    async def body():
+        try:
+            async for event in events:
+                yield format_sse(event)
+        except Exception as e:
+            yield format_sse({"event": "error", "data": {"error": str(e)}})
+
+    return LimitedStreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+class RequestTiming:
+    """ASGI middleware feeding http_request_seconds.
+
+    Timing runs until the last body chunk is sent, so streamed responses
+    count their full duration. Unknown paths share the "other" label to
+    keep the series count bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        endpoint = scope["path"] if scope["path"] in ENDPOINTS else "other"
+        status = "500"
+        t0 = time.perf_counter()
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            HTTP_SECONDS.observe(time.perf_counter() - t0, endpoint=endpoint, method=scope["method"], status=status)
+
+
+async def hello(request: Request):
+    return PlainTextResponse("MCP + OpenAI Supply Chain Assistant is live.")
+
+
+@limited
+async def ask(request: Request):
+    body = await request.json()
+    query = body.get("query", "")
+    user_id = body.get("user_id", "default")
+    result = await client.process_query(query, user_id)
+
+    return JSONResponse({
+        "response": result["response"],
+        "trace": result["trace"],  # contains tool_name, args, tool_response
+        "trace_id": result["trace_id"],
+    })
+
+
+@limited
+async def analyze_image_route(request: Request):
+    form = await request.form()
+    if "image" not in form or "question" not in form:
+        return JSONResponse({"error": "Missing 'image' or 'question'"}, status_code=400)
+
+    image_file = form["image"]
+    question = form["question"]
+    image_bytes = await image_file.read()
+
+    # Hash, store once per unique image and downscale for upload
+    try:
+        image = await asyncio.to_thread(IMAGES.prepare, image_bytes)
+    except UnsupportedImage as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    # Call GPT-4o, unless this image and question were already answered
+    result = await client.analyze_image(image, question)
+
+    # Log metadata
+    log = {
+        "timestamp": datetime.now().isoformat(),
+        "question": question,
+        **result,
+    }
+    LOGS.write("logs/image_logs.jsonl", log)
+
+    return JSONResponse({"response": result["response"], "image_hash": image.hash, "cache_hit": result["cache_hit"]})
+
+
+@limited
+async def multi_agent(request: Request):
+    body = await request.json()
+    query = body.get("query", "")
+    result = await call_agent(query)
+
+    return JSONResponse({
+        "response": result["response"],
+        "trace": result["trace"],
+        "trace_id": result["trace_id"],
+    })
+
+
+async def ask_stream(request: Request):
+    body = await request.json()
+    query = body.get("query", "")
+    user_id = body.get("user_id", "default")
+    return await sse_response(client.iter_query(query, user_id, stream_tokens=True))
+
+
+async def multi_agent_stream(request: Request):
+    body = await request.json()
+    query = body.get("query", "")
+    return await sse_response(iter_call_agent(query, stream_tokens=True))
+
+
+async def health(request: Request):
+    return JSONResponse({
+        "limiter": limiter.stats(),
+        "llm": GATEWAY.stats(),
+        "llm_cache": LLM_CACHE.stats(),
+        "images": IMAGES.stats(),
+        "agents": POOL.stats(),
+        "client_agents": client.pool.stats(),
+        "logs": LOGS.stats(),
+    })
+
+
+async def metrics(request: Request):
+    """Prometheus text: this process plus every agent process it talks to."""
+    remote = await POOL.metrics_snapshots(pool="router") + await client.pool.metrics_snapshots(pool="client")
+    return PlainTextResponse(METRICS.render(remote), media_type="text/plain; version=0.0.4")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    os.makedirs("logs", exist_ok=True)
+    await client.connect_to_servers(CLIENT_SERVERS)
+    # Discover agent tools before serving so the first request skips it
+    await REGISTRY.refresh()
+    try:
+        yield
+    finally:
+        await POOL.shutdown()
+        await client.cleanup()
+        await GATEWAY.close()
+        LLM_CACHE.close()
+        await asyncio.to_thread(LOGS.close)
+
+
+routes = [
+    Route("/", hello),
+    Route("/tool-chaining", ask, methods=["POST"]),
+    Route("/tool-chaining/stream", ask_stream, methods=["POST"]),
+    Route("/analyze-image", analyze_image_route, methods=["POST"]),
+    Route("/multi-agent", multi_agent, methods=["POST"]),
+    Route("/multi-agent/stream", multi_agent_stream, methods=["POST"]),
+    Route("/health", health),
+    Route("/metrics", metrics),
+]
+ENDPOINTS = {route.path for route in routes}
+
+app = Starlette(routes=routes, middleware=[Middleware(RequestTiming)], lifespan=lifespan)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("API_HOST", "127.0.0.1"), port=int(os.getenv("API_PORT", "5001")))
@@ -0,0 +1,156 @@
+"""End-to-end benchmarks of router.call_agent and MCPOpenAIClient.process_query.
+
+Both run their real code paths (agent pool and subprocesses, registry,
+planner loop or tool-chaining loop, caches) against bench/fake_openai.py,
+over a synthetic dataset. The Azure and dataset settings are passed through
+the environment, so this module must set them before importing the router
+or the client, and the agent subprocesses inherit them.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from bench.report import children_peak_rss_mb, latency_stats
+
+QUERIES = [
+    "What do delivery delays look like overall?",
+    "Which products are low on stock?",
+    "Forecast demand for Western Europe and South Asia",
+    "Compare sales in Western Europe and South Asia and suggest shipping",
+    # Answered by the fast path without a model round-trip
+    "Total sales in Western Europe",
+]
+
+CLIENT_SERVERS = {
+    "SupplyChainServer": "server/supply_data_server.py",
+    "ForecastAgent": "server/forecast_agent_server.py",
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_openai(latency: float = 0.0, port: int = None) -> tuple:
+    """Launch bench/fake_openai.py; returns (process, endpoint URL)."""
+    port = port or _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "bench/fake_openai.py", "--port", str(port), "--latency", str(latency)],
+    )
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("fake OpenAI server did not start")
+
+
+def configure(endpoint: str, csv_path: str, snapshot_path: str, caches: bool):
+    os.environ.update({
+        "AZURE_OPENAI_API_KEY": "bench",
+        "AZURE_OPENAI_ENDPOINT": endpoint,
+        "AZURE_OPENAI_API_VERSION": "2024-06-01",
+        "AZURE_OPENAI_MODEL": "bench",
+        "DATACO_CSV": csv_path,
+        "DATACO_SNAPSHOT": snapshot_path,
+    })
+    if not caches:
+        # Measure the uncached paths: every request reaches the model and tools
+        os.environ["LLM_CACHE_ENABLED"] = "0"
+        os.environ["TOOL_CACHE_TTL"] = "0"
+
+
+async def _drive(call, requests: int, concurrency: int) -> tuple:
+    """Run `call(query)` `requests` times, `concurrency` at a time."""
+    samples = []
+    errors = 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal errors
+        async with limit:
+            t0 = time.perf_counter()
+            try:
+                await call(QUERIES[i % len(QUERIES)])
+            except Exception:
+                errors += 1
+                return
+            samples.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return samples, time.perf_counter() - t0, errors
+
+
+async def bench_router(requests: int, concurrency: int, exclude=()) -> dict:
+    from router.agent_pool import POOL
+    from router.router import call_agent
+
+    try:
+        # First request pays agent spawn, dataset load and tool discovery
+        t0 = time.perf_counter()
+        await call_agent(QUERIES[0])
+        cold = time.perf_counter() - t0
+        samples, wall, errors = await _drive(call_agent, requests, concurrency)
+        agents_rss = children_peak_rss_mb(exclude)
+    finally:
+        await POOL.shutdown()
+    stats = latency_stats(samples, wall)
+    stats["errors"] = errors
+    return {
+        "e2e/router_cold": latency_stats([cold]),
+        f"e2e/router_c{concurrency}": stats,
+        "e2e/router_agents_peak_rss_mb": {"value": agents_rss},
+    }
+
+
+async def bench_client(requests: int, concurrency: int, exclude=()) -> dict:
+    from client.openai_client import MCPOpenAIClient
+
+    client = MCPOpenAIClient()
+    try:
+        t0 = time.perf_counter()
+        await client.connect_to_servers(CLIENT_SERVERS)
+        connect = time.perf_counter() - t0
+        samples, wall, errors = await _drive(client.process_query, requests, concurrency)
+        agents_rss = children_peak_rss_mb(exclude)
+    finally:
+        await client.cleanup()
+    stats = latency_stats(samples, wall)
+    stats["errors"] = errors
+    return {
+        "e2e/client_connect": latency_stats([connect]),
+        f"e2e/client_c{concurrency}": stats,
+        "e2e/client_agents_peak_rss_mb": {"value": agents_rss},
+    }
+
+
+def run(csv_path: str, snapshot_path: str, requests: int = 50, concurrency: int = 8,
+        latency: float = 0.0, caches: bool = False, targets=("router", "client")) -> dict:
+    proc, endpoint = start_fake_openai(latency)
+    try:
+        configure(endpoint, csv_path, snapshot_path, caches)
+        results = {}
+
+        async def main():
+            from client.llm_gateway import GATEWAY
+
+            if "router" in targets:
+                results.update(await bench_router(requests, concurrency, exclude={proc.pid}))
+            if "client" in targets:
+                results.update(await bench_client(requests, concurrency, exclude={proc.pid}))
+            await GATEWAY.close()
+
+        asyncio.run(main())
+        return results
+    finally:
+        proc.terminate()
+        proc.wait()
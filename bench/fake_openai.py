@@ -0,0 +1,129 @@
+"""A scripted stand-in for the Azure OpenAI chat completions endpoint.
+
+Replies are deterministic functions of the request, so end-to-end runs
+exercise the real router and client code paths without a live model:
+
+- router planner turns (no `tools`): a `plan` of parallel steps for queries
+  containing "compare", otherwise one `next_tool` chosen by keyword, then a
+  `final_response` once tool output is in the conversation;
+- tool-calling turns (`tools` given): two parallel tool calls, then a final
+  answer once their results are in.
+
+Streaming and non-streaming requests are both supported. `--latency` adds a
+fixed delay per completion to model the real service.
+
+    python bench/fake_openai.py --port 5099 --latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+LATENCY = 0.0
+
+# query keyword -> (tool, args) for one-step planner replies
+NEXT_TOOL = [
+    ("stock", "low_stock_products", {"threshold": 50}),
+    ("restock", "restock_suggestion", {"region": "Western Europe"}),
+    ("forecast", "forecast_demand", {"regions": ["Western Europe", "South Asia"]}),
+    ("shipping", "recommend_shipping_method", {"region": "Western Europe"}),
+]
+DEFAULT_TOOL = ("get_delay_stats", {})
+
+PLAN = [
+    {"id": "eu", "tool": "total_sales_by_region", "args": {"region": "Western Europe"}},
+    {"id": "sa", "tool": "total_sales_by_region", "args": {"region": "South Asia"}},
+    {"id": "delays", "tool": "get_delay_stats", "args": {}},
+    {"id": "ship", "tool": "recommend_shipping_method", "args": {"region": "Western Europe"},
+     "depends_on": ["delays"]},
+]
+
+TOOL_CALLS = [
+    ("get_delay_stats", {}),
+    ("forecast_demand", {"regions": ["Western Europe"]}),
+]
+
+
+def planner_reply(messages) -> dict:
+    query = messages[1]["content"].lower()
+    outputs = [m for m in messages if str(m.get("content", "")).startswith("[Tool Output]")]
+    if outputs:
+        answer = {"reasoning": "Enough data.", "final_response": f"Summary of {len(outputs)} tool result(s)."}
+    elif "compare" in query:
+        answer = {"reasoning": "Independent lookups.", "plan": PLAN}
+    else:
+        tool, args = next(((t, a) for word, t, a in NEXT_TOOL if word in query), DEFAULT_TOOL)
+        answer = {"reasoning": f"Use {tool}.", "next_tool": tool, "args": args}
+    return {"content": json.dumps(answer)}
+
+
+def tool_reply(messages) -> dict:
+    if any(m.get("role") == "tool" for m in messages):
+        return {"content": "Delays are stable and Western Europe demand is steady."}
+    return {"content": None, "tool_calls": [
+        {"id": f"call_{i}", "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+        for i, (name, args) in enumerate(TOOL_CALLS)
+    ]}
+
+
+def reply(body: dict) -> dict:
+    return tool_reply(body["messages"]) if body.get("tools") else planner_reply(body["messages"])
+
+
+def completion(message: dict) -> dict:
+    return {
+        "id": "bench", "object": "chat.completion", "created": int(time.time()), "model": "bench",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", **message}}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    }
+
+
+def chunk(delta: dict, finish=None) -> str:
+    payload = {"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": "bench",
+               "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+async def stream(message: dict):
+    for i, call in enumerate(message.get("tool_calls") or []):
+        yield chunk({"role": "assistant", "tool_calls": [{"index": i, **call}]})
+    content = message.get("content") or ""
+    for i in range(0, len(content), 16):
+        yield chunk({"content": content[i:i + 16]})
+    yield chunk({}, "stop")
+    yield "data: [DONE]\n\n"
+
+
+async def chat(request):
+    body = await request.json()
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+    message = reply(body)
+    if body.get("stream"):
+        return StreamingResponse(stream(message), media_type="text/event-stream")
+    return JSONResponse(completion(message))
+
+
+app = Starlette(routes=[
+    Route("/openai/deployments/{model}/chat/completions", chat, methods=["POST"]),
+])
+
+
+def main():
+    global LATENCY
+    parser = argparse.ArgumentParser(description="Scripted fake Azure OpenAI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every completion")
+    args = parser.parse_args()
+    LATENCY = args.latency
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Micro-benchmarks for every tool of the three agent servers.
+
+The servers are imported in-process against a synthetic dataset and each
+tool is called through FastMCP's `call_tool`, so argument validation and
+result serialization are included but no transport is. Dataset load and
+aggregate build times are reported alongside.
+"""
+import asyncio
+import importlib
+import os
+import time
+
+from bench.report import latency_stats
+
+SERVER_MODULES = [
+    "server.supply_data_server",
+    "server.forecast_agent_server",
+    "server.inventory_agent_server",
+]
+
+# Arguments each tool is benchmarked with; tools missing here are reported
+TOOL_ARGS = {
+    "get_delay_stats": {},
+    "query_orders_by_region": {"region": "Western Europe"},
+    "get_shipping_mode_breakdown": {},
+    "top_delayed_products": {"n": 10},
+    "avg_delay_by_shipping_mode": {},
+    "recommend_shipping_method": {"region": "Western Europe"},
+    "total_sales_by_region": {"region": "Western Europe"},
+    "forecast_demand": {"regions": ["Western Europe", "South Asia", "Canada"]},
+    "low_stock_products": {"threshold": 1000},
+    "restock_suggestion": {"region": "Western Europe"},
+    "products_at_risk_of_stockout": {"min_orders": 5},
+    "demand_supply_gap": {"top_n": 10},
+    "product_status_overview": {},
+}
+
+
+def load_servers(csv_path: str, snapshot_path: str) -> tuple:
+    """Import the servers over the given dataset; returns (modules, load stats).
+
+    server.dataset reads DATACO_CSV / DATACO_SNAPSHOT when it is first
+    imported, so the caller's process must be started with them set.
+    """
+    t0 = time.perf_counter()
+    modules = [importlib.import_module(name) for name in SERVER_MODULES]
+    imported = time.perf_counter() - t0
+    dataset = modules[0].dataset
+    if os.path.abspath(dataset.snapshot_path) != os.path.abspath(snapshot_path):
+        raise RuntimeError(f"servers loaded {dataset.snapshot_path}, not {snapshot_path}; "
+                           "set DATACO_CSV/DATACO_SNAPSHOT before importing server.dataset")
+    dataset.ready.wait()
+    if dataset.error is not None:
+        raise dataset.error
+    results = {
+        "load/import_servers": latency_stats([imported]),
+        "load/dataset": latency_stats([dataset.load_seconds]),
+        "load/ready": latency_stats([time.perf_counter() - t0]),
+    }
+    for module in modules:
+        for name, seconds in module.aggregates.build_seconds.items():
+            results[f"aggregate/{name}"] = latency_stats([seconds])
+    return modules, results
+
+
+async def bench_tools(modules, iterations: int = 50, warmup: int = 2) -> dict:
+    results = {}
+    for module in modules:
+        for tool in await module.mcp.list_tools():
+            name = tool.name
+            if name.startswith("admin_"):
+                continue
+            if name not in TOOL_ARGS:
+                print(f"no benchmark arguments for tool {name}; skipped")
+                continue
+            args = TOOL_ARGS[name]
+            for _ in range(warmup):
+                await module.mcp.call_tool(name, args)
+            samples = []
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                await module.mcp.call_tool(name, args)
+                samples.append(time.perf_counter() - t0)
+            results[f"tool/{name}"] = latency_stats(samples)
+    return results
+
+
+def run(csv_path: str, snapshot_path: str, iterations: int = 50) -> dict:
+    modules, results = load_servers(csv_path, snapshot_path)
+    results.update(asyncio.run(bench_tools(modules, iterations)))
+    return results
@@ -0,0 +1,141 @@
+"""Latency statistics, peak RSS and saved baselines for the benchmarks.
+
+A run's results are {benchmark name: stats}; `save_baseline` writes them to
+BENCH_BASELINE_DIR/<name>.json together with the run's settings, and
+`compare` lines a new run up against a saved one, flagging benchmarks whose
+p50 or p95 latency grew by more than the tolerance (and by at least
+BENCH_MIN_DELTA_MS, so microsecond-scale tools do not flap).
+"""
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+
+BENCH_BASELINE_DIR = os.getenv("BENCH_BASELINE_DIR", "bench/baselines")
+# Relative latency increase reported as a regression
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.2"))
+# Increases smaller than this are timer noise, whatever their relative size
+BENCH_MIN_DELTA_MS = float(os.getenv("BENCH_MIN_DELTA_MS", "0.5"))
+
+
+def latency_stats(samples, wall_seconds: float = None) -> dict:
+    """p50/p95/p99/mean in milliseconds and throughput in operations per second.
+
+    Throughput is len(samples) over `wall_seconds` when the samples ran
+    concurrently, otherwise over their sum.
+    """
+    ms = np.asarray(samples, dtype=float) * 1000
+    if not len(ms):
+        return {"n": 0}
+    wall = wall_seconds if wall_seconds is not None else ms.sum() / 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "n": len(ms),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "throughput": round(len(ms) / wall, 2) if wall > 0 and (len(ms) > 1 or wall_seconds) else None,
+    }
+
+
+def _vm_hwm_kb(pid) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def peak_rss_mb(pid="self") -> float:
+    """Peak resident set size of a process.
+
+    Read from /proc where available: getrusage's ru_maxrss survives fork and
+    exec on Linux, so a child would report its parent's peak.
+    """
+    try:
+        return round(_vm_hwm_kb(pid) / 1024, 1)
+    except OSError:
+        if pid != "self":
+            return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def child_pids() -> list:
+    """PIDs of this process's live children (Linux only; [] elsewhere)."""
+    pids = []
+    try:
+        for tid in os.listdir("/proc/self/task"):
+            with open(f"/proc/self/task/{tid}/children") as f:
+                pids += [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+    return pids
+
+
+def children_peak_rss_mb(exclude=()) -> float:
+    """Summed peak RSS of the live child processes (e.g. agent servers)."""
+    return round(sum(peak_rss_mb(pid) for pid in child_pids() if pid not in exclude), 1)
+
+
+def print_table(results: dict, baseline: dict = None):
+    base = (baseline or {}).get("results", {})
+    header = f"{'benchmark':<44}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}"
+    print(header + ("   vs baseline p50/p95" if base else ""))
+    print("-" * (len(header) + (24 if base else 0)))
+    for name, stats in results.items():
+        if "p50_ms" not in stats:
+            continue
+        throughput = f"{stats['throughput']:.1f}" if stats.get("throughput") else "-"
+        line = (f"{name:<44}{stats['n']:>6}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+                f"{stats['p99_ms']:>10.2f}{throughput:>10}")
+        if name in base and "p50_ms" in base[name]:
+            line += "   " + "/".join(_delta(stats[k], base[name][k]) for k in ("p50_ms", "p95_ms"))
+        print(line)
+
+
+def _delta(new: float, old: float) -> str:
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old:+.0%}"
+
+
+def save_baseline(name: str, results: dict, settings: dict, directory: str = BENCH_BASELINE_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "name": name,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "settings": settings,
+            "results": results,
+        }, f, indent=2)
+    return path
+
+
+def load_baseline(name: str, directory: str = BENCH_BASELINE_DIR) -> dict:
+    path = name if name.endswith(".json") else os.path.join(directory, f"{name}.json")
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results: dict, baseline: dict, tolerance: float = BENCH_TOLERANCE) -> list:
+    """Benchmarks whose p50 or p95 latency regressed beyond `tolerance`."""
+    regressions = []
+    for name, stats in results.items():
+        old = baseline.get("results", {}).get(name, {})
+        for key in ("p50_ms", "p95_ms"):
+            if not old.get(key) or stats.get(key) is None:
+                continue
+            if stats[key] > old[key] * (1 + tolerance) and stats[key] - old[key] >= BENCH_MIN_DELTA_MS:
+                regressions.append(f"{name} {key}: {old[key]:.2f} -> {stats[key]:.2f}")
+    return regressions
@@ -0,0 +1,98 @@
+"""Benchmark runner.
+
+    python bench/run.py micro --rows 1000000                 # every agent tool, in-process
+    python bench/run.py e2e --rows 100000 --concurrency 16   # router + client vs the fake model
+    python bench/run.py all --save main                      # save bench/baselines/main.json
+    python bench/run.py all --compare main                   # report and flag regressions
+
+Synthetic datasets are generated once per row count under data/bench/
+(see bench/synthetic.py). Each part runs in its own process so its peak RSS
+is measured on its own, and e2e also reports the agent subprocesses' summed
+peak RSS. The process exits non-zero when --compare finds a regression
+beyond --tolerance.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bench.report import (BENCH_TOLERANCE, compare, load_baseline, peak_rss_mb, print_table,
+                          save_baseline)
+from bench.synthetic import ensure_dataset
+
+
+def run_part(part: str, args) -> dict:
+    """Run one part in this process and return its results."""
+    csv_path, snapshot_path = ensure_dataset(args.rows, args.data_dir)
+    if part == "micro":
+        from bench import micro
+
+        results = micro.run(csv_path, snapshot_path, args.iterations)
+        results["micro/peak_rss_mb"] = {"value": peak_rss_mb()}
+    else:
+        from bench import e2e
+
+        results = e2e.run(csv_path, snapshot_path, args.requests, args.concurrency,
+                          args.latency, args.caches)
+        results["e2e/peak_rss_mb"] = {"value": peak_rss_mb()}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent tools and request paths")
+    parser.add_argument("part", choices=["micro", "e2e", "all"])
+    parser.add_argument("--rows", type=int, default=100_000, help="synthetic dataset size")
+    parser.add_argument("--data-dir", default="data/bench")
+    parser.add_argument("--iterations", type=int, default=50, help="calls per tool (micro)")
+    parser.add_argument("--requests", type=int, default=50, help="requests per target (e2e)")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight (e2e)")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake model latency in seconds (e2e)")
+    parser.add_argument("--caches", action="store_true", help="keep the LLM and tool caches on (e2e)")
+    parser.add_argument("--save", metavar="NAME", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE)
+    parser.add_argument("--part-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.part_output:
+        # Child mode: run a single part and hand the results back as JSON
+        with open(args.part_output, "w") as f:
+            json.dump(run_part(args.part, args), f)
+        return
+
+    # Generate the dataset up front so its cost is not charged to a part
+    csv_path, snapshot_path = ensure_dataset(args.rows, args.data_dir)
+    # server.dataset reads these at import, so they go in the parts' environment
+    env = {**os.environ, "DATACO_CSV": csv_path, "DATACO_SNAPSHOT": snapshot_path}
+    results = {}
+    for part in (["micro", "e2e"] if args.part == "all" else [args.part]):
+        output = os.path.join(args.data_dir, f".bench_{part}_{os.getpid()}.json")
+        argv = [a for a in sys.argv[1:] if a != args.part]
+        subprocess.run([sys.executable, __file__, part, *argv, "--part-output", output], env=env, check=True)
+        with open(output) as f:
+            results.update(json.load(f))
+        os.remove(output)
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    print()
+    print_table(results, baseline)
+    for name, stats in results.items():
+        if "value" in stats:
+            print(f"{name}: {stats['value']}")
+
+    settings = {k: v for k, v in vars(args).items() if k not in ("save", "compare", "part_output")}
+    if args.save:
+        print(f"baseline saved to {save_baseline(args.save, results, settings)}")
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Synthetic datasets shaped like DataCoSupplyChainDataset.csv.
+
+Only the columns the agent servers read (server.dataset.RAW_COLUMNS) are
+written, with DataCo's region, shipping mode and date conventions, so the
+same loaders, snapshots and tools run on them unchanged. Rows are generated
+and appended in chunks, so 50M rows never need to fit in memory at once.
+
+    python bench/synthetic.py --rows 1000000 --out data/bench/dataco_1m.csv --snapshot
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.dataset import RAW_COLUMNS, build_snapshot
+
+REGIONS = [
+    "Western Europe", "Central America", "South America", "Northern Europe",
+    "Southern Europe", "Caribbean", "Oceania", "Southeast Asia", "West Asia",
+    "South Asia", "Eastern Asia", "West of USA", "East of USA", "US Center",
+    "South of  USA", "Eastern Europe", "North Africa", "West Africa",
+    "East Africa", "Central Africa", "Southern Africa", "Central Asia", "Canada",
+]
+# Relative order volume per region, roughly as skewed as the real data
+REGION_WEIGHTS = np.linspace(3.0, 0.2, len(REGIONS))
+PRODUCTS = [f"Product {i}" for i in range(1, 119)]
+# mode -> scheduled days for shipment
+SHIPPING_MODES = {"Standard Class": 4, "Second Class": 2, "First Class": 1, "Same Day": 0}
+MODE_WEIGHTS = [0.6, 0.2, 0.15, 0.05]
+START = pd.Timestamp("2015-01-01")
+SPAN_MINUTES = 3 * 365 * 24 * 60
+# Shipping is at most this many days after the order
+MAX_SHIP_DAYS = 10
+CHUNK_ROWS = 1_000_000
+
+_DATE_STRINGS = None
+
+
+def _date_strings() -> np.ndarray:
+    """Every minute of the span formatted once; rows then just index into it."""
+    global _DATE_STRINGS
+    if _DATE_STRINGS is None:
+        minutes = pd.date_range(START, periods=SPAN_MINUTES + MAX_SHIP_DAYS * 24 * 60, freq="min")
+        # DataCo writes dates as m/d/Y H:M without zero padding
+        formatted = minutes.strftime("%m/%d/%Y %H:%M").str.replace(r"(^|/)0", r"\1", regex=True)
+        _DATE_STRINGS = np.asarray(formatted, dtype=object)
+    return _DATE_STRINGS
+
+
+def chunk(rng: np.random.Generator, first_id: int, rows: int) -> pd.DataFrame:
+    region_p = REGION_WEIGHTS / REGION_WEIGHTS.sum()
+    modes = list(SHIPPING_MODES)
+    mode_idx = rng.choice(len(modes), rows, p=MODE_WEIGHTS)
+    scheduled = np.array(list(SHIPPING_MODES.values()), dtype=np.int16)[mode_idx]
+    # Same Day and First Class are late more often, as in DataCo
+    late = rng.integers(-2, 5, rows) + (mode_idx >= 2)
+    ordered = rng.integers(0, SPAN_MINUTES, rows)
+    shipped = ordered + np.clip(scheduled + late, 0, MAX_SHIP_DAYS) * 24 * 60
+    dates = _date_strings()
+    quantity = rng.integers(1, 6, rows)
+    return pd.DataFrame({
+        "Order Id": np.arange(first_id, first_id + rows, dtype=np.int64),
+        "Order Region": np.array(REGIONS, dtype=object)[rng.choice(len(REGIONS), rows, p=region_p)],
+        "Product Name": np.array(PRODUCTS, dtype=object)[(rng.zipf(1.6, rows) - 1) % len(PRODUCTS)],
+        "Shipping Mode": np.array(modes, dtype=object)[mode_idx],
+        "Product Status": (rng.random(rows) < 0.1).astype(np.int8),
+        "Sales": np.round(rng.gamma(2.0, 100.0, rows) * quantity, 2),
+        "Order Item Quantity": quantity,
+        "Days for shipment (scheduled)": scheduled,
+        "order date (DateOrders)": dates[ordered],
+        "shipping date (DateOrders)": dates[shipped],
+    })[list(RAW_COLUMNS)]
+
+
+def generate(path: str, rows: int, seed: int = 0, chunk_rows: int = CHUNK_ROWS) -> str:
+    """Write `rows` synthetic rows to `path` (CSV) and return the path."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    written = 0
+    with open(tmp_path, "w", encoding="ISO-8859-1", newline="") as f:
+        while written < rows:
+            n = min(chunk_rows, rows - written)
+            chunk(rng, written, n).to_csv(f, index=False, header=written == 0)
+            written += n
+    os.replace(tmp_path, path)
+    return path
+
+
+def dataset_paths(rows: int, directory: str = "data/bench") -> tuple:
+    """(csv, snapshot) paths for a synthetic dataset of `rows` rows."""
+    stem = os.path.join(directory, f"dataco_{rows}")
+    return f"{stem}.csv", f"{stem}.feather"
+
+
+def ensure_dataset(rows: int, directory: str = "data/bench", seed: int = 0) -> tuple:
+    """Generate (once) and snapshot a synthetic dataset; returns (csv, snapshot)."""
+    csv_path, snapshot_path = dataset_paths(rows, directory)
+    if not os.path.exists(csv_path):
+        generate(csv_path, rows, seed)
+    if not os.path.exists(snapshot_path) or os.path.getmtime(snapshot_path) < os.path.getmtime(csv_path):
+        build_snapshot(csv_path, snapshot_path)
+    return csv_path, snapshot_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic DataCo-shaped dataset")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--out", help="CSV path (default: data/bench/dataco_<rows>.csv)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--snapshot", action="store_true", help="also build the Feather snapshot next to it")
+    args = parser.parse_args()
+
+    csv_path = args.out or dataset_paths(args.rows)[0]
+    t0 = time.time()
+    generate(csv_path, args.rows, args.seed)
+    print(f"{args.rows} rows -> {csv_path} in {time.time() - t0:.1f}s")
+    if args.snapshot:
+        snapshot_path = os.path.splitext(csv_path)[0] + ".feather"
+        t0 = time.time()
+        build_snapshot(csv_path, snapshot_path)
+        print(f"snapshot -> {snapshot_path} in {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+# Talks to a DelayStatsAgent started with:
+#   python server/supply_data_server.py --transport sse --port 8050
 import asyncio
 from mcp import ClientSession
 from mcp.client.sse import sse_client
@@ -0,0 +1,284 @@
+"""Upload handling for /analyze-image: dedupe, downscale, answer cache.
+
+Every upload is hashed (SHA-256 of the original bytes). The original is
+stored once under IMAGE_STORE_DIR/<hash>.<ext>, however often it is sent,
+and the type is sniffed from the bytes rather than trusted from the file
+name. Before upload the image is resized to what the vision model would
+keep anyway: high detail fits an image into 2048x2048 and then scales its
+short side down to 768, so larger images only cost upload bytes and
+latency. Images that also fit IMAGE_LOW_DETAIL_SIDE go out with
+"detail": "low", which is a fixed small token cost. Photos are recompressed
+as JPEG when that is smaller. Resizing needs Pillow; without it images are
+sent as uploaded, still with the right MIME type and detail.
+
+Answers are cached in the LLM response cache under (model, image hash,
+normalized question, detail), so a repeated dashboard question skips the
+model entirely.
+"""
+import base64
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from client.llm_cache import _hash, normalize_text
+from telemetry.log_writer import LOGS
+
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "logs/images")
+# Limits the model applies to high-detail images; nothing above them is seen
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "2048"))
+IMAGE_MAX_SHORT_SIDE = int(os.getenv("IMAGE_MAX_SHORT_SIDE", "768"))
+# Images no larger than this on both sides are sent with "detail": "low"
+IMAGE_LOW_DETAIL_SIDE = int(os.getenv("IMAGE_LOW_DETAIL_SIDE", "512"))
+# auto, high or low
+IMAGE_DETAIL = os.getenv("IMAGE_DETAIL", "auto")
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+# Prepared (resized) uploads kept in memory, by hash
+IMAGE_MEMORY_ENTRIES = int(os.getenv("IMAGE_MEMORY_ENTRIES", "32"))
+
+EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif", "image/webp": ".webp"}
+PIL_FORMATS = {"image/png": "PNG", "image/jpeg": "JPEG", "image/webp": "WEBP", "image/gif": "PNG"}
+
+
+class UnsupportedImage(ValueError):
+    pass
+
+
+def sniff_mime(data: bytes):
+    """The image type from its magic bytes (the formats the vision model accepts)."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def _jpeg_size(data: bytes):
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        # Start-of-frame markers carry the dimensions (C4, C8, CC are not SOF)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return int.from_bytes(data[i + 7:i + 9], "big"), int.from_bytes(data[i + 5:i + 7], "big")
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def _webp_size(data: bytes):
+    chunk = data[12:16]
+    if chunk == b"VP8 ":
+        return int.from_bytes(data[26:28], "little") & 0x3FFF, int.from_bytes(data[28:30], "little") & 0x3FFF
+    if chunk == b"VP8L":
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    return None
+
+
+def image_size(data: bytes, mime: str):
+    """(width, height) read from the header, or None; no decoding needed."""
+    try:
+        if mime == "image/png":
+            return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+        if mime == "image/gif":
+            return int.from_bytes(data[6:8], "little"), int.from_bytes(data[8:10], "little")
+        if mime == "image/jpeg":
+            return _jpeg_size(data)
+        if mime == "image/webp":
+            return _webp_size(data)
+    except (IndexError, ValueError):
+        pass
+    return None
+
+
+def target_size(width: int, height: int) -> tuple:
+    scale = min(1.0, IMAGE_MAX_SIDE / max(width, height), IMAGE_MAX_SHORT_SIDE / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def choose_detail(size) -> str:
+    if IMAGE_DETAIL in ("high", "low"):
+        return IMAGE_DETAIL
+    if size and max(size) <= IMAGE_LOW_DETAIL_SIDE:
+        return "low"
+    return "high"
+
+
+def _encode(img, fmt: str) -> bytes:
+    out = io.BytesIO()
+    if fmt == "JPEG":
+        img.convert("RGB").save(out, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    elif fmt == "WEBP":
+        img.save(out, "WEBP", quality=IMAGE_JPEG_QUALITY)
+    else:
+        img.save(out, fmt, optimize=True)
+    return out.getvalue()
+
+
+def downscale(data: bytes, mime: str, size):
+    """(bytes, mime, size) resized/recompressed with Pillow, or None to send the
+    original (no Pillow, unreadable or animated image, or nothing gained)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        img = Image.open(io.BytesIO(data))
+        if getattr(img, "is_animated", False):
+            return None
+        img.load()
+    except Exception:
+        return None
+    size = size or img.size
+    new_size = target_size(*size)
+    resized = new_size != tuple(size)
+    if resized:
+        img = img.resize(new_size, Image.LANCZOS)
+
+    # Same format (GIF frames become PNG), or JPEG when there is no alpha;
+    # whichever is smaller is sent
+    candidates = []
+    if resized or mime == "image/gif":
+        candidates.append((_encode(img, PIL_FORMATS[mime]), "image/png" if mime == "image/gif" else mime))
+    transparent = "A" in img.getbands() or "transparency" in img.info
+    if not transparent and mime != "image/jpeg":
+        candidates.append((_encode(img, "JPEG"), "image/jpeg"))
+    if not candidates:
+        return None
+    encoded, new_mime = min(candidates, key=lambda c: len(c[0]))
+    if not resized and len(encoded) >= len(data):
+        return None
+    return encoded, new_mime, new_size
+
+
+@dataclass
+class PreparedImage:
+    hash: str
+    mime: str            # of `data`, the bytes sent to the model
+    data: bytes
+    size: tuple          # (width, height) of `data`, or None if unknown
+    detail: str
+    path: str            # where the original is stored
+    original_bytes: int
+    original_size: tuple = None
+
+    def data_url(self) -> str:
+        return f"data:{self.mime};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+    def info(self) -> dict:
+        return {
+            "image_hash": self.hash,
+            "image_path": self.path,
+            "mime_type": self.mime,
+            "detail": self.detail,
+            "original_bytes": self.original_bytes,
+            "upload_bytes": len(self.data),
+            "original_size": list(self.original_size) if self.original_size else None,
+            "upload_size": list(self.size) if self.size else None,
+        }
+
+
+class ImagePipeline:
+    def __init__(self, store_dir: str = IMAGE_STORE_DIR, memory_entries: int = IMAGE_MEMORY_ENTRIES):
+        self.store_dir = store_dir
+        self.memory_entries = memory_entries
+        self._prepared = OrderedDict()  # hash -> PreparedImage
+        self._stored = set()   # hashes whose original is on disk
+        self._storing = set()  # hashes queued for writing
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.duplicates = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def store(self, digest: str, mime: str, data: bytes) -> str:
+        """Write the original once per hash; returns its path.
+
+        A hash counts as stored only once its write succeeded, so a write
+        that was dropped or failed is tried again on the next upload.
+        """
+        path = os.path.join(self.store_dir, digest + EXTENSIONS[mime])
+        with self._lock:
+            if digest in self._stored or digest in self._storing:
+                return path
+            if os.path.exists(path):
+                self._stored.add(digest)
+                return path
+            self._storing.add(digest)
+
+        def done(ok: bool):
+            with self._lock:
+                self._storing.discard(digest)
+                if ok:
+                    self._stored.add(digest)
+
+        if not LOGS.write_file(path, data, on_done=done):
+            done(False)
+        return path
+
+    def prepare(self, data: bytes) -> PreparedImage:
+        """Hash, store and downscale an upload (CPU-bound: run it off the event loop).
+
+        Raises UnsupportedImage for anything but PNG, JPEG, GIF and WebP.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self.uploads += 1
+            self.bytes_in += len(data)
+            prepared = self._prepared.get(digest)
+            if prepared is not None:
+                self._prepared.move_to_end(digest)
+                self.duplicates += 1
+                self.bytes_out += len(prepared.data)
+                return prepared
+
+        mime = sniff_mime(data)
+        if mime is None:
+            raise UnsupportedImage("Unsupported image type; send PNG, JPEG, GIF or WebP")
+        path = self.store(digest, mime, data)
+        original_size = image_size(data, mime)
+        upload, upload_mime, size = data, mime, original_size
+        smaller = downscale(data, mime, original_size)
+        if smaller is not None:
+            upload, upload_mime, size = smaller
+        prepared = PreparedImage(digest, upload_mime, upload, size, choose_detail(size), path,
+                                 len(data), original_size)
+
+        with self._lock:
+            self.bytes_out += len(upload)
+            self._prepared[digest] = prepared
+            while len(self._prepared) > self.memory_entries:
+                self._prepared.popitem(last=False)
+        return prepared
+
+    @staticmethod
+    def answer_key(model: str, image: PreparedImage, question: str) -> str:
+        return _hash([model, "image", image.hash, image.detail, normalize_text(question, query=True)])
+
+    def stats(self) -> dict:
+        return {
+            "uploads": self.uploads,
+            "duplicates": self.duplicates,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "prepared_entries": len(self._prepared),
+        }
+
+
+IMAGES = ImagePipeline()
@@ -0,0 +1,232 @@
+"""Persistent cache of parsed planner replies.
+
+A planner turn is a pure function of the model, the system prompt (which
+embeds the tool guide) and the rest of the message list, whose tool outputs
+are themselves deterministic for a given dataset version. Replies are
+stored under a hash of those three, with the user's wording normalized
+(case, whitespace, trailing punctuation), so repeated dashboard questions
+skip the Azure call. Entries live in SQLite so they survive restarts, expire
+after LLM_CACHE_TTL and are evicted least-recently-used beyond
+LLM_CACHE_MAX_ENTRIES; the hottest ones are also kept in process.
+
+Nothing on the event loop touches SQLite: `aget` answers from the
+in-process entries and reads misses in a worker thread, and `put` (like
+access-time updates) is written through by a background writer thread.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "logs/llm_cache.db")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key         TEXT PRIMARY KEY,
+    value       TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at);
+"""
+
+
+def _hash(payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def normalize_text(text: str, query: bool = False) -> str:
+    text = re.sub(r"\s+", " ", text or "").strip()
+    if query:
+        text = text.lower().rstrip("?!. ")
+    return text
+
+
+def normalize_messages(messages) -> list:
+    return [
+        [m["role"], normalize_text(m.get("content"), query=m["role"] == "user")]
+        for m in messages
+    ]
+
+
+class LLMResponseCache:
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+                 enabled: bool = LLM_CACHE_ENABLED):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.enabled = enabled and ttl > 0 and max_entries > 0
+        self._conn = None
+        self._lock = threading.Lock()      # in-process entries and counters
+        self._db_lock = threading.Lock()   # the SQLite connection
+        self._hot = OrderedDict()  # key -> (created_at, value)
+        self._writes = queue.SimpleQueue()
+        self._writer = None
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self):
+        # Opened on first use so importing the router never touches the disk
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    @staticmethod
+    def key(model: str, messages) -> str:
+        """Model + hash of the system prompt (tool guide) + normalized messages."""
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        prompt_hash = hashlib.sha256(system.encode()).hexdigest()
+        rest = messages[1:] if system else messages
+        return _hash([model, prompt_hash, normalize_messages(rest)])
+
+    def _remember(self, key: str, created_at: float, value):
+        self._hot[key] = (created_at, value)
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.memory_entries:
+            self._hot.popitem(last=False)
+
+    # -- reads ---------------------------------------------------------------
+
+    def _from_memory(self, key: str, now: float):
+        with self._lock:
+            entry = self._hot.get(key)
+            if entry is None:
+                return None
+            if now - entry[0] > self.ttl:
+                self._hot.pop(key, None)
+                return None
+            self._hot.move_to_end(key)
+            self.hits += 1
+        self._enqueue(("touch", key, now))
+        return entry[1]
+
+    def _from_db(self, key: str, now: float):
+        with self._db_lock:
+            row = self._db().execute("SELECT created_at, value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[0] > self.ttl:
+            if row is not None:
+                self._enqueue(("delete", key))
+            with self._lock:
+                self.misses += 1
+            return None
+        value = json.loads(row[1])
+        with self._lock:
+            self._remember(key, row[0], value)
+            self.hits += 1
+        self._enqueue(("touch", key, now))
+        return value
+
+    def get(self, key: str):
+        """Blocking lookup (misses read SQLite); use `aget` on the event loop."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        value = self._from_memory(key, now)
+        return value if value is not None else self._from_db(key, now)
+
+    async def aget(self, key: str):
+        """Lookup for coroutines: in-process hits inline, SQLite in a worker thread."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        value = self._from_memory(key, now)
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self._from_db, key, now)
+
+    # -- writes --------------------------------------------------------------
+
+    def put(self, key: str, value):
+        """Store a reply: visible in process at once, written to SQLite in the background."""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        self._enqueue(("put", key, json.dumps(value), now))
+
+    def _enqueue(self, op):
+        self._writes.put(op)
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="llm-cache-writer", daemon=True)
+                    self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            op = self._writes.get()
+            if op is None:
+                return
+            try:
+                with self._db_lock:
+                    self._apply(op)
+            except Exception as e:
+                # Losing a cache write only costs a future model call
+                print(f"LLM cache write failed: {e!r}", file=sys.stderr)
+
+    def _apply(self, op):
+        db = self._db()
+        if op[0] == "touch":
+            db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (op[2], op[1]))
+        elif op[0] == "delete":
+            db.execute("DELETE FROM llm_cache WHERE key = ?", (op[1],))
+        elif op[0] == "clear":
+            db.execute("DELETE FROM llm_cache")
+        else:
+            _, key, value, now = op
+            db.execute(
+                "INSERT INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+                "created_at = excluded.created_at, accessed_at = excluded.accessed_at",
+                (key, value, now, now),
+            )
+            db.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            db.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._hot.clear()
+        self._enqueue(("clear",))
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hot_entries": len(self._hot),
+        }
+
+    def close(self, timeout: float = 5.0):
+        """Finish the queued writes, then close the database."""
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            self._writes.put(None)
+            writer.join(timeout)
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+LLM_CACHE = LLMResponseCache()
@@ -0,0 +1,302 @@
+"""One rate-limited Azure OpenAI client shared by the router and the tool-chaining client.
+
+Every chat completion goes through GATEWAY. Calls wait in a priority queue
+until a concurrency slot is free and the requests-per-minute and
+tokens-per-minute budgets (LLM_RPM, LLM_TPM; 0 disables either) allow them;
+turns of a request that is already under way use PRIORITY_CONTINUE so they
+finish ahead of new requests. Throttling (429), server errors and dropped
+connections are retried with jittered exponential backoff, honouring
+Retry-After, and `chat_json` re-prompts when the model's reply is not valid
+JSON. Connections come from one pooled HTTP client.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+
+from router.context import estimate_tokens
+from telemetry.metrics import LLM_QUEUE_SECONDS, LLM_SECONDS, LLM_TOKENS, METRICS, current_span
+
+load_dotenv()
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+LLM_JSON_RETRIES = int(os.getenv("LLM_JSON_RETRIES", "1"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+# Completion tokens reserved per call before the real usage is known
+LLM_COMPLETION_ESTIMATE = int(os.getenv("LLM_COMPLETION_ESTIMATE", "400"))
+# Rough prompt cost of one image at detail=high
+IMAGE_TOKENS = 1000
+
+PRIORITY_CONTINUE = 0  # later turns of a request already in progress
+PRIORITY_NEW = 1       # first turn of a new request
+PRIORITY_LOW = 2       # background / bulk work
+
+RETRYABLE = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+JSON_REPROMPT = {
+    "role": "system",
+    "content": "Your last reply was not valid JSON. Reply again with only the JSON object, no markdown or other text.",
+}
+
+
+def parse_json(content: str):
+    """json.loads that tolerates a ```json fenced reply."""
+    text = (content or "").strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return json.loads(text)
+
+
+def estimate_prompt_tokens(messages) -> int:
+    total = 0
+    for m in messages:
+        content = m.get("content") if isinstance(m, dict) else getattr(m, "content", None)
+        if isinstance(content, list):
+            for part in content:
+                total += IMAGE_TOKENS if part.get("type") == "image_url" else estimate_tokens(part.get("text", ""))
+        elif content:
+            total += estimate_tokens(content)
+        total += 4
+    return total
+
+
+class _Bucket:
+    """Per-minute budget refilled continuously; limit 0 means unlimited."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self._at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._at) * self.capacity / 60)
+        self._at = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it is now)."""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        # A single call larger than the whole budget only waits for a full bucket
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount: float):
+        if self.capacity:
+            self._refill()
+            self.level -= amount
+
+
+class LLMGateway:
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, rpm: int = LLM_RPM, tpm: int = LLM_TPM):
+        self.model = os.getenv("AZURE_OPENAI_MODEL") or os.getenv("AZURE_OPENAI_DEPLOYMENT")
+        self.client = AsyncAzureOpenAI(
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            # Retries are handled here, against the shared budget
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                    max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+            ),
+        )
+        self.max_concurrency = max_concurrency
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm)
+        self._queue = []  # heap of (priority, seq, tokens, future)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._paused_until = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.json_reprompts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    # -- admission -----------------------------------------------------------
+
+    def _pump(self):
+        """Admit queued calls, highest priority first, while budgets allow."""
+        loop = asyncio.get_running_loop()
+        while self._queue and self.in_flight < self.max_concurrency:
+            _, _, tokens, fut = self._queue[0]
+            if fut.done():  # caller was cancelled while waiting
+                heapq.heappop(self._queue)
+                continue
+            delay = max(self._paused_until - time.monotonic(),
+                        self._requests.wait_for(1), self._tokens.wait_for(tokens))
+            if delay > 0:
+                if self._wakeup is None:
+                    self._wakeup = loop.call_later(delay, self._wake)
+                return
+            heapq.heappop(self._queue)
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            self.in_flight += 1
+            fut.set_result(None)
+
+    def _wake(self):
+        self._wakeup = None
+        self._pump()
+
+    async def _acquire(self, priority: int, tokens: int):
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), tokens, fut))
+        t0 = time.monotonic()
+        self._pump()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+        waited = time.monotonic() - t0
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        LLM_QUEUE_SECONDS.observe(waited, priority=priority)
+        return waited
+
+    def _release(self):
+        self.in_flight -= 1
+        self._pump()
+
+    def _settle(self, reserved: int, usage):
+        """Correct the token budget once the real usage is known."""
+        if usage is not None and getattr(usage, "total_tokens", None):
+            self._tokens.take(usage.total_tokens - reserved)
+            LLM_TOKENS.inc(usage.prompt_tokens or 0, type="prompt")
+            LLM_TOKENS.inc(usage.completion_tokens or 0, type="completion")
+
+    # -- retries -------------------------------------------------------------
+
+    def _backoff(self, attempt: int, error) -> float:
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+        if isinstance(error, openai.RateLimitError):
+            self.throttled += 1
+        if retry_after is not None:
+            # Everyone is over the limit, not just this call
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            return retry_after
+        return random.uniform(0.5, 1.0) * min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt)
+
+    async def _create(self, messages, priority: int, **kwargs):
+        reserved = estimate_prompt_tokens(messages) + LLM_COMPLETION_ESTIMATE
+        kind = "stream" if kwargs.get("stream") else "chat"
+        parent = current_span()
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            waited = await self._acquire(priority, reserved)
+            # Streams are timed to the first response bytes
+            span = parent.child("llm.call", kind=kind, attempt=attempt) if parent is not None else None
+            t0 = time.perf_counter()
+            outcome = "error"
+            try:
+                self.calls += 1
+                try:
+                    resp = await self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+                except BaseException:
+                    # Failed (or cancelled) in either mode: nothing holds the slot
+                    self._release()
+                    raise
+                outcome = "ok"
+            except RETRYABLE as e:
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                outcome = "retry"
+                delay = self._backoff(attempt, e)
+            else:
+                if kwargs.get("stream"):
+                    # The slot is held until the stream is consumed (see `stream`)
+                    return resp
+                self._release()
+                self._settle(reserved, resp.usage)
+                return resp
+            finally:
+                elapsed = time.perf_counter() - t0
+                LLM_SECONDS.observe(elapsed, kind=kind, outcome=outcome)
+                if span is not None:
+                    span.end(outcome=outcome, queue_wait=round(waited, 4))
+            self.retries += 1
+            # Retries jump the queue: they are already part of a request in progress
+            priority = PRIORITY_CONTINUE
+            await asyncio.sleep(delay)
+
+    # -- public API ----------------------------------------------------------
+
+    async def chat(self, messages, priority: int = PRIORITY_NEW, **kwargs):
+        """A chat completion (non-streaming)."""
+        return await self._create(messages, priority, **kwargs)
+
+    async def stream(self, messages, priority: int = PRIORITY_NEW, **kwargs):
+        """Yield chat completion chunks. Only the initial request is retried."""
+        stream = await self._create(messages, priority, stream=True, **kwargs)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            self._release()
+
+    async def chat_json(self, messages, priority: int = PRIORITY_NEW, **kwargs):
+        """The reply parsed as JSON, re-prompting up to LLM_JSON_RETRIES times."""
+        resp = await self.chat(messages, priority, **kwargs)
+        return await self.ensure_json(messages, resp.choices[0].message.content, priority, **kwargs)
+
+    async def ensure_json(self, messages, content: str, priority: int = PRIORITY_CONTINUE, **kwargs):
+        """Parse `content`, or ask the model to restate it as valid JSON."""
+        for attempt in range(LLM_JSON_RETRIES + 1):
+            try:
+                return parse_json(content)
+            except ValueError:
+                if attempt == LLM_JSON_RETRIES:
+                    raise
+            self.json_reprompts += 1
+            messages = [*messages, {"role": "assistant", "content": content or ""}, JSON_REPROMPT]
+            resp = await self.chat(messages, PRIORITY_CONTINUE, **kwargs)
+            content = resp.choices[0].message.content
+
+    def stats(self) -> dict:
+        admitted = self.calls or 1
+        return {
+            "queue_depth": sum(1 for *_, fut in self._queue if not fut.done()),
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "json_reprompts": self.json_reprompts,
+            "wait_avg": round(self.wait_total / admitted, 4),
+            "wait_max": round(self.wait_max, 4),
+        }
+
+    async def close(self):
+        await self.client.close()
+
+
+GATEWAY = LLMGateway()
+
+METRICS.gauge("llm_queue_depth", "Chat completions waiting for admission", lambda: GATEWAY.stats()["queue_depth"])
+METRICS.gauge("llm_in_flight", "Chat completions in flight", lambda: GATEWAY.in_flight)
@@ -1,22 +1,28 @@
 import asyncio
 import json
 import os
-import base64
-from contextlib import AsyncExitStack
+import time
 from typing import Any, Dict, List, Optional
 from datetime import datetime
 
-import nest_asyncio
 from dotenv import load_dotenv
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-from openai import AsyncAzureOpenAI
 from openai.types.chat import ChatCompletionMessageParam
 from memory.session_memory import MemoryStore
+from client.image_pipeline import IMAGES, PreparedImage
+from client.llm_cache import LLM_CACHE
+from client.llm_gateway import GATEWAY, PRIORITY_CONTINUE, PRIORITY_NEW
+from router.agent_pool import AgentPool, card_urls
+from router.fast_path import FAST_PATH_ENABLED, IntentMatcher, fetch_vocabulary, render_answer
+from router.registry import ToolCatalog
+from client.tool_cache import DATASET_VERSIONS, TOOL_CACHE, result_text
+from telemetry.log_writer import LOGS
+from telemetry.metrics import REQUEST_SECONDS, TOOL_CACHE_LOOKUPS, Span
 
-nest_asyncio.apply()
 load_dotenv()
 
+# Max concurrent tool calls in flight on a single MCP session
+SESSION_CONCURRENCY = int(os.getenv("MCP_SESSION_CONCURRENCY", "4"))
+
 
 def log_tool_usage(tool_name: str, arguments: Dict, response: str, user_query: str, reasoning: str = ""):
     log_entry = {
@@ -28,135 +34,325 @@ def log_tool_usage(tool_name: str, arguments: Dict, response: str, user_query: s
         "reasoning": reasoning
     }
 
-    os.makedirs("logs", exist_ok=True)
-    with open("logs/tool_usage_logs.jsonl", "a") as f:
-        f.write(json.dumps(log_entry) + "\n")
+    LOGS.write("logs/tool_usage_logs.jsonl", log_entry)
+
+
+def server_card(server_name: str, spec) -> dict:
+    """An agent card for a server map entry.
+
+    `spec` is a script path, [script, *args], one http(s) URL or a list of
+    replica URLs (ending in /sse for SSE, streamable HTTP otherwise), or a
+    card dict as-is.
+    """
+    if isinstance(spec, dict):
+        return {"name": server_name, **spec}
+    specs = [spec] if isinstance(spec, str) else list(spec)
+    if specs[0].startswith(("http://", "https://")):
+        endpoint = "sse" if specs[0].rstrip("/").endswith("/sse") else "streamable-http"
+        return {"name": server_name, "endpoint": endpoint, "urls": specs}
+    return {"name": server_name, "endpoint": "python", "args": specs}
 
 
 class MCPOpenAIClient:
     def __init__(self):
-        self.exit_stack = AsyncExitStack()
-        self.sessions = {}  # key: server name, value: (session, tool names)
+        # Sessions (and replica balancing, health checks, eviction) come from
+        # a pool of the client's own; the map passed in already picks the host
+        self.pool = AgentPool(replicas=1, host_mode=False)
+        self.cards = {}  # key: server name, value: card describing how to reach it
+        self.sessions = {}  # key: server name, value: tool names
+        self.catalog = ToolCatalog()
+        self.matcher = IntentMatcher()
+        self._session_limits = {}  # key: server name, value: Semaphore
+        self._vocab_pending = set()  # servers whose dataset was still loading
         self.memory = MemoryStore()
 
-        # Azure OpenAI configuration
-        self.api_key = os.getenv("AZURE_OPENAI_API_KEY")
-        self.api_version = os.getenv("AZURE_OPENAI_API_VERSION")
-        self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        self.deployment = os.getenv("AZURE_OPENAI_MODEL") or os.getenv("AZURE_OPENAI_DEPLOYMENT")
-
-        self.openai_client = AsyncAzureOpenAI(
-            api_key=self.api_key,
-            api_version=self.api_version,
-            azure_endpoint=self.endpoint,
-        )
-
-    async def connect_to_servers(self, server_map: Dict[str, str]):
-        for server_name, path in server_map.items():
-            params = StdioServerParameters(command="python", args=[path])
-            stdio_transport = await self.exit_stack.enter_async_context(stdio_client(params))
-            read, write = stdio_transport
-            session = await self.exit_stack.enter_async_context(ClientSession(read, write))
-            await session.initialize()
-            tools_result = await session.list_tools()
-            tool_names = [tool.name for tool in tools_result.tools]
-            self.sessions[server_name] = (session, tool_names)
+        # Azure OpenAI calls go through the process-wide rate-limited gateway
+        self.llm = GATEWAY
+
+    async def connect_to_servers(self, server_map: Dict[str, Any]):
+        """Connect to each server; see server_card for the accepted values."""
+        for server_name, spec in server_map.items():
+            self.cards[server_name] = server_card(server_name, spec)
+        await self.refresh_tools()
+
+    async def refresh_tools(self):
+        """Re-list tools on every server; the catalog only re-renders on change."""
+        for server_name, card in self.cards.items():
+            tools, _ = await self.pool.list_tools(card)
+            self.sessions[server_name] = [tool.name for tool in tools]
+            self.catalog.update(server_name, tools)
+            self._vocab_pending.add(server_name)
+        await self._load_vocabulary()
+
+    async def _load_vocabulary(self):
+        """Fetch the fast path's vocabulary from servers that have not served it yet."""
+        for server_name in list(self._vocab_pending):
+            agent = self.pool.current(self.cards[server_name])
+            vocabulary = await fetch_vocabulary(agent.session) if agent else None
+            if vocabulary is not None:
+                self.matcher.vocabulary.update(vocabulary)
+                self._vocab_pending.discard(server_name)
 
     async def get_mcp_tools(self) -> List[Dict[str, Any]]:
-        all_tools = []
-        for session, _ in self.sessions.values():
-            tools_result = await session.list_tools()
-            for tool in tools_result.tools:
-                all_tools.append({
-                    "type": "function",
-                    "function": {
-                        "name": tool.name,
-                        "description": tool.description,
-                        "parameters": tool.inputSchema,
-                    },
-                })
-        return all_tools
-
-    async def process_query(self, query: str, user_id: str = "default") -> dict:
+        # Schemas were listed at connect time; serve the cached payload
+        return self.catalog.openai_tools()
+
+    def _session_limit(self, server_name: str) -> asyncio.Semaphore:
+        if server_name not in self._session_limits:
+            replicas = max(1, len(card_urls(self.cards[server_name])))
+            self._session_limits[server_name] = asyncio.Semaphore(SESSION_CONCURRENCY * replicas)
+        return self._session_limits[server_name]
+
+    async def _run_tool_call(self, tool_name: str, arguments: str, memory_args: dict, parent: Span) -> dict:
+        """Run one tool call under its own span; the entry carries its span_id."""
+        span = parent.child("client.tool", tool=tool_name)
+        try:
+            with span.activate():
+                entry = await self._call_tool(tool_name, arguments, memory_args)
+        except Exception as e:
+            span.end(error=repr(e))
+            raise
+        span.end(cache_hit=entry.get("cache_hit", False), is_error=entry.get("is_error", False))
+        entry["span_id"] = span.span_id
+        return entry
+
+    async def _call_tool(self, tool_name: str, arguments: str, memory_args: dict) -> dict:
+        tool_args = json.loads(arguments)
+
+        # Use memory if needed
+        for key, value in memory_args.items():
+            if key not in tool_args or not tool_args[key]:
+                tool_args[key] = value
+
+        owner = self.catalog.owner(tool_name)
+        card = self.cards.get(owner) if owner else None
+
+        if card is None:
+            raise ValueError(f"Tool '{tool_name}' not found in any connected MCP server")
+
+        agent, _ = await self.pool.acquire(card)
+        version = await DATASET_VERSIONS.get(agent.session)
+        cached = TOOL_CACHE.get(tool_name, tool_args, version)
+        TOOL_CACHE_LOOKUPS.inc(tool=tool_name, result="hit" if cached is not None else "miss")
+        if cached is not None:
+            return {
+                "tool_name": tool_name,
+                "tool_args": tool_args,
+                "tool_response": cached,
+                "duration": 0.0,
+                "cache_hit": True,
+            }
+
+        # Bound in-flight requests per server so one server is not flooded;
+        # the pool sends each call to the replica with the fewest in flight
+        async with self._session_limit(owner):
+            t0 = time.time()
+            result, _, served_by = await self.pool.call_tool(card, tool_name, tool_args)
+            t1 = time.time()
+        tool_output = result_text(result, "⚠️ Tool returned no output")
+        # Only cached if the replica that ran the call still reports the
+        # version looked up above (see router._call_or_cached)
+        if result.content and not result.isError and await DATASET_VERSIONS.get(served_by.session) == version:
+            TOOL_CACHE.put(tool_name, tool_args, version, tool_output)
+        entry = {
+            "tool_name": tool_name,
+            "tool_args": tool_args,
+            "tool_response": tool_output,
+            "duration": round(t1 - t0, 3),
+        }
+        if result.isError:
+            entry["is_error"] = True
+        return entry
+
+    async def _chat_turn(self, messages, tools, stream_tokens: bool, priority: int = PRIORITY_NEW, span: Span = None):
+        """One chat completion turn.
+
+        Yields ("token", text) for streamed content (only with stream_tokens),
+        then ("message", assistant_message). Streamed tool call deltas are
+        reassembled into a plain assistant message dict.
+        """
+        if not stream_tokens:
+            if span is not None:
+                with span.activate():
+                    response = await self.llm.chat(messages, priority, tools=tools, tool_choice="auto")
+            else:
+                response = await self.llm.chat(messages, priority, tools=tools, tool_choice="auto")
+            yield "message", response.choices[0].message
+            return
+
+        content = ""
+        calls = {}
+        async for chunk in self.llm.stream(messages, priority, tools=tools, tool_choice="auto"):
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content += delta.content
+                yield "token", delta.content
+            for tc in delta.tool_calls or []:
+                call = calls.setdefault(tc.index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+                if tc.id:
+                    call["id"] = tc.id
+                if tc.function and tc.function.name:
+                    call["function"]["name"] += tc.function.name
+                if tc.function and tc.function.arguments:
+                    call["function"]["arguments"] += tc.function.arguments
+
+        message = {"role": "assistant", "content": content or None}
+        if calls:
+            message["tool_calls"] = [calls[i] for i in sorted(calls)]
+        yield "message", message
+
+    @staticmethod
+    def _tool_calls(message) -> list:
+        """(id, name, arguments) for each tool call on an SDK or dict message."""
+        if isinstance(message, dict):
+            return [(c["id"], c["function"]["name"], c["function"]["arguments"]) for c in message.get("tool_calls") or []]
+        return [(c.id, c.function.name, c.function.arguments) for c in message.tool_calls or []]
+
+    async def iter_query(self, query: str, user_id: str = "default", stream_tokens: bool = False):
+        """Run the tool-chaining loop, yielding each event as it happens.
+
+        Events are {"event": type, "data": payload}: `tool_start` before each
+        call, `tool` with the trace entry once it returns, `token` for pieces
+        of the model's reply (with stream_tokens) and `final` with the same
+        {"response", "trace", "trace_id", "timings"} dict process_query
+        returns. Tool entries carry the `span_id` of their call.
+        """
+        root = Span("client.request", user_id=user_id, stream=stream_tokens)
+        path = "error"
+        try:
+            async for event in self._iter_query(query, user_id, stream_tokens, root):
+                if event["event"] == "final":
+                    path = "fast_path" if event["data"].get("fast_path") else "tools"
+                    event["data"]["trace_id"] = root.trace_id
+                    event["data"]["timings"]["total"] = round(time.perf_counter() - root._t0, 3)
+                yield event
+        finally:
+            root.end(path=path)
+            REQUEST_SECONDS.observe(root.duration, entry="client", path=path)
+
+    async def _iter_query(self, query: str, user_id: str, stream_tokens: bool, root: Span):
         tools = await self.get_mcp_tools()
         trace = []
+        llm_seconds = 0.0
 
         memory_context = self.memory.get(user_id)
         system_prompt = f"You are a helpful supply chain assistant.\n\nUser preferences:\n{json.dumps(memory_context, indent=2)}"
 
         messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": query}]
 
-        while True:
-            response = await self.openai_client.chat.completions.create(
-                messages=messages,
-                model=self.deployment,
-                tools=tools,
-                tool_choice="auto",
-            )
+        # Questions that map onto a single tool are answered without the
+        # model; a failed call falls through to the normal loop
+        answered = False
+        self.matcher.index(self.catalog)
+        if FAST_PATH_ENABLED and self._vocab_pending:
+            await self._load_vocabulary()
+        match = self.matcher.match(query) if FAST_PATH_ENABLED else None
+        if match:
+            arguments = json.dumps(match["args"])
+            yield {"event": "tool_start", "data": {"tool_name": match["tool"], "arguments": arguments}}
+            entry = await self._run_tool_call(match["tool"], arguments, {}, root)
+            entry["fast_path"] = True
+            entry["confidence"] = match["confidence"]
+            yield {"event": "tool", "data": entry}
+            trace.append(entry)
+            if not entry.get("is_error"):
+                answered = True
+                final_text = render_answer(match["tool"], entry["tool_args"], entry["tool_response"])
+                if stream_tokens:
+                    yield {"event": "token", "data": {"text": final_text}}
+                self.memory.update(user_id, "last_tool_args", entry["tool_args"])
+                self.memory.append_to_list(user_id, "recent_queries", query)
 
-            assistant_message = response.choices[0].message
+        priority = PRIORITY_NEW
+        while not answered:
+            span = root.child("client.llm_turn", messages=len(messages))
+            async for kind, payload in self._chat_turn(messages, tools, stream_tokens, priority, span):
+                if kind == "token":
+                    yield {"event": "token", "data": {"text": payload}}
+                else:
+                    assistant_message = payload
+            llm_seconds += span.end().duration
             messages.append(assistant_message)
+            priority = PRIORITY_CONTINUE
 
-            if not assistant_message.tool_calls:
-                final_text = assistant_message.content
+            calls = self._tool_calls(assistant_message)
+            if not calls:
+                final_text = assistant_message["content"] if isinstance(assistant_message, dict) else assistant_message.content
                 break
 
-            for tool_call in assistant_message.tool_calls:
-                tool_name = tool_call.function.name
-                tool_args = json.loads(tool_call.function.arguments)
-
-                # Use memory if needed
-                memory_data = self.memory.get(user_id)
-                memory_args = memory_data.get("last_tool_args", {})
-                for key, value in memory_args.items():
-                    if key not in tool_args or not tool_args[key]:
-                        tool_args[key] = value
-
-                session = None
-                for _, (sess, tool_names) in self.sessions.items():
-                    if tool_name in tool_names:
-                        session = sess
-                        break
-
-                if session is None:
-                    raise ValueError(f"Tool '{tool_name}' not found in any connected MCP server")
-
-                result = await session.call_tool(tool_name, arguments=tool_args)
-                tool_output = result.content[0].text if result.content else "⚠️ Tool returned no output"
-
-                trace.append({
-                    "tool_name": tool_name,
-                    "tool_args": tool_args,
-                    "tool_response": tool_output,
-                })
+            # Memory defaults are read once per turn so the calls are independent
+            memory_args = self.memory.get(user_id).get("last_tool_args", {})
+            for _, tool_name, arguments in calls:
+                yield {"event": "tool_start", "data": {"tool_name": tool_name, "arguments": arguments}}
+            tasks = [
+                asyncio.ensure_future(self._run_tool_call(tool_name, arguments, memory_args, root))
+                for _, tool_name, arguments in calls
+            ]
+            try:
+                for done in asyncio.as_completed(tasks):
+                    yield {"event": "tool", "data": await done}
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+            # Record results in the order the model issued the calls
+            for (call_id, _, _), task in zip(calls, tasks):
+                entry = task.result()
+                trace.append(entry)
 
                 messages.append({
                     "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": tool_output,
+                    "tool_call_id": call_id,
+                    "content": entry["tool_response"],
                 })
 
-                self.memory.update(user_id, "last_tool_args", tool_args)
+                self.memory.update(user_id, "last_tool_args", entry["tool_args"])
                 self.memory.append_to_list(user_id, "recent_queries", query)
 
         # Log final interaction
         log = {
             "timestamp": datetime.now().isoformat(),
+            "trace_id": root.trace_id,
             "query": query,
             "reasoning_trace": trace,
             "final_response": final_text,
+            "fast_path": answered,
         }
-        os.makedirs("logs", exist_ok=True)
-        with open("logs/agent_trace_logs.jsonl", "a") as f:
-            f.write(json.dumps(log) + "\n")
+        LOGS.write("logs/agent_trace_logs.jsonl", log)
 
-        return {
+        final = {
             "response": final_text,
-            "trace": trace
+            "trace": trace,
+            "timings": {
+                "llm": round(llm_seconds, 3),
+                "tools": round(sum(e.get("duration", 0.0) for e in trace), 3),
+            },
         }
+        if answered:
+            final["fast_path"] = True
+        yield {"event": "final", "data": final}
+
+    async def process_query(self, query: str, user_id: str = "default") -> dict:
+        async for event in self.iter_query(query, user_id):
+            if event["event"] == "final":
+                return event["data"]
+
+    async def analyze_image(self, image, question: str) -> dict:
+        """Answer a question about an image (raw upload bytes or an already
+        prepared PreparedImage).
 
-    async def analyze_image(self, image_bytes: bytes, question: str) -> str:
-        base64_image = base64.b64encode(image_bytes).decode("utf-8")
+        Returns {"response", "cache_hit", **image info}; a repeated
+        (image, question) pair is answered from the LLM response cache.
+        """
+        if not isinstance(image, PreparedImage):
+            image = await asyncio.to_thread(IMAGES.prepare, image)
+
+        key = IMAGES.answer_key(self.llm.model, image, question)
+        cached = await LLM_CACHE.aget(key)
+        if cached is not None:
+            return {"response": cached["response"], "cache_hit": True, **image.info()}
 
         messages: List[ChatCompletionMessageParam] = [
             {"role": "system", "content": "You are a supply chain expert."},
@@ -165,22 +361,18 @@ class MCPOpenAIClient:
                 "content": [
                     {
                         "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{base64_image}",
-                            "detail": "high",
-                        },
+                        "image_url": {"url": image.data_url(), "detail": image.detail},
                     },
                     {"type": "text", "text": question},
                 ],
             },
         ]
 
-        response = await self.openai_client.chat.completions.create(
-            model=self.deployment,
-            messages=messages,
-        )
-
-        return response.choices[0].message.content
+        response = await self.llm.chat(messages)
+        answer = response.choices[0].message.content
+        if answer:
+            LLM_CACHE.put(key, {"response": answer})
+        return {"response": answer, "cache_hit": False, **image.info()}
 
     async def cleanup(self):
-        await self.exit_stack.aclose()
+        await self.pool.shutdown()
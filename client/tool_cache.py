@@ -0,0 +1,141 @@
+"""Client-side cache of MCP tool results.
+
+Entries are keyed by tool name, the canonical JSON of the arguments and the
+dataset version the agent reports on its dataset://info resource, so a
+reload or append on the agent side naturally invalidates everything computed
+before. The version is read on every lookup unless TOOL_CACHE_VERSION_REFRESH
+is raised, which trades one resource read per call for results up to that
+many seconds stale after an append.
+Entries also expire after a TTL, and the cache evicts least recently used
+results once it holds more than its byte budget.
+"""
+import json
+import os
+import time
+import weakref
+from collections import OrderedDict
+
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "300"))
+TOOL_CACHE_MAX_BYTES = int(os.getenv("TOOL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Tools whose output is not a pure function of (args, dataset), e.g. "now"-relative
+UNCACHEABLE_TOOLS = {
+    t.strip() for t in os.getenv("TOOL_CACHE_SKIP", "products_at_risk_of_stockout").split(",") if t.strip()
+}
+# Seconds a session's dataset version is reused before it is read again; also
+# how long results of the previous version can be served after an append
+VERSION_REFRESH = float(os.getenv("TOOL_CACHE_VERSION_REFRESH", "0"))
+
+
+def canonical_args(args: dict) -> str:
+    return json.dumps(args or {}, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def result_text(result, empty: str = "") -> str:
+    """The text of a CallToolResult.
+
+    FastMCP returns a list as one content item per element, so several items
+    are joined back into a JSON array instead of keeping only the first.
+    """
+    texts = [c.text for c in result.content if getattr(c, "text", None) is not None]
+    if not texts:
+        return empty
+    if len(texts) == 1:
+        return texts[0]
+    items = []
+    for text in texts:
+        try:
+            items.append(json.loads(text))
+        except ValueError:
+            items.append(text)
+    return json.dumps(items, indent=2, default=str)
+
+
+class ToolResultCache:
+    def __init__(self, ttl: float = TOOL_CACHE_TTL, max_bytes: int = TOOL_CACHE_MAX_BYTES,
+                 uncacheable=UNCACHEABLE_TOOLS):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.uncacheable = set(uncacheable)
+        self._entries = OrderedDict()  # key -> (expires_at, output, size)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, tool_name: str) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0 and tool_name not in self.uncacheable
+
+    @staticmethod
+    def key(tool_name: str, args: dict, dataset_version) -> tuple:
+        return tool_name, canonical_args(args), dataset_version
+
+    def get(self, tool_name: str, args: dict, dataset_version):
+        if not self.cacheable(tool_name):
+            return None
+        key = self.key(tool_name, args, dataset_version)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, tool_name: str, args: dict, dataset_version, output: str):
+        if not self.cacheable(tool_name):
+            return
+        key = self.key(tool_name, args, dataset_version)
+        size = len(output.encode("utf-8")) + len(key[1]) + len(tool_name)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, output, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class DatasetVersions:
+    """Dataset version per MCP session, re-read once older than VERSION_REFRESH seconds."""
+
+    def __init__(self, refresh: float = VERSION_REFRESH):
+        self.refresh = refresh
+        self._versions = weakref.WeakKeyDictionary()  # session -> (read_at, version)
+
+    async def get(self, session):
+        cached = self._versions.get(session)
+        if cached is not None and time.monotonic() - cached[0] < self.refresh:
+            return cached[1]
+        try:
+            res = await session.read_resource("dataset://info")
+            info = json.loads(res.contents[0].text)
+        except Exception:
+            # Agents without the resource still get TTL-bounded caching
+            info = {}
+        version = info.get("version")
+        if info.get("ready", True):
+            # A dataset still loading has no version yet; ask again next time
+            self._versions[session] = (time.monotonic(), version)
+        return version
+
+
+TOOL_CACHE = ToolResultCache()
+DATASET_VERSIONS = DatasetVersions()
@@ -1,44 +1,215 @@
+import atexit
 import json
 import os
-from collections import defaultdict
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Hot users kept in process; entries are re-read after MEMORY_CACHE_TTL so
+# writes from other worker processes become visible
+MEMORY_CACHE_USERS = int(os.getenv("MEMORY_CACHE_USERS", "1024"))
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", "5"))
+# Writes are batched and flushed after this delay or once this many are pending
+MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", "0.5"))
+MEMORY_FLUSH_BATCH = int(os.getenv("MEMORY_FLUSH_BATCH", "64"))
+# Lists such as recent_queries keep only their newest entries
+MEMORY_LIST_CAP = int(os.getenv("MEMORY_LIST_CAP", "20"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory_values (
+    user_id TEXT NOT NULL,
+    key     TEXT NOT NULL,
+    value   TEXT NOT NULL,
+    PRIMARY KEY (user_id, key)
+);
+CREATE TABLE IF NOT EXISTS memory_lists (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    key     TEXT NOT NULL,
+    value   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memory_lists_user ON memory_lists (user_id, key, seq);
+"""
+
 
 class MemoryStore:
-    def __init__(self, path="logs/user_memory.json"):
+    """Per-user key/value memory backed by SQLite in WAL mode.
+
+    Scalar keys are upserted; list keys are stored one row per item, so
+    appends from several worker processes never overwrite each other. Writes
+    update the in-process cache immediately and reach the database in
+    batched transactions from a background flush; request code never waits
+    on the database write, and readers only hold the lock for the cache.
+    """
+
+    def __init__(self, path="logs/user_memory.db", legacy_path="logs/user_memory.json"):
         self.path = path
         # Ensure the directory exists before any reads/writes
         os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        if os.path.exists(path):
-            with open(path, "r") as f:
-                self.store = json.load(f)
-        else:
-            self.store = defaultdict(dict)
-            # Persist initial empty store so future reads succeed
-            self._save()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Flushes use their own connection: WAL readers never wait for them
+        self._writer = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+
+        self._lock = threading.RLock()
+        # Held for a whole flush so batches reach the database in order
+        self._write_lock = threading.Lock()
+        self._cache = OrderedDict()  # user_id -> (loaded_at, dict)
+        self._pending = []
+        self._timer = None
+        self._flush_started = False
+        # Users with queued writes are never refreshed from disk before flush
+        self._dirty = set()
+
+        if legacy_path and os.path.exists(legacy_path):
+            self._import_legacy(legacy_path)
+        atexit.register(self.close)
+
+    def _import_legacy(self, legacy_path):
+        """One-time migration from the old whole-file JSON store."""
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT (SELECT COUNT(*) FROM memory_values) + (SELECT COUNT(*) FROM memory_lists)"
+            ).fetchone()
+            if count:
+                return
+            with open(legacy_path) as f:
+                legacy = json.load(f)
+            for user_id, values in legacy.items():
+                for key, value in values.items():
+                    if isinstance(value, list):
+                        for item in value[-MEMORY_LIST_CAP:]:
+                            self._pending.append(("append", user_id, key, item))
+                    else:
+                        self._pending.append(("set", user_id, key, value))
+        self.flush()
+        os.replace(legacy_path, legacy_path + ".migrated")
+
+    def _load(self, user_id: str) -> dict:
+        data = {}
+        for key, value in self._conn.execute(
+            "SELECT key, value FROM memory_values WHERE user_id = ?", (user_id,)
+        ):
+            data[key] = json.loads(value)
+        for key, value in self._conn.execute(
+            "SELECT key, value FROM memory_lists WHERE user_id = ? ORDER BY seq", (user_id,)
+        ):
+            data.setdefault(key, []).append(json.loads(value))
+        return data
+
+    def _entry(self, user_id: str) -> dict:
+        cached = self._cache.get(user_id)
+        now = time.monotonic()
+        if cached is not None and (user_id in self._dirty or now - cached[0] < MEMORY_CACHE_TTL):
+            self._cache.move_to_end(user_id)
+            return cached[1]
+        data = self._load(user_id)
+        self._cache[user_id] = (now, data)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > MEMORY_CACHE_USERS:
+            oldest = next(iter(self._cache))
+            if oldest in self._dirty:
+                break
+            del self._cache[oldest]
+        return data
 
     def get(self, user_id: str) -> dict:
-        return self.store.get(user_id, {})
+        with self._lock:
+            return self._entry(user_id)
 
     def set(self, user_id: str, key: str, value):
-        if user_id not in self.store:
-            self.store[user_id] = {}
-        self.store[user_id][key] = value
-        self._save()
+        with self._lock:
+            self._entry(user_id)[key] = value
+            self._queue(("set", user_id, key, value))
 
     def update(self, user_id: str, key: str, value: str):
-        if user_id not in self.store:
-            self.store[user_id] = {}
-        self.store[user_id][key] = value
-        self._save()
+        self.set(user_id, key, value)
 
     def append_to_list(self, user_id: str, key: str, value: str):
-        if user_id not in self.store:
-            self.store[user_id] = {}
-        if key not in self.store[user_id]:
-            self.store[user_id][key] = []
-        self.store[user_id][key].append(value)
-        self._save()
-
-    def _save(self):
-        os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        with open(self.path, "w") as f:
-            json.dump(self.store, f, indent=2)
+        with self._lock:
+            data = self._entry(user_id)
+            items = data.setdefault(key, [])
+            items.append(value)
+            del items[:-MEMORY_LIST_CAP]
+            self._queue(("append", user_id, key, value))
+
+    def _queue(self, op):
+        self._pending.append(op)
+        self._dirty.add(op[1])
+        if self._flush_started:
+            return
+        if len(self._pending) >= MEMORY_FLUSH_BATCH:
+            # Flush now, but on a background thread rather than the caller's
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._flush_started = True
+            threading.Thread(target=self.flush, name="memory-flush", daemon=True).start()
+        elif self._timer is None:
+            self._schedule()
+
+    def _schedule(self):
+        self._timer = threading.Timer(MEMORY_FLUSH_INTERVAL, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """Write the queued operations in one transaction. The store lock is
+        only held to take the batch, never during the write; if the write
+        fails the batch is queued again (and retried by the timer)."""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self._flush_started = False
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                self._write(pending)
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = pending
+                    if self._timer is None:
+                        self._schedule()
+                raise
+            with self._lock:
+                # Users with writes queued meanwhile stay dirty until their next flush
+                self._dirty -= {op[1] for op in pending} - {op[1] for op in self._pending}
+
+    def _write(self, pending: list):
+        conn = self._writer
+        trimmed = set()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for op, user_id, key, value in pending:
+                if op == "set":
+                    conn.execute(
+                        "INSERT INTO memory_values (user_id, key, value) VALUES (?, ?, ?) "
+                        "ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value",
+                        (user_id, key, json.dumps(value)),
+                    )
+                else:
+                    conn.execute(
+                        "INSERT INTO memory_lists (user_id, key, value) VALUES (?, ?, ?)",
+                        (user_id, key, json.dumps(value)),
+                    )
+                    trimmed.add((user_id, key))
+            for user_id, key in trimmed:
+                conn.execute(
+                    "DELETE FROM memory_lists WHERE user_id = ? AND key = ? AND seq NOT IN "
+                    "(SELECT seq FROM memory_lists WHERE user_id = ? AND key = ? ORDER BY seq DESC LIMIT ?)",
+                    (user_id, key, user_id, key, MEMORY_LIST_CAP),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        self.flush()
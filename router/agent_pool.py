@@ -0,0 +1,445 @@
+import asyncio
+import os
+import time
+from contextlib import AsyncExitStack
+from datetime import timedelta
+
+import anyio
+import httpx
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.shared.exceptions import McpError
+
+from telemetry.metrics import METRICS, SPAWN_SECONDS, TOOL_SECONDS, current_span, remote_snapshot
+
+CALL_TIMEOUT = float(os.getenv("AGENT_CALL_TIMEOUT", "120"))
+PING_TIMEOUT = float(os.getenv("AGENT_PING_TIMEOUT", "5"))
+HEALTH_INTERVAL = float(os.getenv("AGENT_HEALTH_INTERVAL", "30"))
+SHUTDOWN_TIMEOUT = float(os.getenv("AGENT_SHUTDOWN_TIMEOUT", "5"))
+# Sessions kept per agent process command; extra replicas spawn only under load
+AGENT_REPLICAS = int(os.getenv("AGENT_REPLICAS", "1"))
+# Serve every python agent card from one consolidated process (server/agent_host.py)
+AGENT_HOST_MODE = os.getenv("AGENT_HOST_MODE", "0") == "1"
+AGENT_HOST_ARGS = ["server/agent_host.py"]
+# Seconds a replica URL that failed to connect or answer stays out of rotation
+AGENT_EVICT_SECONDS = float(os.getenv("AGENT_EVICT_SECONDS", "30"))
+# Card endpoints reached over the network; such cards list one URL per replica
+# under "urls" (servers started with `--transport sse|streamable-http`)
+NETWORK_TRANSPORTS = ("sse", "streamable-http")
+
+# Errors that mean the stdio pipe to the agent is gone, as opposed to a tool
+# raising inside a healthy server (which comes back as an McpError).
+TRANSPORT_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    ConnectionError,
+    BrokenPipeError,
+    httpx.TransportError,
+)
+
+
+def card_urls(card: dict) -> list:
+    """Replica URLs of a network card; [] for cards launched as subprocesses."""
+    if card["endpoint"] not in NETWORK_TRANSPORTS:
+        return []
+    return list(card.get("urls") or [card["url"]])
+
+
+def launch_params(card: dict, host_mode: bool = AGENT_HOST_MODE):
+    """(command, args) that start the process serving `card`."""
+    if host_mode and card["endpoint"] == "python":
+        return "python", AGENT_HOST_ARGS
+    return card["endpoint"], card["args"]
+
+
+def launch_key(card: dict, host_mode: bool = AGENT_HOST_MODE) -> tuple:
+    urls = card_urls(card)
+    if urls:
+        return (card["endpoint"], *urls)
+    command, args = launch_params(card, host_mode)
+    return (command, *args)
+
+
+class AgentSession:
+    """A single agent subprocess, or connection to a networked agent replica,
+    with an initialized MCP session.
+
+    The transport and ClientSession are entered and exited by one owner
+    task, because anyio cancel scopes must be closed by the task that opened
+    them. Callers only ever see `session` once it is initialized.
+    """
+
+    def __init__(self, card: dict, key: tuple, url: str = None, host_mode: bool = AGENT_HOST_MODE):
+        self.card = card
+        self.key = key
+        self.url = url
+        self.host_mode = host_mode
+        self.session = None
+        self.spawn_duration = 0.0
+        self.started_at = None
+        self.in_flight = 0
+        self.calls = 0
+        self._task = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._error = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name=f"agent:{self.card['name']}")
+        await self._ready.wait()
+        if self._error:
+            raise self._error
+
+    def _transport(self):
+        if self.url is None:
+            command, args = launch_params(self.card, self.host_mode)
+            return stdio_client(StdioServerParameters(command=command, args=args))
+        if self.card["endpoint"] == "sse":
+            return sse_client(self.url)
+        return streamablehttp_client(self.url)
+
+    @property
+    def label(self) -> str:
+        return self.url or " ".join(self.key)
+
+    async def _run(self):
+        t0 = time.time()
+        try:
+            async with AsyncExitStack() as stack:
+                # streamable HTTP also yields a session-id getter
+                read, write, *_ = await stack.enter_async_context(self._transport())
+                session = await stack.enter_async_context(ClientSession(read, write))
+                await session.initialize()
+                self.session = session
+                self.spawn_duration = round(time.time() - t0, 3)
+                self.started_at = time.time()
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def ping(self):
+        await asyncio.wait_for(self.session.send_ping(), PING_TIMEOUT)
+
+    async def close(self):
+        self._stop.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), SHUTDOWN_TIMEOUT)
+        except (asyncio.TimeoutError, Exception):
+            self._task.cancel()
+
+
+class AgentPool:
+    """Long-lived agent sessions keyed by the command or URLs that reach them.
+
+    Cards that launch the same command (e.g. every card in host mode) share
+    its sessions. Sessions are spawned on first use and reused across router
+    steps and requests; up to AGENT_REPLICAS are kept per command, the extra
+    ones spawned only when every existing replica is busy. Network cards get
+    one session per listed URL instead. Each call goes to the replica with
+    the fewest calls in flight. A background health check pings idle
+    sessions and respawns the ones that stopped answering; a URL that fails
+    is evicted for AGENT_EVICT_SECONDS before it is tried again. A call that
+    hits a dead pipe or connection retries once on a fresh or other replica.
+    """
+
+    def __init__(self, replicas: int = AGENT_REPLICAS, host_mode: bool = AGENT_HOST_MODE):
+        self.replicas = max(1, replicas)
+        self.host_mode = host_mode
+        self._sessions = {}  # launch key -> [AgentSession]
+        self._cards = {}     # launch key -> names of the cards it serves
+        self._locks = {}
+        self._health_task = None
+        self._background = set()
+        self._evicted = {}   # replica URL -> monotonic time it was evicted
+        self.restarts = {}
+
+    def key(self, card: dict) -> tuple:
+        return launch_key(card, self.host_mode)
+
+    async def acquire(self, card: dict):
+        """Return (AgentSession, spawn_seconds); spawn_seconds is 0.0 on reuse."""
+        key = self.key(card)
+        self._cards.setdefault(key, set()).add(card["name"])
+        replicas = [a for a in self._sessions.get(key, []) if a.alive]
+        if replicas:
+            best = min(replicas, key=lambda a: a.in_flight)
+            if card_urls(card):
+                if self._missing_urls(card, key):
+                    # Reconnect replicas whose eviction has expired
+                    self._grow(card, key)
+            elif best.in_flight and len(replicas) < self.replicas:
+                # Every replica is busy: add one for later calls without
+                # making this one wait for the spawn
+                self._grow(card, key)
+            return best, 0.0
+
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            sessions = await self._prune(key)
+            if sessions:
+                return min(sessions, key=lambda a: a.in_flight), 0.0
+            t0 = time.time()
+            if card_urls(card):
+                # Nothing is connected: try every URL, evicted or not
+                sessions = await self._connect(card, key, self._missing_urls(card, key, evicted=True))
+                return min(sessions, key=lambda a: a.in_flight), round(time.time() - t0, 3)
+            agent = await self._spawn(card, key)
+            return agent, agent.spawn_duration
+
+    def _missing_urls(self, card: dict, key: tuple, evicted: bool = False) -> list:
+        """Card URLs without a live session (skipping recently evicted ones)."""
+        connected = {a.url for a in self._sessions.get(key, []) if a.alive}
+        now = time.monotonic()
+        return [
+            url for url in card_urls(card)
+            if url not in connected
+            and (evicted or now - self._evicted.get(url, -AGENT_EVICT_SECONDS) >= AGENT_EVICT_SECONDS)
+        ]
+
+    async def _connect(self, card: dict, key: tuple, urls: list) -> list:
+        """Connect to `urls` concurrently; the live sessions for `key` afterwards."""
+        results = await asyncio.gather(*(self._spawn(card, key, url) for url in urls), return_exceptions=True)
+        errors = []
+        for url, result in zip(urls, results):
+            if isinstance(result, BaseException):
+                self._evicted[url] = time.monotonic()
+                errors.append(result)
+        sessions = [a for a in self._sessions.get(key, []) if a.alive]
+        if not sessions:
+            raise errors[0] if errors else ConnectionError(f"No reachable replica for {card['name']}")
+        return sessions
+
+    def _evict(self, agent: AgentSession):
+        if agent.url is not None:
+            self._evicted[agent.url] = time.monotonic()
+
+    async def _prune(self, key: tuple) -> list:
+        sessions = self._sessions.setdefault(key, [])
+        for agent in [a for a in sessions if not a.alive]:
+            sessions.remove(agent)
+            self._evict(agent)
+            await agent.close()
+            self.restarts[key] = self.restarts.get(key, 0) + 1
+        return sessions
+
+    async def _spawn(self, card: dict, key: tuple, url: str = None) -> AgentSession:
+        agent = AgentSession(card, key, url, self.host_mode)
+        parent = current_span()
+        span = parent.child("agent.spawn", agent=card["name"], target=agent.label) if parent else None
+        try:
+            await agent.start()
+        except Exception as e:
+            if span is not None:
+                span.end(error=repr(e))
+            raise
+        SPAWN_SECONDS.observe(agent.spawn_duration, agent=card["name"], transport=card["endpoint"] if url else "stdio")
+        if span is not None:
+            span.end()
+        self._sessions.setdefault(key, []).append(agent)
+        self._ensure_health_task()
+        return agent
+
+    def _grow(self, card: dict, key: tuple):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        if lock.locked():
+            return
+
+        async def grow():
+            async with lock:
+                try:
+                    if card_urls(card):
+                        await self._connect(card, key, self._missing_urls(card, key))
+                    elif len(await self._prune(key)) < self.replicas:
+                        await self._spawn(card, key)
+                except Exception:
+                    pass
+
+        task = asyncio.create_task(grow(), name=f"agent-grow:{card['name']}")
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def current(self, card: dict):
+        """The first live AgentSession serving a card, or None if not spawned."""
+        for agent in self._sessions.get(self.key(card), []):
+            if agent.alive:
+                return agent
+        return None
+
+    async def _discard(self, agent: AgentSession):
+        lock = self._locks.setdefault(agent.key, asyncio.Lock())
+        async with lock:
+            sessions = self._sessions.get(agent.key, [])
+            if agent in sessions:
+                sessions.remove(agent)
+                self._evict(agent)
+                self.restarts[agent.key] = self.restarts.get(agent.key, 0) + 1
+        await agent.close()
+
+    async def list_tools(self, card: dict):
+        """Tools of the card's agent, limited to the card's `tools` list if it has one.
+
+        A consolidated host serves every agent's tools from one session, so
+        the card's list is what keeps each agent's identity.
+        """
+        agent, spawn = await self.acquire(card)
+        tools = (await agent.session.list_tools()).tools
+        if card.get("tools"):
+            tools = [t for t in tools if t.name in card["tools"]]
+        return tools, spawn
+
+    async def call_tool(self, card: dict, tool_name: str, args: dict, agent: AgentSession = None):
+        """Call a tool on the card's agent (first on `agent`, if the caller
+        already acquired one and it is still alive).
+
+        Returns (result, timings, agent) where timings has `spawn` (seconds
+        spent spawning and initializing the agent for this call, 0.0 when an
+        existing session was reused) and `tool` (time inside call_tool), and
+        `agent` is the session that served the call.
+        """
+        spawn_total = 0.0
+        for attempt in range(2):
+            if agent is None or not agent.alive:
+                agent, spawn = await self.acquire(card)
+                spawn_total += spawn
+            parent = current_span()
+            span = parent.child("mcp.call_tool", agent=card["name"], tool=tool_name, target=agent.label,
+                                attempt=attempt) if parent is not None else None
+            t0 = time.time()
+            # `agent` is cleared before a retry; the finally still needs this one
+            served = agent
+            served.in_flight += 1
+            served.calls += 1
+            outcome = "error"
+            try:
+                res = await agent.session.call_tool(
+                    tool_name,
+                    arguments=args,
+                    read_timeout_seconds=timedelta(seconds=CALL_TIMEOUT),
+                )
+                outcome = "tool_error" if res.isError else "ok"
+            except TRANSPORT_ERRORS:
+                outcome = "transport_error"
+                await self._discard(agent)
+                if attempt == 1:
+                    raise
+                agent = None
+                continue
+            except McpError as e:
+                # A hung agent is treated like a dead one; tool errors are not.
+                if e.error.code != httpx.codes.REQUEST_TIMEOUT:
+                    raise
+                outcome = "timeout"
+                await self._discard(agent)
+                # The HTTP transports only log a failed POST, so a replica
+                # that went away surfaces as a timeout: try another one
+                if agent.url is None or attempt == 1:
+                    raise
+                agent = None
+                continue
+            finally:
+                served.in_flight -= 1
+                TOOL_SECONDS.observe(time.time() - t0, agent=card["name"], tool=tool_name, outcome=outcome)
+                if span is not None:
+                    span.end(outcome=outcome)
+            t1 = time.time()
+            return res, {"spawn": round(spawn_total, 3), "tool": round(t1 - t0, 3)}, agent
+
+    async def health_check(self) -> dict:
+        """Ping every live session, respawning those that do not answer."""
+        status = {}
+        for key, sessions in list(self._sessions.items()):
+            for i, agent in enumerate(list(sessions)):
+                label = f"{agent.label}#{i}"
+                try:
+                    if not agent.alive:
+                        raise ConnectionError("session closed")
+                    await agent.ping()
+                    status[label] = True
+                except Exception:
+                    status[label] = False
+                    await self._discard(agent)
+                    try:
+                        await self.acquire(agent.card)
+                    except Exception:
+                        pass
+        return status
+
+    def _ensure_health_task(self):
+        if HEALTH_INTERVAL <= 0:
+            return
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop(), name="agent-pool-health")
+
+    async def _health_loop(self):
+        while self._sessions:
+            await asyncio.sleep(HEALTH_INTERVAL)
+            await self.health_check()
+
+    async def metrics_snapshots(self, **labels) -> list:
+        """[(labels, snapshot)] of every live session's metrics://server resource.
+
+        `labels` are added to each session's own process/replica labels.
+        """
+        async def read(agent, replica):
+            try:
+                res = await asyncio.wait_for(agent.session.read_resource("metrics://server"), PING_TIMEOUT)
+            except Exception:
+                return None
+            return {**labels, "process": agent.label, "replica": str(replica)}, remote_snapshot(res.contents[0].text)
+
+        reads = [
+            read(agent, i)
+            for sessions in self._sessions.values()
+            for i, agent in enumerate(sessions) if agent.alive
+        ]
+        return [r for r in await asyncio.gather(*reads) if r is not None]
+
+    def stats(self) -> dict:
+        return {
+            " ".join(key): {
+                "agents": sorted(self._cards.get(key, ())),
+                "restarts": self.restarts.get(key, 0),
+                "replicas": [
+                    {
+                        "target": agent.label,
+                        "alive": agent.alive,
+                        "spawn_duration": agent.spawn_duration,
+                        "uptime": round(time.time() - agent.started_at, 3) if agent.started_at else 0.0,
+                        "in_flight": agent.in_flight,
+                        "calls": agent.calls,
+                    }
+                    for agent in sessions
+                ],
+            }
+            for key, sessions in self._sessions.items()
+        }
+
+    async def shutdown(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        sessions, self._sessions = [a for group in self._sessions.values() for a in group], {}
+        for agent in sessions:
+            await agent.close()
+
+
+POOL = AgentPool()
+
+METRICS.gauge(
+    "agent_calls_in_flight", "Tool calls in flight per agent process", lambda: {
+        (" ".join(key), str(i)): agent.in_flight
+        for key, sessions in POOL._sessions.items() for i, agent in enumerate(sessions)
+    }, ["process", "replica"],
+)
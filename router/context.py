@@ -0,0 +1,116 @@
+"""Token-budgeted prompt assembly for the router's reflection loop.
+
+Each planner turn resends the system prompt, the query and the trace so
+far. Left alone, every tool result is re-sent verbatim on every later turn
+and the prompt grows quadratically with the number of steps. RouterContext
+keeps the most recent tool outputs verbatim, replaces older ones with short
+summaries, sends the latest outputs once (as `[Tool Output]` messages
+rather than also inside the trace) and, if the prompt is still over budget,
+truncates further until it fits.
+"""
+import json
+import os
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("ROUTER_CONTEXT_BUDGET", "8000"))
+# Tool outputs (besides the latest) kept verbatim before summarizing
+KEEP_RECENT_TOOL_OUTPUTS = int(os.getenv("ROUTER_KEEP_RECENT_TOOLS", "1"))
+SUMMARY_CHARS = int(os.getenv("ROUTER_SUMMARY_CHARS", "300"))
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional; fall back to ~4 chars per token
+    _ENCODING = None
+
+
+def estimate_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text) // 4 + 1
+
+
+def message_tokens(messages) -> int:
+    # ~4 tokens of framing per chat message
+    return sum(estimate_tokens(m["content"]) + 4 for m in messages)
+
+
+def summarize(output: str, max_chars: int = SUMMARY_CHARS) -> str:
+    """A short stand-in for a tool output that has aged out of the window."""
+    if len(output) <= max_chars:
+        return output
+    try:
+        data = json.loads(output)
+    except (TypeError, ValueError):
+        data = None
+    if isinstance(data, list):
+        head = json.dumps(data[:2], default=str)[:max_chars]
+        return f"[{len(data)} items, first: {head}…]"
+    if isinstance(data, dict):
+        head = json.dumps(dict(list(data.items())[:5]), default=str)[:max_chars]
+        return f"[{len(data)} keys, first: {head}…]"
+    return f"{output[:max_chars]}… [truncated, {len(output)} chars]"
+
+
+class RouterContext:
+    def __init__(self, system_msg: dict, user_msg: dict, budget: int = CONTEXT_TOKEN_BUDGET,
+                 keep_recent: int = KEEP_RECENT_TOOL_OUTPUTS):
+        self.system_msg = system_msg
+        self.user_msg = user_msg
+        self.budget = budget
+        self.keep_recent = keep_recent
+
+    def _render(self, trace, verbatim: set, latest: dict, summary_chars: int):
+        msgs = [self.system_msg, self.user_msg]
+        for i, entry in enumerate(trace):
+            if entry["type"] == "reasoning":
+                msgs.append({"role": "assistant", "content": f"[Thought] {entry['reasoning']}"})
+                continue
+            payload = {"tool": entry["tool"], "args": entry["args"]}
+            if i in latest:
+                pass  # its output follows as a [Tool Output] message
+            elif i in verbatim:
+                payload["result"] = entry["result"]
+            else:
+                payload["result_summary"] = summarize(entry["result"], summary_chars)
+            msgs.append({"role": "assistant", "content": f"[Tool] {json.dumps(payload)}"})
+            if i in latest:
+                msgs.append({"role": "assistant", "content": f"[Tool Output] {latest[i]}"})
+        return msgs
+
+    def first_turn(self):
+        msgs = [self.system_msg, self.user_msg]
+        return msgs, message_tokens(msgs)
+
+    def reflect_turn(self, trace, reflect_msg: dict):
+        """Messages for the next planner turn and their estimated prompt tokens.
+
+        The latest outputs are those of every tool step since the last
+        reasoning step: one for `next_tool`, several for a plan.
+        """
+        last_reasoning = max((i for i, e in enumerate(trace) if e["type"] == "reasoning"), default=-1)
+        tool_steps = [i for i, e in enumerate(trace) if e["type"] == "tool"]
+        latest = {i: trace[i]["result"] for i in tool_steps if i > last_reasoning}
+        older = [i for i in tool_steps if i not in latest]
+        verbatim = set(older[len(older) - self.keep_recent:]) if self.keep_recent else set()
+        summary_chars = SUMMARY_CHARS
+
+        while True:
+            msgs = self._render(trace, verbatim, latest, summary_chars) + [reflect_msg]
+            tokens = message_tokens(msgs)
+            if tokens <= self.budget:
+                return msgs, tokens
+            if verbatim:
+                verbatim.discard(min(verbatim))
+            elif summary_chars > 60:
+                summary_chars //= 2
+            else:
+                # Only the latest outputs are left to trim; cut the longest
+                if not latest:
+                    return msgs, tokens
+                i = max(latest, key=lambda k: len(latest[k]))
+                overflow_chars = (tokens - self.budget) * 4 + 64
+                if len(latest[i]) <= overflow_chars // len(latest) + 64:
+                    return msgs, tokens
+                keep = max(len(latest[i]) - overflow_chars, len(latest[i]) // 2)
+                latest[i] = f"{latest[i][:keep]}… [truncated, {len(trace[i]['result'])} chars]"
@@ -0,0 +1,249 @@
+"""Deterministic fast path for questions that map onto a single tool.
+
+Queries like "shipping mode breakdown", "delay stats" or "restock suggestion
+for Western Europe" name one tool and at most a few arguments. IntentMatcher
+scores every tool in a ToolCatalog against the query using the words in the
+tool's name and description, fills its arguments from the regions, products
+and numbers found in the query, and returns a match only when every one of
+them went into an argument, the score clears FAST_PATH_THRESHOLD and no
+other tool comes close. Years and numbers next to a unit ("2 years") are
+never bound, so queries with them go through the LLM. Callers run the
+tool directly and answer with `render_answer`; anything below the threshold
+goes through the usual LLM loop.
+"""
+import json
+import os
+import re
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") == "1"
+FAST_PATH_THRESHOLD = float(os.getenv("FAST_PATH_THRESHOLD", "0.75"))
+# A runner-up scoring within this margin of the best tool makes the query ambiguous
+FAST_PATH_MARGIN = float(os.getenv("FAST_PATH_MARGIN", "0.1"))
+
+STOPWORDS = {
+    "a", "about", "all", "an", "any", "are", "as", "at", "be", "by", "can", "could", "current",
+    "currently", "do", "does", "each", "for", "from", "get", "give", "how", "i", "in", "is", "it",
+    "list", "me", "much", "my", "of", "on", "our", "per", "please", "query", "s", "see", "show",
+    "tell", "the", "there", "to", "us", "want", "we", "what", "whats", "which", "with", "you",
+}
+SYNONYMS = {
+    "average": "avg", "mean": "avg",
+    "delayed": "delay", "delays": "delay", "late": "delay",
+    "statistic": "stat", "statistics": "stat", "stats": "stat",
+    "summary": "overview",
+    "shipment": "shipping", "ship": "shipping", "shipped": "shipping",
+    "suggest": "suggestion", "suggestions": "suggestion",
+    "recommendation": "recommend", "recommended": "recommend",
+    "revenue": "sale",
+}
+# A number next to one of these is a duration or a date, never a count/threshold argument
+UNIT_WORDS = {
+    "day", "days", "week", "weeks", "month", "months", "quarter", "quarters", "year", "years",
+    "yr", "yrs", "hour", "hours",
+}
+
+
+def words(text: str) -> list:
+    return re.findall(r"[a-z0-9]+", (text or "").lower())
+
+
+def term(word: str) -> str:
+    word = SYNONYMS.get(word, word)
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    return word
+
+
+def terms(text: str) -> set:
+    return {term(w) for w in words(text) if w not in STOPWORDS}
+
+
+def bindable_numbers(tokens: list, numbers: dict) -> dict:
+    """The numbers that may fill an integer/number argument: not a 4-digit
+    year and not next to a unit word ("2 years", "30 days")."""
+    def neighbours(i):
+        return {tokens[j] for j in (i - 1, i + 1) if 0 <= j < len(tokens)}
+    return {
+        i: t for i, t in numbers.items()
+        if not (len(t) == 4 and 1900 <= int(t) <= 2100) and not neighbours(i) & UNIT_WORDS
+    }
+
+
+async def fetch_vocabulary(session):
+    """Regions and products from an agent's dataset://vocabulary resource.
+
+    None if the agent has no such resource or its dataset is still loading
+    (no version yet), in which case callers ask again later.
+    """
+    try:
+        res = await session.read_resource("dataset://vocabulary")
+        data = json.loads(res.contents[0].text)
+    except Exception:
+        return None
+    return data if data.get("version") else None
+
+
+class Vocabulary:
+    """Known entity names, matched as whole-word phrases in a query."""
+
+    def __init__(self):
+        self.regions = {}  # tuple of lowercase words -> name
+        self.products = {}
+
+    def update(self, data):
+        if not data:
+            return
+        for name in data.get("regions", []):
+            self.regions[tuple(words(name))] = name
+        for name in data.get("products", []):
+            self.products[tuple(words(name))] = name
+
+    @staticmethod
+    def _find(tokens: list, table: dict, taken: set) -> list:
+        """(name, token positions) for each phrase found, longest phrases first."""
+        found = []
+        for phrase in sorted(table, key=len, reverse=True):
+            n = len(phrase)
+            for i in range(len(tokens) - n + 1):
+                span = set(range(i, i + n))
+                if tuple(tokens[i:i + n]) == phrase and not span & taken:
+                    taken |= span
+                    found.append((table[phrase], span))
+        return sorted(found, key=lambda f: min(f[1]))
+
+    def find(self, tokens: list) -> dict:
+        taken = set()
+        return {
+            "region": self._find(tokens, self.regions, taken),
+            "product": self._find(tokens, self.products, taken),
+        }
+
+
+class IntentMatcher:
+    def __init__(self, threshold: float = FAST_PATH_THRESHOLD, margin: float = FAST_PATH_MARGIN):
+        self.threshold = threshold
+        self.margin = margin
+        self.vocabulary = Vocabulary()
+        self._intents = []
+        self._version = None
+
+    def index(self, catalog):
+        """(Re)build the intents from a ToolCatalog; cheap when it is unchanged."""
+        if catalog.version == self._version:
+            return
+        self._intents = []
+        for _, tool in catalog.tools():
+            schema = tool.inputSchema or {}
+            self._intents.append({
+                "tool": tool.name,
+                "name_terms": terms(tool.name.replace("_", " ")),
+                "desc_terms": terms(tool.description),
+                "properties": schema.get("properties", {}),
+                "required": set(schema.get("required", [])),
+            })
+        self._version = catalog.version
+
+    @staticmethod
+    def _fill(intent, entities: dict, numbers: dict):
+        """Arguments for `intent` and the token positions they consumed, or None."""
+        args, used = {}, set()
+        ints = iter(numbers)
+        for prop, spec in intent["properties"].items():
+            kind = spec.get("type")
+            entity = "region" if "region" in prop else "product" if "product" in prop else None
+            value = None
+            if entity and kind == "array":
+                if entities[entity]:
+                    value = [name for name, _ in entities[entity]]
+                    for _, span in entities[entity]:
+                        used |= span
+            elif entity and kind == "string":
+                if len(entities[entity]) == 1:
+                    value, span = entities[entity][0]
+                    used |= span
+            elif kind in ("integer", "number"):
+                pos = next(ints, None)
+                if pos is not None:
+                    value = int(numbers[pos]) if kind == "integer" else float(numbers[pos])
+                    used.add(pos)
+            if value is None:
+                if prop in intent["required"]:
+                    return None
+                continue
+            args[prop] = value
+        return args, used
+
+    def match(self, query: str):
+        """{"tool", "args", "confidence"} for a confident single-tool match, else None."""
+        tokens = words(query)
+        entities = self.vocabulary.find(tokens)
+        numbers = {i: t for i, t in enumerate(tokens) if t.isdigit()}
+        entity_positions = set().union(*(span for found in entities.values() for _, span in found))
+        content = {
+            i: term(t) for i, t in enumerate(tokens)
+            if t not in STOPWORDS and i not in entity_positions and i not in numbers
+        }
+        if not content and not entity_positions:
+            return None
+
+        scored = []
+        bindable = bindable_numbers(tokens, numbers)
+        for intent in self._intents:
+            filled = self._fill(intent, entities, bindable)
+            if filled is None:
+                continue
+            args, used = filled
+            # A region, product or number the tool cannot take would be
+            # silently dropped from the answer: leave such queries to the LLM
+            if (entity_positions | set(numbers)) - used:
+                continue
+            # Every word of the tool name should appear in the query (slot
+            # names like "region" count when that slot was filled) ...
+            covered = {t for t in intent["name_terms"] if t in content.values() or any(t in p for p in args)}
+            coverage = len(covered) / max(len(intent["name_terms"]), 1)
+            # ... and every word of the query should be explained by the tool
+            known = intent["name_terms"] | intent["desc_terms"]
+            if any(isinstance(v, list) and len(v) > 1 for v in args.values()):
+                known = known | {"and"}
+            unexplained = [i for i, t in content.items() if t not in known]
+            total = len(content) + len(entity_positions) + len(numbers)
+            explained = 1 - len(unexplained) / max(total, 1)
+            scored.append((coverage * explained, intent["tool"], args))
+
+        if not scored:
+            return None
+        scored.sort(key=lambda s: s[0], reverse=True)
+        best = scored[0]
+        if best[0] < self.threshold:
+            return None
+        if len(scored) > 1 and best[0] - scored[1][0] < self.margin:
+            return None
+        return {"tool": best[1], "args": best[2], "confidence": round(best[0], 3)}
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    if isinstance(value, dict):
+        return ", ".join(f"{k}: {_format_value(v)}" for k, v in value.items())
+    return str(value)
+
+
+def render_answer(tool_name: str, args: dict, output: str) -> str:
+    """A plain-text answer built from a tool's output, without the LLM."""
+    try:
+        data = json.loads(output)
+    except (TypeError, ValueError):
+        # Tools that already return a sentence answer for themselves
+        return output
+
+    title = " ".join(w for w in words(tool_name) if w != "get").capitalize()
+    if args:
+        title += " (" + ", ".join(f"{k}: {_format_value(v)}" for k, v in args.items()) + ")"
+    if isinstance(data, dict):
+        lines = [f"- {k}: {_format_value(v)}" for k, v in data.items()]
+    elif isinstance(data, list):
+        lines = [f"- {_format_value(item)}" for item in data]
+    else:
+        lines = [_format_value(data)]
+    return f"{title}:\n" + ("\n".join(lines) if lines else "No results.")
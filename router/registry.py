@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import json
+import os
+
+from router.agent_pool import POOL
+from router.fast_path import IntentMatcher, fetch_vocabulary
+
+AGENTS_DIR = "agents"
+# Operator tools (profiling and the like) agents expose but the model never sees
+ADMIN_TOOL_PREFIX = "admin_"
+
+
+def load_agent_cards(agents_dir: str = AGENTS_DIR):
+    cards = {}
+    for fname in sorted(os.listdir(agents_dir)):
+        if fname.endswith(".json"):
+            with open(os.path.join(agents_dir, fname)) as f:
+                card = json.load(f)
+                cards[card["name"]] = card
+    return cards
+
+
+def _fingerprint(tools) -> str:
+    payload = [(t.name, t.description, t.inputSchema) for t in tools]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ToolCatalog:
+    """MCP tool schemas grouped by source, with the OpenAI `tools` array cached.
+
+    `update` is cheap when the tool list is unchanged, so callers can feed it
+    every list_tools() result they see and only pay for re-rendering when a
+    server actually changed. `admin_` tools are dropped on the way in.
+    """
+
+    def __init__(self):
+        self._tools = {}  # source -> list of mcp Tool
+        self._fingerprints = {}
+        self._owners = {}
+        self._openai_tools = None
+        self.version = 0
+
+    def update(self, source: str, tools) -> bool:
+        tools = [t for t in tools if not t.name.startswith(ADMIN_TOOL_PREFIX)]
+        fp = _fingerprint(tools)
+        if self._fingerprints.get(source) == fp:
+            return False
+        self._tools[source] = list(tools)
+        self._fingerprints[source] = fp
+        self._invalidate()
+        return True
+
+    def remove(self, source: str):
+        if self._tools.pop(source, None) is not None:
+            self._fingerprints.pop(source, None)
+            self._invalidate()
+
+    def _invalidate(self):
+        self._owners = {t.name: src for src, tools in self._tools.items() for t in tools}
+        self._openai_tools = None
+        self.version += 1
+
+    def owner(self, tool_name: str):
+        return self._owners.get(tool_name)
+
+    def tools(self):
+        for src, tools in self._tools.items():
+            for t in tools:
+                yield src, t
+
+    def openai_tools(self) -> list:
+        if self._openai_tools is None:
+            self._openai_tools = [
+                {
+                    "type": "function",
+                    "function": {
+                        "name": t.name,
+                        "description": t.description,
+                        "parameters": t.inputSchema,
+                    },
+                }
+                for _, t in self.tools()
+            ]
+        return self._openai_tools
+
+
+class AgentRegistry:
+    """Agent cards and their tool schemas, loaded once and kept rendered.
+
+    `refresh()` only stats the card files and checks whether any agent
+    session was respawned since its tools were listed; the tools payload,
+    tool guide and router system prompt are rebuilt only when one of those
+    actually changed.
+    """
+
+    def __init__(self, pool=POOL, agents_dir: str = AGENTS_DIR):
+        self.pool = pool
+        self.agents_dir = agents_dir
+        self.cards = {}
+        self.catalog = ToolCatalog()
+        self.matcher = IntentMatcher()
+        self.tool_to_agent = {}
+        self.tools = []
+        self.tool_guide = ""
+        self.system_msg = None
+        self._mtimes = {}
+        self._listed_from = {}  # card name -> (AgentSession, card) the tools came from
+        self._vocab_pending = {}  # card name -> AgentSession whose dataset was still loading
+        self._rendered_version = None
+        self._lock = asyncio.Lock()
+
+    def _scan(self) -> dict:
+        return {
+            fname: os.stat(os.path.join(self.agents_dir, fname)).st_mtime_ns
+            for fname in os.listdir(self.agents_dir)
+            if fname.endswith(".json")
+        }
+
+    def _load_cards(self):
+        cards = load_agent_cards(self.agents_dir)
+        for name in set(self.cards) - set(cards):
+            self.catalog.remove(name)
+            self._listed_from.pop(name, None)
+        self.cards = cards
+
+    def _stale(self) -> list:
+        stale = []
+        for name, card in self.cards.items():
+            current = self.pool.current(card)
+            if current is None or self._listed_from.get(name) != (current, card):
+                stale.append(card)
+        return stale
+
+    async def refresh(self) -> "AgentRegistry":
+        mtimes = self._scan()
+        if mtimes == self._mtimes and not self._stale() and not self._vocab_pending:
+            return self
+
+        async with self._lock:
+            mtimes = self._scan()
+            if mtimes != self._mtimes:
+                self._mtimes = mtimes
+                self._load_cards()
+
+            for card in self._stale():
+                tools_list, _ = await self.pool.list_tools(card)
+                self.catalog.update(card["name"], tools_list)
+                session = self.pool.current(card)
+                self._listed_from[card["name"]] = (session, card)
+                if session is not None:
+                    self._vocab_pending[card["name"]] = session
+
+            # Agents load their data in the background, so the vocabulary may
+            # not exist yet; it is retried on later refreshes until it does.
+            for name, session in list(self._vocab_pending.items()):
+                vocabulary = await fetch_vocabulary(session.session) if session.alive else None
+                if vocabulary is not None or not session.alive:
+                    self.matcher.vocabulary.update(vocabulary)
+                    del self._vocab_pending[name]
+
+            if self._rendered_version != self.catalog.version:
+                self._render()
+        return self
+
+    def _render(self):
+        self.tool_to_agent = {t.name: self.cards[src] for src, t in self.catalog.tools()}
+        self.matcher.index(self.catalog)
+        self.tools = [
+            {
+                "type": "function",
+                "function": {
+                    "name": t.name,
+                    "description": f"Auto-generated for {t.name}",
+                    "parameters": t.inputSchema,
+                },
+            }
+            for _, t in self.catalog.tools()
+        ]
+
+        tool_lines = []
+        for _, t in self.catalog.tools():
+            props = t.inputSchema.get("properties", {})
+            params = ", ".join(f"{p}: {props[p]['type']}" for p in props)
+            tool_lines.append(f"- {t.name}({params})")
+        self.tool_guide = "\n".join(tool_lines)
+
+        self.system_msg = {
+            "role": "system",
+            "content": (
+                "You are a multi-agent supply chain assistant.\n"
+                "Only use the tools listed below. Do not invent or assume any other tools exist.\n\n"
+                "Available tools:\n"
+                f"{self.tool_guide}\n\n"
+                "When responding, strictly use one of the following JSON formats:\n"
+                "1) { \"reasoning\": \"...\", \"next_tool\": \"tool_name\", \"args\": { ... } }\n"
+                "2) { \"reasoning\": \"...\", \"plan\": [ { \"id\": \"a\", \"tool\": \"tool_name\", \"args\": { ... }, \"depends_on\": [] }, ... ] }\n"
+                "3) { \"reasoning\": \"...\", \"final_response\": \"...\" }\n\n"
+                "Use a plan when several tool calls are needed and do not depend on each other's results "
+                "(e.g. the same statistic for several regions, or data from different agents); "
+                "independent steps run in parallel and all results come back together. "
+                "List a step id in depends_on only if that step must finish first.\n\n"
+                "Do not wrap the response in markdown. Do not include anything else. Only return a valid JSON object."
+            )
+        }
+        self._rendered_version = self.catalog.version
+
+
+REGISTRY = AgentRegistry()
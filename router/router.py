@@ -1,181 +1,357 @@
 import asyncio
-import json
 import os
-import time
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-from contextlib import AsyncExitStack
-from openai import AsyncAzureOpenAI
 from dotenv import load_dotenv
 
+from client.llm_cache import LLM_CACHE
+from client.llm_gateway import GATEWAY, PRIORITY_CONTINUE, PRIORITY_NEW
+from client.tool_cache import DATASET_VERSIONS, TOOL_CACHE, result_text
+from router.agent_pool import POOL
+from router.context import RouterContext
+from router.fast_path import FAST_PATH_ENABLED, render_answer
+from router.registry import REGISTRY
+from router.streaming import FinalResponseExtractor
+from telemetry.metrics import PLANNER_SECONDS, REQUEST_SECONDS, TOOL_CACHE_LOOKUPS, Span
+
 load_dotenv()
 
-GPT = AsyncAzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-)
-MODEL = os.getenv("AZURE_OPENAI_MODEL")
-
-
-def load_agent_cards():
-    cards = {}
-    for fname in os.listdir("agents"):
-        if fname.endswith(".json"):
-            with open(f"agents/{fname}") as f:
-                card = json.load(f)
-                cards[card["name"]] = card
-    return cards
-
-
-def trace_to_messages(trace):
-    msgs = []
-    for entry in trace:
-        if entry["type"] == "reasoning":
-            msgs.append({
-                "role": "assistant",
-                "content": f"[Thought] {entry['reasoning']}"
-            })
-        else:  # tool entry
-            payload = {
-                "tool": entry["tool"],
-                "args": entry["args"],
-                "result": entry["result"]
-            }
-            msgs.append({
-                "role": "assistant",
-                "content": f"[Tool] {json.dumps(payload)}"
-            })
-    return msgs
 
+# Longest plan the router will run from a single planner turn
+PLAN_MAX_STEPS = int(os.getenv("ROUTER_PLAN_MAX_STEPS", "8"))
 
-async def call_agent(query: str):
-    # 1) Discover all tools + schemas
-    agent_cards = load_agent_cards()
-    tool_to_agent = {}
-    tool_schemas = {}
-    for agent in agent_cards.values():
-        params = StdioServerParameters(command=agent["endpoint"], args=agent["args"])
-        async with AsyncExitStack() as stack:
-            read, write = await stack.enter_async_context(stdio_client(params))
-            session = await stack.enter_async_context(ClientSession(read, write))
-            await session.initialize()
-            tools_list = (await session.list_tools()).tools
-            for t in tools_list:
-                tool_to_agent[t.name] = agent
-                tool_schemas[t.name] = t.inputSchema
-
-    # 2) Build OpenAI-compatible `tools` array
-    tools = []
-    for name, schema in tool_schemas.items():
-        tools.append({
-            "type": "function",
-            "function": {
-                "name": name,
-                "description": f"Auto-generated for {name}",
-                "parameters": schema
-            }
-        })
+REFLECT_MSG = {
+    "role":    "system",
+    "content": (
+        "Given the above tool results, reply with JSON in one of these forms:\n"
+        "1) { \"reasoning\": \"…\", \"next_tool\": \"tool_name\", \"args\": { … } }\n"
+        "2) { \"reasoning\": \"…\", \"plan\": [ { \"id\": \"a\", \"tool\": \"tool_name\", \"args\": { … }, \"depends_on\": [] }, … ] }\n"
+        "3) { \"reasoning\": \"…\", \"final_response\": \"…\" }"
+    )
+}
 
-    # 3) Build human-readable bullet list of tool signatures
-    tool_lines = []
-    for name, schema in tool_schemas.items():
-        props = schema.get("properties", {})
-        params = ", ".join(f"{p}: {props[p]['type']}" for p in props)
-        tool_lines.append(f"- {name}({params})")
-    tool_guide = "\n".join(tool_lines)
-
-    # 4) System & user messages enforcing JSON-only schema
-    system_msg = {
-        "role": "system",
-        "content": (
-            "You are a multi-agent supply chain assistant.\n"
-            "Only use the tools listed below. Do not invent or assume any other tools exist.\n\n"
-            "Available tools:\n"
-            f"{tool_guide}\n\n"
-            "When responding, strictly use one of the following JSON formats:\n"
-            "1) { \"reasoning\": \"...\", \"next_tool\": \"tool_name\", \"args\": { ... } }\n"
-            "2) { \"reasoning\": \"...\", \"final_response\": \"...\" }\n\n"
-            "Do not wrap the response in markdown. Do not include anything else. Only return a valid JSON object."
-        )
-    }
-    user_msg = {"role": "user", "content": query}
 
-    # 5) Trace & step counter
-    trace = []
-    step = 1
+async def _planner_turn(messages, stream_tokens: bool = False, priority: int = PRIORITY_NEW, span: Span = None):
+    """Ask GPT for the next action.
 
-    # 6) First GPT turn: pick first action
-    resp = await GPT.chat.completions.create(
-        model=MODEL,
-        messages=[system_msg, user_msg]
-    )
-    choice = json.loads(resp.choices[0].message.content)
-    trace.append({"step": step, "type": "reasoning", "reasoning": choice["reasoning"]})
-    step += 1
+    Yields ("token", text) for each new piece of `final_response` while the
+    reply streams (only when stream_tokens is set), ("cache_hit", True) when
+    the reply comes from the response cache, then ("choice", dict).
+    """
+    key = LLM_CACHE.key(GATEWAY.model, messages)
+    cached = await LLM_CACHE.aget(key)
+    if cached is not None:
+        if stream_tokens and cached.get("final_response"):
+            yield "token", cached["final_response"]
+        yield "cache_hit", True
+        yield "choice", cached
+        return
+
+    if not stream_tokens:
+        if span is not None:
+            # No yield inside the block, so the gateway's llm.call span nests here
+            with span.activate():
+                choice = await GATEWAY.chat_json(messages, priority)
+        else:
+            choice = await GATEWAY.chat_json(messages, priority)
+        _cache_choice(key, choice)
+        yield "choice", choice
+        return
+
+    extractor = FinalResponseExtractor()
+    parts = []
+    async for chunk in GATEWAY.stream(messages, priority):
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        parts.append(chunk.choices[0].delta.content)
+        token = extractor.feed(parts[-1])
+        if token:
+            yield "token", token
+    choice = await GATEWAY.ensure_json(messages, "".join(parts))
+    _cache_choice(key, choice)
+    yield "choice", choice
+
+
+def _cache_choice(key: str, choice):
+    # Only well-formed planner replies are worth replaying
+    if isinstance(choice, dict) and "reasoning" in choice and (
+        "next_tool" in choice or "plan" in choice or "final_response" in choice
+    ):
+        LLM_CACHE.put(key, choice)
 
-    # 7) Loop until we see `final_response`
-    while "next_tool" in choice:
-        tool_name = choice["next_tool"]
-        args      = choice["args"]
-        agent     = tool_to_agent.get(tool_name)
+
+async def _run_tool(agent, tool_name: str, args: dict, span: Span):
+    """Call a tool on the agent's pooled session, unless an identical call
+    against the same dataset version is cached.
+
+    `span` is ended here; spawns and calls made by the pool nest under it.
+    Returns (output, timings, cache_hit, is_error).
+    """
+    try:
+        with span.activate():
+            output, timings, cache_hit, is_error = await _call_or_cached(agent, tool_name, args)
+    except Exception as e:
+        span.end(error=repr(e))
+        raise
+    span.end(cache_hit=cache_hit, is_error=is_error)
+    return output, timings, cache_hit, is_error
+
+
+async def _call_or_cached(agent, tool_name: str, args: dict):
+    session, spawn = await POOL.acquire(agent)
+    version = await DATASET_VERSIONS.get(session.session)
+    output = TOOL_CACHE.get(tool_name, args, version)
+    TOOL_CACHE_LOOKUPS.inc(tool=tool_name, result="hit" if output is not None else "miss")
+    if output is not None:
+        return output, {"spawn": spawn, "tool": 0.0}, True, False
+    res, timings, served_by = await POOL.call_tool(agent, tool_name, args, session)
+    timings["spawn"] = round(timings["spawn"] + spawn, 3)
+    output = result_text(res)
+    # Only cached if the replica that ran the call still reports the version
+    # looked up above; a result from before an append is never filed under
+    # the new version
+    if res.content and not res.isError and await DATASET_VERSIONS.get(served_by.session) == version:
+        TOOL_CACHE.put(tool_name, args, version, output)
+    return output, timings, False, res.isError
+
+
+def _plan_steps(choice: dict, tool_to_agent: dict, first_step: int) -> list:
+    """The tool calls requested by a planner reply, validated and numbered.
+
+    A `next_tool` reply is a one-step plan. Steps of a `plan` keep the order
+    the planner listed them in for numbering; `depends_on` only constrains
+    when they run. Unknown tools, unknown dependencies and cycles are rejected.
+    """
+    if "plan" in choice:
+        raw = choice["plan"]
+        if not isinstance(raw, list) or not raw:
+            raise ValueError("Plan must be a non-empty list of steps")
+        if len(raw) > PLAN_MAX_STEPS:
+            raise ValueError(f"Plan has {len(raw)} steps; at most {PLAN_MAX_STEPS} are allowed")
+    else:
+        raw = [{"id": "1", "tool": choice["next_tool"], "args": choice["args"]}]
+
+    steps = []
+    for i, item in enumerate(raw):
+        tool_name = item.get("tool") or item.get("next_tool")
+        agent = tool_to_agent.get(tool_name)
         if not agent:
             raise ValueError(f"Unknown tool requested: {tool_name}")
+        steps.append({
+            "id": str(item.get("id", i + 1)),
+            "step": first_step + i,
+            "agent": agent,
+            "tool": tool_name,
+            "args": item.get("args") or {},
+            "depends_on": [str(d) for d in item.get("depends_on") or []],
+        })
 
-        # 7a) execute the tool
-        params = StdioServerParameters(command=agent["endpoint"], args=agent["args"])
-        async with AsyncExitStack() as stack:
-            read, write = await stack.enter_async_context(stdio_client(params))
-            session = await stack.enter_async_context(ClientSession(read, write))
-            await session.initialize()
-            t0 = time.time()
-            res = await session.call_tool(tool_name, arguments=args)
-            t1 = time.time()
+    ids = {s["id"] for s in steps}
+    if len(ids) != len(steps):
+        raise ValueError("Plan step ids must be unique")
+    for s in steps:
+        unknown = set(s["depends_on"]) - ids
+        if unknown:
+            raise ValueError(f"Plan step {s['id']} depends on unknown steps: {sorted(unknown)}")
 
-        output = res.content[0].text if res.content else ""
+    # Kahn's algorithm: anything left over sits on a cycle
+    remaining = {s["id"]: set(s["depends_on"]) for s in steps}
+    while True:
+        ready = [i for i, deps in remaining.items() if not deps]
+        if not ready:
+            break
+        for i in ready:
+            del remaining[i]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    if remaining:
+        raise ValueError(f"Plan has a dependency cycle between steps: {sorted(remaining)}")
+    return steps
 
-        # 7b) log the tool call
-        trace.append({
-            "step": step,
+
+async def _execute_plan(steps: list, tagged: bool, parent: Span):
+    """Run plan steps concurrently, each once its dependencies finished.
+
+    Yields `tool_start` and `tool` events as they happen; tool entries carry
+    their own step number, duration and span id. `tagged` adds the plan id
+    to entries.
+    """
+    events = asyncio.Queue()
+    tasks = {}
+
+    async def run(s):
+        for dep in s["depends_on"]:
+            await tasks[dep]
+        agent = s["agent"]
+        await events.put({"event": "tool_start", "data": {"step": s["step"], "agent": agent["name"], "tool": s["tool"], "args": s["args"]}})
+        span = parent.child("router.tool", step=s["step"], agent=agent["name"], tool=s["tool"])
+        output, timings, cache_hit, _ = await _run_tool(agent, s["tool"], s["args"], span)
+        entry = {
+            "step": s["step"],
             "type":    "tool",
             "agent":   agent["name"],
-            "tool":    tool_name,
-            "args":    args,
+            "tool":    s["tool"],
+            "args":    s["args"],
             "result":  output,
-            "duration": round(t1 - t0, 3),
+            "duration": timings["tool"],
+            "spawn_duration": timings["spawn"],
+            "span_id": span.span_id,
+        }
+        if cache_hit:
+            entry["cache_hit"] = True
+        if tagged:
+            entry["plan_id"] = s["id"]
+            entry["depends_on"] = s["depends_on"]
+        await events.put({"event": "tool", "data": entry})
+
+    # Dependencies are created first so run() can always find them
+    pending = {s["id"]: s for s in steps}
+    while pending:
+        for sid, s in list(pending.items()):
+            if all(d in tasks for d in s["depends_on"]):
+                tasks[sid] = asyncio.ensure_future(run(s))
+                del pending[sid]
+
+    finished = asyncio.gather(*tasks.values())
+    try:
+        while not (finished.done() and events.empty()):
+            getter = asyncio.ensure_future(events.get())
+            await asyncio.wait({getter, finished}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+        finished.result()
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+
+async def iter_call_agent(query: str, stream_tokens: bool = False):
+    """Run the multi-agent loop, yielding each event as it happens.
+
+    Events are {"event": type, "data": payload}: `reasoning` and `tool` carry
+    the trace entry itself, `tool_start` announces a call before it runs,
+    `token` carries pieces of the final response (with stream_tokens) and
+    `final` carries the same {"response", "trace", "trace_id"} dict
+    call_agent returns. Every trace entry has the `span_id` of its step.
+    """
+    root = Span("router.request", stream=stream_tokens)
+    path = "error"
+    try:
+        async for event in _iter_call_agent(query, stream_tokens, root):
+            if event["event"] == "final":
+                path = "fast_path" if event["data"].get("fast_path") else "planner"
+                event["data"]["trace_id"] = root.trace_id
+            yield event
+    finally:
+        root.end(path=path)
+        REQUEST_SECONDS.observe(root.duration, entry="router", path=path)
+
+
+async def _planner_step(context_turn, step: int, stream_tokens: bool, priority: int, parent: Span):
+    """One planner turn; yields token events, then ("entry", trace entry, choice)."""
+    messages, prompt_tokens = context_turn
+    span = parent.child("router.planner", step=step, prompt_tokens=prompt_tokens)
+    llm_cache_hit = False
+    async for kind, payload in _planner_turn(messages, stream_tokens, priority, span):
+        if kind == "token":
+            yield {"event": "token", "data": {"step": step, "text": payload}}
+        elif kind == "cache_hit":
+            llm_cache_hit = True
+        else:
+            choice = payload
+    span.end(cache_hit=llm_cache_hit)
+    PLANNER_SECONDS.observe(span.duration, cache="hit" if llm_cache_hit else "miss")
+    entry = {"step": step, "type": "reasoning", "reasoning": choice["reasoning"],
+             "prompt_tokens": prompt_tokens, "span_id": span.span_id}
+    if llm_cache_hit:
+        entry["llm_cache_hit"] = True
+    yield {"event": "reasoning", "data": entry, "choice": choice}
+
+
+async def _iter_call_agent(query: str, stream_tokens: bool, root: Span):
+    # 1) Tools, schemas and the system prompt come from the cached registry;
+    #    it only rediscovers when a card file or an agent's tool list changed
+    registry = await REGISTRY.refresh()
+    tool_to_agent = registry.tool_to_agent
+    system_msg = registry.system_msg
+    user_msg = {"role": "user", "content": query}
+    context = RouterContext(system_msg, user_msg)
+
+    # 2) Trace & step counter
+    trace = []
+    step = 1
+
+    # 2b) Questions that map onto a single tool are answered without GPT;
+    #     a failed call falls through to the planner below
+    match = registry.matcher.match(query) if FAST_PATH_ENABLED else None
+    if match:
+        agent = tool_to_agent[match["tool"]]
+        yield {"event": "tool_start", "data": {"step": step, "agent": agent["name"], "tool": match["tool"], "args": match["args"]}}
+        span = root.child("router.tool", step=step, agent=agent["name"], tool=match["tool"], fast_path=True)
+        output, timings, cache_hit, is_error = await _run_tool(agent, match["tool"], match["args"], span)
+        trace.append({
+            "step": step,
+            "type": "tool",
+            "agent": agent["name"],
+            "tool": match["tool"],
+            "args": match["args"],
+            "result": output,
+            "duration": timings["tool"],
+            "spawn_duration": timings["spawn"],
+            "fast_path": True,
+            "confidence": match["confidence"],
+            "span_id": span.span_id,
         })
+        if cache_hit:
+            trace[-1]["cache_hit"] = True
+        yield {"event": "tool", "data": trace[-1]}
         step += 1
+        if not is_error:
+            response = render_answer(match["tool"], match["args"], output)
+            if stream_tokens:
+                yield {"event": "token", "data": {"step": step, "text": response}}
+            yield {"event": "final", "data": {"response": response, "trace": trace, "fast_path": True}}
+            return
 
-        # 7c) Ask GPT what to do next, feeding in the tool result
-        prompt_tool = {
-            "role": "assistant",
-            "content": f"[Tool Output] {output}"
-        }
+    # 3) First GPT turn: pick first action
+    async for event in _planner_step(context.first_turn(), step, stream_tokens, PRIORITY_NEW, root):
+        if event["event"] == "reasoning":
+            choice = event.pop("choice")
+            trace.append(event["data"])
+        yield event
+    step += 1
 
+    # 4) Loop until we see `final_response`
+    while "next_tool" in choice or "plan" in choice:
+        # 4a) execute the requested tool, or every step of a plan with
+        #     independent steps running concurrently; identical calls against
+        #     the same dataset version come from the tool cache
+        steps = _plan_steps(choice, tool_to_agent, step)
+        entries = []
+        async for event in _execute_plan(steps, tagged="plan" in choice, parent=root):
+            if event["event"] == "tool":
+                entries.append(event["data"])
+            yield event
 
-        prompt_reflect = {
-            "role":    "system",
-            "content": (
-                "Given the above tool result, reply with JSON in one of these forms:\n"
-                "1) { \"reasoning\": \"…\", \"next_tool\": \"tool_name\", \"args\": { … } }\n"
-                "2) { \"reasoning\": \"…\", \"final_response\": \"…\" }"
-            )
-        }
+        # 4b) log the tool calls in step order
+        trace.extend(sorted(entries, key=lambda e: e["step"]))
+        step += len(steps)
 
-        resp2 = await GPT.chat.completions.create(
-            model=MODEL,
-            messages=[
-                system_msg,
-                user_msg,
-                *trace_to_messages(trace),
-                prompt_tool,         # use assistant or user here
-                prompt_reflect
-            ]
-        )
-        choice = json.loads(resp2.choices[0].message.content)
-
-        trace.append({"step": step, "type": "reasoning", "reasoning": choice["reasoning"]})
+        # 4c) Ask GPT what to do next, feeding in all new tool results in one
+        #     turn; older outputs are summarized to keep the prompt within budget
+        turn = context.reflect_turn(trace, REFLECT_MSG)
+        async for event in _planner_step(turn, step, stream_tokens, PRIORITY_CONTINUE, root):
+            if event["event"] == "reasoning":
+                choice = event.pop("choice")
+                trace.append(event["data"])
+            yield event
         step += 1
 
-    # 8) Done!
-    return {"response": choice["final_response"], "trace": trace}
+    # 5) Done!
+    yield {"event": "final", "data": {"response": choice["final_response"], "trace": trace}}
+
+
+async def call_agent(query: str):
+    async for event in iter_call_agent(query):
+        if event["event"] == "final":
+            return event["data"]
@@ -0,0 +1,85 @@
+"""Helpers for streaming reasoning traces as server-sent events."""
+import json
+
+
+def format_sse(event: dict) -> str:
+    """Render one {"event": ..., "data": ...} dict as an SSE frame."""
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class FinalResponseExtractor:
+    """Pull the `final_response` string out of a planner reply while it streams.
+
+    The router's planner answers with a JSON object, so its text only becomes
+    user-visible once the `"final_response": "` key has been seen. `feed()`
+    takes each new chunk of the reply and returns the newly decoded part of
+    that string value. An escape sequence split across chunks is held back
+    until it is complete, so every character is decoded once however long
+    the reply grows.
+    """
+
+    KEY = '"final_response"'
+
+    def __init__(self):
+        self._head = ""       # reply text not yet known to be outside the value
+        self._in_value = False
+        self._tail = ""       # start of an escape sequence cut off by a chunk
+        self._closed = False
+
+    def feed(self, chunk: str) -> str:
+        if self._closed:
+            return ""
+        if not self._in_value:
+            chunk = self._value_text(chunk)
+            if chunk is None:
+                return ""
+        raw = self._tail + chunk
+        decoded, used, self._closed = self._decode(raw)
+        self._tail = raw[used:]
+        return decoded
+
+    def _value_text(self, chunk: str):
+        """The part of `chunk` inside the value, or None while still before it."""
+        head = self._head + chunk
+        key_at = head.find(self.KEY)
+        if key_at < 0:
+            # Only a key cut off by the chunk boundary needs to be kept
+            self._head = head[-(len(self.KEY) - 1):]
+            return None
+        colon_at = head.find(":", key_at + len(self.KEY))
+        quote_at = head.find('"', colon_at + 1) if colon_at >= 0 else -1
+        if quote_at < 0:
+            self._head = head[key_at:]
+            return None
+        self._head = ""
+        self._in_value = True
+        return head[quote_at + 1:]
+
+    @staticmethod
+    def _decode(raw: str) -> tuple:
+        """(decoded text, characters of `raw` consumed, closing quote reached)."""
+        out = []
+        i = 0
+        while i < len(raw):
+            ch = raw[i]
+            if ch == '"':
+                return "".join(out), i + 1, True
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            if i + 1 >= len(raw):
+                break
+            esc = raw[i + 1]
+            if esc == "u":
+                if i + 6 > len(raw):
+                    break
+                out.append(chr(int(raw[i + 2:i + 6], 16)))
+                i += 6
+            else:
+                out.append(_ESCAPES.get(esc, esc))
+                i += 2
+        return "".join(out), i, False
@@ -0,0 +1,96 @@
+"""All agent tool sets in one MCP server process over one shared dataset.
+
+The agent servers are imported as modules rather than launched, so the
+DataCo frame is loaded once (shared_dataset() is a process singleton) and
+every tool listed on the agent cards is mounted on a single FastMCP server.
+The cards still name the agents: the router's pool keeps routing and traces
+per card and only the process behind them changes.
+
+    python server/agent_host.py                                  # every python agent card
+    python server/agent_host.py --agents DelayStatsAgent,ForecastAgent
+    python server/agent_host.py --transport streamable-http --port 8051
+
+With AGENT_HOST_MODE=1 the router's agent pool launches cards through this
+host, and AGENT_REPLICAS=N runs N copies of it instead of 3N processes.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from mcp.server.fastmcp import FastMCP
+from router.registry import ADMIN_TOOL_PREFIX, AGENTS_DIR, load_agent_cards
+from server.dataset import register_dataset_resource, shared_dataset
+from server.ingest import register_ingestion
+from server.profiling import register_profiling_tools
+from server.transport import add_transport_args, serve
+
+
+def module_name(script: str) -> str:
+    """`server/supply_data_server.py` -> `server.supply_data_server`."""
+    return os.path.splitext(os.path.normpath(script))[0].replace(os.sep, ".")
+
+
+def module_tools(module) -> dict:
+    """name -> (function, description) of the module-level tools `module.mcp` serves.
+
+    `@mcp.tool()` returns the function it registers, so each tool is the
+    module attribute of the same name; tools registered by helpers (the
+    admin tools) are not module attributes and are left out.
+    """
+    tools = {}
+    for tool in asyncio.run(module.mcp.list_tools()):
+        fn = getattr(module, tool.name, None)
+        if callable(fn):
+            tools[tool.name] = (fn, tool.description)
+    return tools
+
+
+def build_host(cards: dict, agents=None) -> FastMCP:
+    host = FastMCP("AgentHost")
+    register_dataset_resource(host, shared_dataset())
+    register_profiling_tools(host)
+    register_ingestion(host, shared_dataset())
+
+    aggregates = {}
+    for card in cards.values():
+        if agents and card["name"] not in agents:
+            continue
+        if card["endpoint"] != "python" or not card.get("args"):
+            continue
+        module = importlib.import_module(module_name(card["args"][0]))
+        tools = module_tools(module)
+        # Every module registers the same admin tools; the host has its own
+        for name in card.get("tools") or [t for t in tools if not t.startswith(ADMIN_TOOL_PREFIX)]:
+            if name not in tools:
+                print(f"{card['name']}: card lists unknown tool {name}", file=sys.stderr)
+                continue
+            fn, description = tools[name]
+            host.add_tool(fn, name=name, description=description)
+        if hasattr(module, "aggregates"):
+            aggregates[card["name"]] = module.aggregates
+
+    @host.resource("stats://aggregates", mime_type="application/json")
+    def aggregate_stats() -> str:
+        return json.dumps({name: a.stats() for name, a in aggregates.items()})
+
+    return host
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve several agents' tools from one process")
+    parser.add_argument("--agents-dir", default=AGENTS_DIR)
+    parser.add_argument("--agents", help="comma-separated card names (default: all)")
+    add_transport_args(parser)
+    args = parser.parse_args()
+
+    agents = set(args.agents.split(",")) if args.agents else None
+    serve(build_host(load_agent_cards(args.agents_dir), agents), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Materialized aggregates for the agent servers' tools.
+
+Tools whose answer only depends on the loaded dataset (full-table group-bys,
+per-region breakdowns) register a builder here. The builders run once when
+the server loads its data, the results are stored under the dataset's
+version hash, and tool calls become dictionary lookups.
+
+Builders defined with a `merge` function are maintained incrementally: the
+builder returns a partial state (counts, sums) rather than the final value,
+and when rows are appended only the new rows go through the builder and are
+merged into the previous version's state; `finish` turns a state into the
+value tools read. Other builders are rebuilt on the new frame. Values for
+the latest AGGREGATE_KEEP_VERSIONS versions are kept so calls pinned to the
+previous version still hit.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from server.dataset import normalize
+from server.ingest import register_ingestion
+
+AGGREGATE_KEEP_VERSIONS = int(os.getenv("AGGREGATE_KEEP_VERSIONS", "2"))
+
+
+class Aggregates:
+    def __init__(self, dataset, keep_versions: int = AGGREGATE_KEEP_VERSIONS):
+        self.dataset = dataset
+        self.keep_versions = max(1, keep_versions)
+        self._builders = {}  # name -> (fn, merge, finish)
+        self._versions = OrderedDict()  # dataset version -> {name: (state, value)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.build_seconds = {}
+        self.extend_seconds = None
+
+    def define(self, name: str, merge=None, finish=None):
+        """Register `fn(df)` as the builder for aggregate `name`.
+
+        With `merge(old, new)`, `fn` returns a partial state that appended
+        rows are merged into, and `finish(state)` (identity by default)
+        produces the value.
+        """
+        def decorator(fn):
+            self._builders[name] = (fn, merge, finish)
+            return fn
+        return decorator
+
+    def _build(self, name: str, df: pd.DataFrame) -> tuple:
+        fn, _, finish = self._builders[name]
+        t0 = time.time()
+        state = fn(df)
+        value = finish(state) if finish else state
+        self.build_seconds[name] = round(time.time() - t0, 4)
+        return state, value
+
+    def _store(self, version: str, name: str, entry: tuple):
+        with self._lock:
+            values = self._versions.get(version)
+            if values is None:
+                values = self._versions[version] = {}
+                while len(self._versions) > self.keep_versions:
+                    self._versions.popitem(last=False)
+            values[name] = entry
+
+    def materialize(self) -> "Aggregates":
+        """Build every registered aggregate for the latest dataset version."""
+        latest = self.dataset.latest
+        built = self._versions.get(latest.version, {})
+        for name in self._builders:
+            if name not in built:
+                self._store(latest.version, name, self._build(name, latest.df))
+        return self
+
+    def extend(self, previous, new, rows: pd.DataFrame):
+        """Dataset.on_append hook: derive `new`'s aggregates from `previous`'s."""
+        t0 = time.time()
+        old = self._versions.get(previous.version, {})
+        for name, (fn, merge, finish) in self._builders.items():
+            if merge is not None and name in old:
+                state = merge(old[name][0], fn(rows))
+                entry = state, finish(state) if finish else state
+            else:
+                entry = self._build(name, new.df)
+            self._store(new.version, name, entry)
+        self.extend_seconds = round(time.time() - t0, 4)
+
+    def __getitem__(self, name: str):
+        view = self.dataset.view()
+        entry = self._versions.get(view.version, {}).get(name)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        entry = self._build(name, view.df)
+        # A call pinned to a version that was already dropped must not evict newer ones
+        if view is self.dataset.latest:
+            self._store(view.version, name, entry)
+        return entry[1]
+
+    def stats(self) -> dict:
+        return {
+            "dataset_version": self.dataset.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "aggregates": sorted(self._builders),
+            "incremental": sorted(n for n, (_, merge, _) in self._builders.items() if merge is not None),
+            "versions": list(self._versions),
+            "build_seconds": self.build_seconds,
+            "extend_seconds": self.extend_seconds,
+        }
+
+
+def normalized(column: pd.Series) -> pd.Series:
+    """Lowercased group keys, matching how ValueIndex looks values up."""
+    return column.map(normalize).rename(column.name)
+
+
+# -- mergeable partial states ------------------------------------------------
+
+def plain_keys(result):
+    """Replace categorical group keys with plain values, so partial states
+    built over different category sets line up when merged."""
+    index = result.index
+    if isinstance(index, pd.MultiIndex):
+        result.index = index.set_levels([level.astype(object) for level in index.levels])
+    else:
+        result.index = index.astype(object)
+    return result
+
+
+def add(old, new):
+    """Merge two count/sum states."""
+    return old.add(new, fill_value=0)
+
+
+def counts_of(column: pd.Series) -> pd.Series:
+    return plain_keys(column.value_counts())
+
+
+def sum_count(df: pd.DataFrame, keys, column: str) -> pd.DataFrame:
+    """Per-group sum and count of `column`: the mergeable state of a mean."""
+    return plain_keys(df.groupby(keys, observed=True)[column].agg(["sum", "count"]))
+
+
+def mean_of(state: pd.DataFrame) -> pd.Series:
+    return state["sum"] / state["count"]
+
+
+def describe_counts(counts: pd.Series) -> dict:
+    """Series.describe() of the values that `counts` (a value_counts) counted.
+
+    Exact, quantiles included, because the delay column only holds whole
+    days: the counts per value are the whole distribution.
+    """
+    counts = counts[counts > 0].sort_index()
+    values = counts.index.to_numpy(dtype=float)
+    weights = counts.to_numpy(dtype=float)
+    n = weights.sum()
+    if not n:
+        return pd.Series([], dtype=float).describe().to_dict()
+    mean = (values * weights).sum() / n
+    std = math.sqrt(((values - mean) ** 2 * weights).sum() / (n - 1)) if n > 1 else float("nan")
+    cumulative = np.cumsum(weights)
+
+    def quantile(q: float) -> float:
+        # pandas' default linear interpolation between order statistics
+        pos = q * (n - 1)
+        lo, hi = math.floor(pos), math.ceil(pos)
+        v_lo = values[np.searchsorted(cumulative, lo, side="right")]
+        v_hi = values[np.searchsorted(cumulative, hi, side="right")]
+        return float(v_lo + (v_hi - v_lo) * (pos - lo))
+
+    return {
+        "count": float(n),
+        "mean": float(mean),
+        "std": std,
+        "min": float(values[0]),
+        "25%": quantile(0.25),
+        "50%": quantile(0.5),
+        "75%": quantile(0.75),
+        "max": float(values[-1]),
+    }
+
+
+def register_stats_resource(mcp, aggregates: Aggregates):
+    """Expose the cache counters as an MCP resource (not a tool, so the LLM never sees it)."""
+    @mcp.resource("stats://aggregates", mime_type="application/json")
+    def aggregate_stats() -> str:
+        return json.dumps(aggregates.stats())
+
+
+def register_dataset_hooks(mcp, dataset, aggregates: Aggregates):
+    """Keep `aggregates` in step with `dataset` and let `mcp` append to it.
+
+    Call it after the last `define`: aggregates are built on the loader thread
+    as soon as the data is in (right away if it already is), and extended from
+    the new rows on every append.
+    """
+    dataset.on_ready(aggregates.materialize)
+    dataset.on_append(aggregates.extend)
+    register_ingestion(mcp, dataset)
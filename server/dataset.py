@@ -0,0 +1,496 @@
+"""Shared DataCo dataset layer for the agent servers.
+
+The raw CSV is converted once into a columnar snapshot that only holds the
+columns the tools read, with region/product/shipping mode/status stored as
+categoricals and the order/ship dates already parsed. Servers load that
+snapshot memory-mapped instead of re-parsing the CSV.
+
+Rebuild the snapshot after the CSV changes with:
+
+    python server/dataset.py build
+
+Servers load the dataset on a background thread so their MCP endpoint
+answers `initialize` immediately; tools wrapped with `requires_dataset`
+wait for it (off the event loop) and fail fast with a "warming up" error if
+it takes longer than DATASET_WAIT_TIMEOUT.
+
+New orders are appended without a restart (`Dataset.append`, fed by
+server/ingest.py). Each append publishes a new immutable DataVersion: only
+the new rows are parsed and get their derived columns, the lookup indexes
+and registered aggregates are extended rather than rebuilt, and a tool call
+reads the version that was current when it started until it returns.
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server.profiling import PROFILER
+from telemetry.metrics import METRICS, TOOL_BODY_SECONDS
+
+CSV_PATH = os.getenv("DATACO_CSV", "data/DataCoSupplyChainDataset.csv")
+SNAPSHOT_PATH = os.getenv("DATACO_SNAPSHOT", "data/DataCoSupplyChainDataset.feather")
+DATASET_BACKGROUND_LOAD = os.getenv("DATASET_BACKGROUND_LOAD", "1") == "1"
+DATASET_WAIT_TIMEOUT = float(os.getenv("DATASET_WAIT_TIMEOUT", "30"))
+
+# Raw CSV columns the tools need, with their compact dtypes
+RAW_COLUMNS = {
+    "Order Id": "int32",
+    "Order Region": "category",
+    "Product Name": "category",
+    "Shipping Mode": "category",
+    "Product Status": "category",
+    "Sales": "float64",
+    "Order Item Quantity": "int32",
+    "Days for shipment (scheduled)": "int16",
+    "order date (DateOrders)": "object",
+    "shipping date (DateOrders)": "object",
+}
+
+
+def prepare(raw: pd.DataFrame) -> pd.DataFrame:
+    """Reduce raw DataCo rows to the tool columns and derive the date fields."""
+    df = raw[list(RAW_COLUMNS)].astype(RAW_COLUMNS)
+    df["Order_Date"] = pd.to_datetime(df.pop("order date (DateOrders)"), errors="coerce")
+    df["Ship_Date"] = pd.to_datetime(df.pop("shipping date (DateOrders)"), errors="coerce")
+    df["Scheduled_Ship_Date"] = df["Order_Date"] + pd.to_timedelta(df["Days for shipment (scheduled)"], unit="D")
+    df["Delivery_Delay_Days"] = (df["Ship_Date"] - df["Scheduled_Ship_Date"]).dt.days
+    return df
+
+
+def read_raw(csv_path: str = CSV_PATH) -> pd.DataFrame:
+    return pd.read_csv(csv_path, encoding="ISO-8859-1", usecols=list(RAW_COLUMNS))
+
+
+def read_csv(csv_path: str = CSV_PATH) -> pd.DataFrame:
+    return prepare(read_raw(csv_path))
+
+
+def append_rows(df: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """A new frame of `df` followed by `rows` (both already prepared).
+
+    Categorical columns keep df's codes and gain any new values as extra
+    categories, so existing group keys and index positions stay valid.
+    """
+    columns = {}
+    for name in df.columns:
+        old, new = df[name], rows[name]
+        if isinstance(old.dtype, pd.CategoricalDtype):
+            categories = old.cat.categories
+            if new.cat.categories.dtype != categories.dtype:
+                new = new.cat.rename_categories(new.cat.categories.astype(categories.dtype))
+            columns[name] = union_categoricals([old.array, new.array])
+        else:
+            columns[name] = pd.concat([old, new], ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def build_snapshot(csv_path: str = CSV_PATH, snapshot_path: str = SNAPSHOT_PATH) -> pd.DataFrame:
+    """Convert the CSV into an uncompressed Feather file (so it can be mmapped)."""
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    df = read_csv(csv_path)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    # Atomic swap, so concurrently starting servers never read a partial file
+    os.replace(tmp_path, snapshot_path)
+    return df
+
+
+def snapshot_is_fresh(csv_path: str = CSV_PATH, snapshot_path: str = SNAPSHOT_PATH) -> bool:
+    if not os.path.exists(snapshot_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(snapshot_path) >= os.path.getmtime(csv_path)
+
+
+def read_snapshot(snapshot_path: str = SNAPSHOT_PATH) -> pd.DataFrame:
+    import pyarrow.feather as feather
+
+    table = feather.read_table(snapshot_path, memory_map=True)
+    # split_blocks keeps numeric columns zero-copy views onto the mapping
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def normalize(value) -> str:
+    return str(value).lower()
+
+
+class ValueIndex:
+    """Case-insensitive map from a categorical column's values to row positions.
+
+    Built from the categorical codes in one stable sort, so every position
+    array is ascending and a lookup costs O(matching rows) instead of
+    lowercasing the whole column.
+    """
+
+    _EMPTY = np.empty(0, dtype=np.int64)
+
+    def __init__(self, column: pd.Series):
+        categories = column.cat.categories
+        codes = column.cat.codes.to_numpy()
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+        # Rows with a missing value (code -1) sort first; skip past them
+        groups = np.split(order[len(codes) - counts.sum():], np.cumsum(counts)[:-1])
+
+        self.names = {}
+        self._positions = {}
+        for name, positions in zip(categories, groups):
+            if not len(positions):
+                continue
+            key = normalize(name)
+            self.names.setdefault(key, []).append(name)
+            if key in self._positions:
+                positions = np.sort(np.concatenate([self._positions[key], positions]))
+            self._positions[key] = positions
+
+    def __contains__(self, value) -> bool:
+        return normalize(value) in self._positions
+
+    def positions(self, value) -> np.ndarray:
+        return self._positions.get(normalize(value), self._EMPTY)
+
+    def positions_any(self, values) -> np.ndarray:
+        found = [self.positions(v) for v in values]
+        found = [p for p in found if len(p)]
+        if not found:
+            return self._EMPTY
+        return found[0] if len(found) == 1 else np.unique(np.concatenate(found))
+
+    def extended(self, column: pd.Series, offset: int) -> "ValueIndex":
+        """A new index that also covers `column`, the rows appended at `offset`.
+
+        Untouched keys share their arrays with this index, which stays valid
+        for readers of the previous version.
+        """
+        added = ValueIndex(column)
+        merged = ValueIndex.__new__(ValueIndex)
+        merged.names = {key: list(names) for key, names in self.names.items()}
+        merged._positions = dict(self._positions)
+        for key, positions in added._positions.items():
+            positions = positions + offset
+            old = merged._positions.get(key)
+            merged._positions[key] = positions if old is None else np.concatenate([old, positions])
+            known = merged.names.setdefault(key, [])
+            known.extend(n for n in added.names[key] if n not in known)
+        return merged
+
+
+class DataVersion:
+    """One immutable state of the dataset: the frame, its lookup indexes and its version."""
+
+    __slots__ = ("df", "regions", "products", "version", "generation", "appended_rows")
+
+    def __init__(self, df: pd.DataFrame, regions: ValueIndex, products: ValueIndex, version: str,
+                 generation: int = 0, appended_rows: int = 0):
+        self.df = df
+        self.regions = regions
+        self.products = products
+        self.version = version
+        self.generation = generation
+        self.appended_rows = appended_rows
+
+
+def _view_attr(name: str):
+    return property(lambda self: getattr(self.view(), name, None))
+
+
+class Dataset:
+    """The DataCo frame shared by every tool in a server process."""
+
+    # The version pinned by the running tool call, else the latest one
+    df = _view_attr("df")
+    regions = _view_attr("regions")
+    products = _view_attr("products")
+    version = _view_attr("version")
+
+    def __init__(self, csv_path: str = CSV_PATH, snapshot_path: str = SNAPSHOT_PATH):
+        self.csv_path = csv_path
+        self.snapshot_path = snapshot_path
+        self.source = None
+        self.load_seconds = None
+        self.ready = threading.Event()
+        self.error = None
+        self.last_append = None
+        self._on_ready = []
+        self._ready_lock = threading.Lock()
+        self._on_append = []
+        self._latest = None
+        self._pinned = contextvars.ContextVar(f"dataset-{id(self)}", default=None)
+        self._append_lock = threading.Lock()
+
+    @property
+    def latest(self) -> DataVersion:
+        return self._latest
+
+    def view(self) -> DataVersion:
+        pinned = self._pinned.get()
+        return pinned if pinned is not None else self._latest
+
+    @contextlib.contextmanager
+    def pin(self):
+        """Read one version for the whole block, whatever appends happen meanwhile."""
+        token = self._pinned.set(self._latest)
+        try:
+            yield self._latest
+        finally:
+            self._pinned.reset(token)
+
+    def on_ready(self, fn):
+        """Run `fn()` once the dataset is loaded (right away if it already is)."""
+        with self._ready_lock:
+            if not self.ready.is_set():
+                self._on_ready.append(fn)
+                return
+        if self.error is None:
+            fn()
+
+    def start(self, background: bool = DATASET_BACKGROUND_LOAD) -> "Dataset":
+        """Load the dataset, on a daemon thread unless `background` is False."""
+        if background:
+            threading.Thread(target=self._load_and_signal, name="dataset-load", daemon=True).start()
+        else:
+            self._load_and_signal()
+        return self
+
+    def _load_and_signal(self):
+        try:
+            self.load()
+        except Exception as e:
+            self._fail(e)
+        while True:
+            # Callbacks registered while earlier ones ran are picked up by the
+            # next pass; `ready` is set under the same lock as the final swap
+            with self._ready_lock:
+                callbacks, self._on_ready = self._on_ready, []
+                if not callbacks:
+                    self.ready.set()
+                    return
+            if self.error is not None:
+                continue
+            try:
+                for fn in callbacks:
+                    fn()
+            except Exception as e:
+                self._fail(e)
+
+    def _fail(self, error: Exception):
+        self.error = error
+        print(f"Dataset failed to load: {error!r}", file=sys.stderr)
+
+    @property
+    def state(self) -> str:
+        if not self.ready.is_set():
+            return "loading"
+        return "failed" if self.error is not None else "ready"
+
+    def on_append(self, fn):
+        """Run `fn(previous, new, rows)` for every append, before `new` is published.
+
+        `rows` are the appended rows of new.df; an exception aborts the append.
+        """
+        self._on_append.append(fn)
+
+    def load(self) -> "Dataset":
+        t0 = time.time()
+        try:
+            if snapshot_is_fresh(self.csv_path, self.snapshot_path):
+                df, self.source = read_snapshot(self.snapshot_path), "snapshot"
+            else:
+                df, self.source = build_snapshot(self.csv_path, self.snapshot_path), "csv"
+        except ImportError:
+            # pyarrow not installed: fall back to parsing the CSV in-process
+            df, self.source = read_csv(self.csv_path), "csv"
+        self._latest = DataVersion(
+            df, ValueIndex(df["Order Region"]), ValueIndex(df["Product Name"]), self._fingerprint(df),
+        )
+        self.load_seconds = round(time.time() - t0, 3)
+        return self
+
+    def _fingerprint(self, df: pd.DataFrame) -> str:
+        path = self.snapshot_path if self.source == "snapshot" else self.csv_path
+        st = os.stat(path)
+        key = f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}:{len(df)}"
+        return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+    def append(self, raw: pd.DataFrame, source: str = None) -> dict:
+        """Append raw DataCo rows and publish them as a new version.
+
+        Only the new rows are prepared; the frame's columns are copied once
+        into the new version while readers keep using the previous one.
+        Appends are serialized. CPU-bound: call it off the event loop.
+        """
+        if self.state != "ready":
+            raise DatasetWarmingUp(f"Dataset is {self.state}; cannot append rows yet.")
+        missing = [c for c in RAW_COLUMNS if c not in raw.columns]
+        if missing:
+            raise ValueError(f"Rows are missing columns: {missing}")
+        rows = prepare(raw)
+        t0 = time.time()
+        with self._append_lock:
+            previous = self._latest
+            if not len(rows):
+                return {"version": previous.version, "rows_added": 0, "rows": len(previous.df)}
+            offset = len(previous.df)
+            df = append_rows(previous.df, rows)
+            added = df.iloc[offset:]
+            digest = pd.util.hash_pandas_object(rows, index=False).sum()
+            new = DataVersion(
+                df,
+                previous.regions.extended(added["Order Region"], offset),
+                previous.products.extended(added["Product Name"], offset),
+                hashlib.sha1(f"{previous.version}:{len(rows)}:{digest}".encode()).hexdigest()[:12],
+                previous.generation + 1,
+                previous.appended_rows + len(rows),
+            )
+            for fn in self._on_append:
+                fn(previous, new, added)
+            self._latest = new
+            self.last_append = {
+                "previous_version": previous.version,
+                "version": new.version,
+                "rows_added": len(rows),
+                "rows": len(df),
+                "generation": new.generation,
+                "seconds": round(time.time() - t0, 4),
+                "source": source,
+                "at": time.time(),
+            }
+            return dict(self.last_append)
+
+    def info(self) -> dict:
+        info = {
+            "version": self.version,
+            "ready": self.state == "ready",
+            "state": self.state,
+            "rows": 0 if self.df is None else len(self.df),
+            "source": self.source,
+            "load_seconds": self.load_seconds,
+        }
+        if self._latest is not None and self._latest.generation:
+            info["generation"] = self._latest.generation
+            info["appended_rows"] = self._latest.appended_rows
+            info["last_append"] = self.last_append
+        if self.error is not None:
+            info["error"] = repr(self.error)
+        return info
+
+    def vocabulary(self) -> dict:
+        """Region and product spellings, for matching them in free-text queries."""
+        if self.state != "ready":
+            return {"version": None, "regions": [], "products": []}
+        return {
+            "version": self.version,
+            "regions": sorted(n for names in self.regions.names.values() for n in names),
+            "products": sorted(n for names in self.products.names.values() for n in names),
+        }
+
+    def region_rows(self, region: str) -> pd.DataFrame:
+        return self.df.iloc[self.regions.positions(region)]
+
+    def regions_rows(self, regions) -> pd.DataFrame:
+        return self.df.iloc[self.regions.positions_any(regions)]
+
+    def product_rows(self, product: str) -> pd.DataFrame:
+        return self.df.iloc[self.products.positions(product)]
+
+
+_shared = None
+
+
+def shared_dataset() -> Dataset:
+    """The process-wide Dataset; loading starts (in the background) on first use."""
+    global _shared
+    if _shared is None:
+        _shared = Dataset().start()
+    return _shared
+
+
+class DatasetWarmingUp(RuntimeError):
+    pass
+
+
+def requires_dataset(dataset: Dataset, timeout: float = DATASET_WAIT_TIMEOUT):
+    """Make a tool wait for the dataset instead of reading a half-loaded one.
+
+    The wait happens in a worker thread so the server keeps answering pings
+    and other requests meanwhile. Raising (rather than returning a message)
+    marks the result as an error, so clients never cache it. The call reads
+    one dataset version throughout, and sampled or flagged calls run under
+    the profiler (see server/profiling.py).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not dataset.ready.is_set():
+                await asyncio.to_thread(dataset.ready.wait, timeout)
+            if not dataset.ready.is_set():
+                raise DatasetWarmingUp("Dataset is still loading (warming up); try again shortly.")
+            if dataset.error is not None:
+                raise RuntimeError(f"Dataset failed to load: {dataset.error!r}")
+            with TOOL_BODY_SECONDS.time(tool=fn.__name__), dataset.pin():
+                if PROFILER.active:
+                    return PROFILER.run(fn.__name__, fn, *args, **kwargs)
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register_dataset_resource(mcp, dataset: Dataset):
+    """Expose the dataset version and load stats as the dataset://info resource,
+    the known regions and products as dataset://vocabulary, and the process's
+    metrics as metrics://server."""
+    @mcp.resource("dataset://info", mime_type="application/json")
+    def dataset_info() -> str:
+        return json.dumps(dataset.info())
+
+    @mcp.resource("dataset://vocabulary", mime_type="application/json")
+    def dataset_vocabulary() -> str:
+        return json.dumps(dataset.vocabulary())
+
+    METRICS.gauge("dataset_load_seconds", "Seconds the dataset took to load", lambda: dataset.load_seconds)
+    METRICS.gauge("dataset_ready", "1 once the dataset is loaded", lambda: int(dataset.state == "ready"))
+    METRICS.gauge("dataset_rows", "Rows in the loaded dataset", lambda: 0 if dataset.df is None else len(dataset.df))
+    METRICS.gauge("dataset_appended_rows", "Rows appended since the dataset was loaded",
+                  lambda: 0 if dataset.latest is None else dataset.latest.appended_rows)
+
+    # The server's metrics (tool body timings above all), merged into the
+    # API's /metrics output per agent process
+    @mcp.resource("metrics://server", mime_type="application/json")
+    def server_metrics() -> str:
+        return json.dumps(METRICS.snapshot())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the DataCo columnar snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="(re)generate the snapshot from the CSV")
+    build.add_argument("--csv", default=CSV_PATH)
+    build.add_argument("--out", default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        t0 = time.time()
+        df = build_snapshot(args.csv, args.out)
+        print(f"Wrote {len(df):,} rows to {args.out} in {time.time() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
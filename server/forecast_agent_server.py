@@ -1,58 +1,108 @@
 import os
 import sys
-import pandas as pd
+import numpy as np
 from mcp.server.fastmcp import FastMCP
 
 # So it can find your project modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from server.aggregates import Aggregates, add, plain_keys, register_dataset_hooks, register_stats_resource
+from server.dataset import normalize, register_dataset_resource, requires_dataset, shared_dataset
+from server.forecasting import FORECAST_FREQ, DemandModel, merge_models
+from server.profiling import register_profiling_tools
+from server.transport import serve
+
 # Create a new MCP server
 mcp = FastMCP("ForecastAgent")
 
-# Load your dataset
-df = pd.read_csv("data/DataCoSupplyChainDataset.csv", encoding="ISO-8859-1")
-df["Order_Date"] = pd.to_datetime(df["order date (DateOrders)"], errors="coerce")
+# Load your dataset (columnar snapshot, Order_Date already parsed)
+dataset = shared_dataset()
+register_dataset_resource(mcp, dataset)
+register_profiling_tools(mcp)
+aggregates = Aggregates(dataset)
+register_stats_resource(mcp, aggregates)
+
+@aggregates.define("region_sales", merge=add)
+def _region_sales(df):
+    return plain_keys(df.groupby("Order Region", observed=True)["Sales"].sum())
+
+# Holt-Winters models of every region and region x product series; appended
+# rows are folded in with the cached parameters (see server/forecasting.py)
+@aggregates.define("demand_model", merge=merge_models, finish=DemandModel.fit)
+def _demand_model(df):
+    return DemandModel.from_frame(df)
+
+register_dataset_hooks(mcp, dataset, aggregates)
+
+def _region_names(regions) -> list:
+    """Dataset spellings of the requested regions (case-insensitive, deduplicated)."""
+    names = []
+    for region in regions:
+        for name in dataset.regions.names.get(normalize(region), []):
+            if name not in names:
+                names.append(name)
+    return names
 
 @mcp.tool()
+@requires_dataset(dataset)
 def total_sales_by_region(region: str) -> str:
-    filtered = df[df["Order Region"].str.lower() == region.lower()]
-    total = filtered["Sales"].sum()
+    total = aggregates["region_sales"].reindex(_region_names([region])).sum()
     return f"Total sales in {region}: ${total:,.2f}"
 
+PERIOD_NAMES = {"M": "month", "W": "week", "Q": "quarter", "D": "day"}
+
+def _money(value: float) -> str:
+    return f"${value:,.2f}"
+
 # Define a tool that forecasts demand
 @mcp.tool()
-def forecast_demand(regions: list) -> str:
-    """Forecast demand in one or more regions.
+@requires_dataset(dataset)
+def forecast_demand(regions: list, horizon: int = 3, top_products: int = 3) -> str:
+    """Forecast demand (sales) in one or more regions.
 
     Args:
         regions: List of region names like 'South Asia', 'Europe', etc.
+        horizon: Number of periods (months by default) to forecast.
+        top_products: Products with the highest forecast listed per region.
 
     Returns:
-        A text summary of total sales per region, indicating demand levels.
+        Per-period point forecasts with 80% and 95% intervals for each region,
+        and its top products over the horizon.
     """
-    print(f"Forecast tool called with regions: {regions}")
     if not regions:
         return "⚠️ No regions provided."
 
-    filtered_df = df[df['Order Region'].isin(regions)]
-    if filtered_df.empty:
+    names = _region_names(regions)
+    if not names:
         return f"⚠️ No data found for regions: {', '.join(regions)}"
 
-    summary = (
-        filtered_df.groupby('Order Region')['Sales']
-        .sum()
-        .sort_values(ascending=False)
-        .to_frame()
-        .reset_index()
-    )
-
-    result_str = "📈 Demand Forecast Summary:\n"
-    for _, row in summary.iterrows():
-        result_str += f"- {row['Order Region']}: ${row['Sales']:.2f}\n"
+    model = aggregates["demand_model"]
+    forecast = model.forecast([(name, None) for name in names], horizon)
+    if not forecast["keys"] or model.periods < 2:
+        return f"⚠️ Not enough sales history to forecast {', '.join(names)}"
 
-    return result_str
+    unit = PERIOD_NAMES.get(FORECAST_FREQ, "period")
+    lines = [f"📈 Demand Forecast (sales per {unit}, Holt-Winters over {model.periods} {unit}s of history):"]
+    totals = forecast["mean"].sum(axis=1)
+    for i in np.argsort(-totals, kind="stable"):
+        region = forecast["keys"][i][0]
+        lines.append(f"- {region}: {_money(totals[i])} over the next {len(forecast['periods'])} {unit}(s)")
+        for j, period in enumerate(forecast["periods"]):
+            lines.append(
+                f"    {period}: {_money(forecast['mean'][i, j])} "
+                f"(80%: {_money(forecast['lower'][80][i, j])}–{_money(forecast['upper'][80][i, j])}, "
+                f"95%: {_money(forecast['lower'][95][i, j])}–{_money(forecast['upper'][95][i, j])})"
+            )
+        if top_products > 0:
+            products = model.forecast(model.products_in(region), horizon)
+            product_totals = products["mean"].sum(axis=1)
+            top = np.argsort(-product_totals, kind="stable")[:top_products]
+            lines.append("    Top products: " + ", ".join(
+                f"{products['keys'][k][1]} ({_money(product_totals[k])})" for k in top
+            ))
+    return "\n".join(lines) + "\n"
 
 
-# Run as an MCP stdio server
+# Run as an MCP server (stdio unless --transport says otherwise)
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    serve(mcp)
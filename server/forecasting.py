@@ -0,0 +1,317 @@
+"""Demand forecasts for the forecast agent: Holt-Winters over every series at once.
+
+Sales are summed per FORECAST_FREQ period (months by default) for every
+region x product series and every region total. Each series gets an additive
+Holt-Winters model with a damped trend. The model is written in
+error-correction form:
+
+    e = y - (level + phi * trend + season[t])
+    level  += phi * trend + alpha * e        (before adding, trend *= phi)
+    trend   = phi * trend + beta * e
+    season[t] += gamma * e
+
+The recursion runs over time, and each step updates every series (and, while
+fitting, every candidate parameter set) as one NumPy array operation. Fitting
+is a grid search: all (alpha, beta, gamma) candidates run side by side, and
+each series keeps the one with the lowest one-step-ahead squared error.
+Series are processed in chunks so the seasonal state stays under
+FORECAST_CHUNK_CELLS values.
+
+The period holding the latest order is still open. It is forecast rather
+than fitted, so it is the first forecast period.
+
+The fitted parameters and end states are kept on the model. When rows are
+appended (see server/ingest.py), the new model reuses them:
+
+* Series with new closed periods just run those few steps from the cached
+  state.
+* New series are fitted on their own.
+* The grid search runs again only for backdated rows, or once
+  FORECAST_REFIT_PERIODS new periods have closed since the last search.
+
+Intervals come from each series' one-step error variance and the ETS(A,Ad,A)
+h-step variance.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from server.aggregates import add
+
+# pandas period alias the history is bucketed by, and periods per season
+FORECAST_FREQ = os.getenv("FORECAST_FREQ", "M")
+FORECAST_SEASON = int(os.getenv("FORECAST_SEASON", "12"))
+FORECAST_METRIC = os.getenv("FORECAST_METRIC", "Sales")
+FORECAST_DAMPING = float(os.getenv("FORECAST_DAMPING", "0.98"))
+FORECAST_MAX_HORIZON = int(os.getenv("FORECAST_MAX_HORIZON", "24"))
+# Closed periods after which appends re-run the parameter search
+FORECAST_REFIT_PERIODS = int(os.getenv("FORECAST_REFIT_PERIODS", "3"))
+# Candidates x series x season values held in memory while fitting
+FORECAST_CHUNK_CELLS = int(os.getenv("FORECAST_CHUNK_CELLS", "4000000"))
+
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.8)
+BETAS = (0.0, 0.01, 0.05, 0.1)
+GAMMAS = (0.0, 0.05, 0.1, 0.3)
+# Two-sided normal quantiles
+Z = {80: 1.2816, 95: 1.96}
+
+_NAT = np.iinfo(np.int64).min
+
+
+def period_sums(df: pd.DataFrame, freq: str = FORECAST_FREQ, metric: str = FORECAST_METRIC) -> pd.Series:
+    """`metric` summed per (region, product, period ordinal)."""
+    ordinals = df["Order_Date"].dt.to_period(freq).array.asi8
+    dated = ordinals != _NAT
+    keys = [
+        df["Order Region"].to_numpy(dtype=object)[dated],
+        df["Product Name"].to_numpy(dtype=object)[dated],
+        ordinals[dated],
+    ]
+    sums = pd.Series(df[metric].to_numpy(dtype=float)[dated]).groupby(keys).sum()
+    sums.index.names = ["Order Region", "Product Name", "period"]
+    return sums
+
+
+def _grid(seasonal: bool) -> tuple:
+    candidates = [
+        (a, b, g)
+        for a in ALPHAS for b in BETAS for g in (GAMMAS if seasonal else (0.0,))
+        if b <= a and g <= 1 - a
+    ]
+    return tuple(np.array(c) for c in zip(*candidates))
+
+
+def _initial(Y: np.ndarray, first: int, m: int, seasonal: bool) -> tuple:
+    """Classic start values: the first season's mean, the change to the
+    second season's mean, and deviations from the first season's mean."""
+    n = len(Y)
+    season = np.zeros((n, m))
+    if seasonal:
+        level = Y[:, :m].mean(axis=1)
+        trend = (Y[:, m:2 * m].mean(axis=1) - level) / m
+        # Seasonal slots are indexed by absolute period, so they survive a new origin
+        slots = (first + np.arange(m)) % m
+        season[:, slots] = Y[:, :m] - level[:, None]
+    else:
+        level = Y[:, :min(len(Y[0]), 3)].mean(axis=1)
+        trend = np.zeros(n)
+    return level, trend, season
+
+
+def _filter(Y, cols, first, m, warmup, alpha, beta, gamma, phi, level, trend, season):
+    """Run the recursion over `cols` of Y, updating the states in place.
+
+    Params broadcast against the states: (candidates, 1) while fitting, (n,)
+    afterwards. Returns the squared one-step errors of periods past `warmup`.
+    """
+    sse = np.zeros(level.shape)
+    for t in cols:
+        slot = (first + t) % m
+        trend *= phi
+        e = Y[:, t] - (level + trend + season[..., slot])
+        if t >= warmup:
+            sse += e * e
+        level += trend + alpha * e
+        trend += beta * e
+        season[..., slot] += gamma * e
+    return sse
+
+
+class DemandModel:
+    """Fitted Holt-Winters models for every region x product and region series.
+
+    `period_sums(df)` -> DemandModel(sums) -> fit(); appended rows become a
+    DemandModel of their own that `merged` folds in. Instances are not
+    changed once fitted, so tool calls can share them across versions.
+    """
+
+    def __init__(self, sums: pd.Series, freq: str = FORECAST_FREQ, m: int = FORECAST_SEASON,
+                 phi: float = FORECAST_DAMPING):
+        self.sums = sums
+        self.freq = freq
+        self.m = max(1, m)
+        self.phi = phi
+        self.fitted = False
+        self.mode = None
+        self.fit_seconds = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "DemandModel":
+        return cls(period_sums(df))
+
+    # -- history -------------------------------------------------------------
+
+    def _history(self):
+        ordinals = self.sums.index.get_level_values("period")
+        self.first = int(ordinals.min()) if len(ordinals) else 0
+        # The latest order's period is open: fit up to the one before it
+        self.last = int(ordinals.max()) if len(ordinals) else 0
+        self.periods = self.last - self.first
+        self.seasonal = self.m > 1 and self.periods >= 2 * self.m
+        self.warmup = self.m if self.seasonal else 1
+
+        closed = self.sums[ordinals < self.last]
+        totals = closed.groupby(level=["Order Region", "period"]).sum()
+        pairs = closed.index.droplevel("period")
+        products = pairs.unique()
+        regions = totals.index.get_level_values("Order Region")
+        region_names = regions.unique()
+        self.keys = list(products) + [(region, None) for region in region_names]
+        self.rows = {key: i for i, key in enumerate(self.keys)}
+
+        Y = np.zeros((len(self.keys), self.periods))
+        Y[products.get_indexer(pairs), closed.index.get_level_values("period") - self.first] = closed.to_numpy()
+        Y[len(products) + region_names.get_indexer(regions),
+          totals.index.get_level_values("period") - self.first] = totals.to_numpy()
+        return Y
+
+    def _allocate(self, n: int):
+        self.alpha, self.beta, self.gamma = np.zeros(n), np.zeros(n), np.zeros(n)
+        self.level, self.trend = np.zeros(n), np.zeros(n)
+        self.season = np.zeros((n, self.m))
+        self.sse = np.zeros(n)
+
+    # -- fitting -------------------------------------------------------------
+
+    def fit(self) -> "DemandModel":
+        """Search the parameters of every series (idempotent)."""
+        if self.fitted:
+            return self
+        t0 = time.time()
+        Y = self._history()
+        self._allocate(len(Y))
+        self._search(Y, np.arange(len(Y)))
+        self.searched_at = self.last
+        self._done("full", t0)
+        return self
+
+    def _search(self, Y, series):
+        """Grid-search the parameters of `series` (row numbers) over all of Y's periods."""
+        if not len(series) or self.periods < 2:
+            return
+        A, B, G = (p[:, None] for p in _grid(self.seasonal))
+        chunk = max(1, FORECAST_CHUNK_CELLS // (len(A) * self.m))
+        for lo in range(0, len(series), chunk):
+            rows = series[lo:lo + chunk]
+            level, trend, season = _initial(Y[rows], self.first, self.m, self.seasonal)
+            shape = (len(A), len(rows))
+            level, trend = np.broadcast_to(level, shape).copy(), np.broadcast_to(trend, shape).copy()
+            season = np.broadcast_to(season, shape + (self.m,)).copy()
+            sse = _filter(Y[rows], range(self.periods), self.first, self.m, self.warmup,
+                          A, B, G, self.phi, level, trend, season)
+            best = sse.argmin(axis=0)
+            pick = np.arange(len(rows))
+            self.alpha[rows], self.beta[rows], self.gamma[rows] = A[best, 0], B[best, 0], G[best, 0]
+            self.level[rows], self.trend[rows] = level[best, pick], trend[best, pick]
+            self.season[rows], self.sse[rows] = season[best, pick], sse[best, pick]
+
+    def _rerun(self, Y, series):
+        """Re-run `series` from the start with their current parameters."""
+        if not len(series) or self.periods < 2:
+            return
+        level, trend, season = _initial(Y[series], self.first, self.m, self.seasonal)
+        self.sse[series] = _filter(Y[series], range(self.periods), self.first, self.m, self.warmup,
+                                   self.alpha[series], self.beta[series], self.gamma[series], self.phi,
+                                   level, trend, season)
+        self.level[series], self.trend[series], self.season[series] = level, trend, season
+
+    def merged(self, rows: "DemandModel") -> "DemandModel":
+        """A fitted model of this history plus `rows` (an unfitted model of
+        appended rows), reusing this model's parameters and states."""
+        t0 = time.time()
+        new = DemandModel(add(self.sums, rows.sums), self.freq, self.m, self.phi)
+        Y = new._history()
+        new._allocate(len(Y))
+        touched = rows.sums.index.get_level_values("period")
+        backdated = len(touched) and touched.min() < self.last
+        if (not self.fitted or new.first != self.first or new.seasonal != self.seasonal
+                or new.last - self.searched_at >= FORECAST_REFIT_PERIODS):
+            new._search(Y, np.arange(len(Y)))
+            new.searched_at = new.last
+            new._done("full", t0)
+            return new
+
+        new.searched_at = self.searched_at
+        known = np.array([k in self.rows for k in new.keys], dtype=bool)
+        old = np.array([self.rows[k] for k in new.keys if k in self.rows], dtype=int)
+        series = np.flatnonzero(known)
+        for name in ("alpha", "beta", "gamma", "level", "trend", "season", "sse"):
+            getattr(new, name)[series] = getattr(self, name)[old]
+        if backdated:
+            # A closed period changed: the cached end states are stale
+            new._rerun(Y, series)
+            mode = "rerun"
+        else:
+            # Periods that closed since: from the cached states onwards
+            cols = range(self.periods, new.periods)
+            season = new.season[series]
+            level, trend = new.level[series], new.trend[series]
+            new.sse[series] += _filter(Y[series], cols, new.first, new.m, new.warmup,
+                                       new.alpha[series], new.beta[series], new.gamma[series], new.phi,
+                                       level, trend, season)
+            new.level[series], new.trend[series], new.season[series] = level, trend, season
+            mode = "incremental"
+        new._search(Y, np.flatnonzero(~known))
+        new._done(mode, t0)
+        return new
+
+    def _done(self, mode: str, t0: float):
+        self.fitted = True
+        self.mode = mode
+        self.fit_seconds = round(time.time() - t0, 4)
+
+    # -- forecasting ---------------------------------------------------------
+
+    def period_label(self, ordinal: int) -> str:
+        return str(pd.Period(ordinal=int(ordinal), freq=self.freq))
+
+    def forecast(self, keys, horizon: int) -> dict:
+        """Point forecasts and 80%/95% intervals for `horizon` periods after the
+        last closed one, for the `keys` that have a model.
+
+        Returns {"periods": [labels], "keys": [...], "mean": (n, h) array,
+        "lower"/"upper": {level: (n, h) array}}.
+        """
+        horizon = max(1, min(int(horizon), FORECAST_MAX_HORIZON))
+        keys = [k for k in keys if k in self.rows]
+        series = np.array([self.rows[k] for k in keys], dtype=int)
+        h = np.arange(1, horizon + 1)
+        damped = np.cumsum(self.phi ** h)
+        slots = (self.last - 1 + h) % self.m
+        alpha, beta, gamma = (p[series, None] for p in (self.alpha, self.beta, self.gamma))
+        mean = self.level[series, None] + damped * self.trend[series, None] + self.season[series][:, slots]
+
+        # Var(e_{t+h}) = sigma^2 * (1 + sum_{j<h} c_j^2), c_j = alpha + beta*damped_j + gamma*[j % m == 0]
+        j = h[:-1]
+        c = alpha + beta * damped[:-1] + gamma * (j % self.m == 0)
+        factor = np.concatenate([np.ones((len(series), 1)), 1 + np.cumsum(c * c, axis=1)], axis=1)
+        errors = max(1, self.periods - self.warmup)
+        sd = np.sqrt(self.sse[series, None] / errors * factor)
+        return {
+            "periods": [self.period_label(self.last - 1 + i) for i in h],
+            "keys": keys,
+            # Demand is never negative
+            "mean": np.maximum(mean, 0),
+            "lower": {level: np.maximum(mean - z * sd, 0) for level, z in Z.items()},
+            "upper": {level: np.maximum(mean + z * sd, 0) for level, z in Z.items()},
+        }
+
+    def products_in(self, region: str) -> list:
+        return [k for k in self.keys if k[0] == region and k[1] is not None]
+
+    def info(self) -> dict:
+        return {
+            "series": len(self.keys) if self.fitted else None,
+            "periods": self.periods if self.fitted else None,
+            "freq": self.freq,
+            "seasonal": self.seasonal if self.fitted else None,
+            "mode": self.mode,
+            "fit_seconds": self.fit_seconds,
+        }
+
+
+def merge_models(old: DemandModel, rows: DemandModel) -> DemandModel:
+    """Aggregates merge hook."""
+    return old.merged(rows)
@@ -0,0 +1,108 @@
+"""Appending new orders to a running agent server.
+
+Two ways in, both ending in `Dataset.append`:
+
+* Drop files: every process watches DATASET_INGEST_DIR and appends each new
+  `*.csv` file in it (DataCo columns, same encoding as the source CSV) once,
+  in file-name order. Write files under a hidden name (`.orders.csv.tmp`)
+  and rename them into place, so a half-written file is never read. The
+  directory is re-read on start, so dropped files survive restarts.
+* The `admin_append_orders` tool takes the rows as a list of records. It
+  only reaches the process it is called on; use the drop directory when
+  several agent processes or replicas serve the same data.
+"""
+import asyncio
+import os
+import sys
+import threading
+
+import pandas as pd
+
+from server.dataset import DATASET_WAIT_TIMEOUT, Dataset, read_raw
+
+DATASET_INGEST_DIR = os.getenv("DATASET_INGEST_DIR", "data/ingest")
+# Seconds between scans of the drop directory; 0 turns the watcher off
+DATASET_INGEST_POLL = float(os.getenv("DATASET_INGEST_POLL", "5"))
+
+
+class DropDirWatcher:
+    def __init__(self, dataset: Dataset, directory: str = DATASET_INGEST_DIR, poll: float = DATASET_INGEST_POLL):
+        self.dataset = dataset
+        self.directory = directory
+        self.poll = poll
+        self.seen = set()
+        self.failed = []
+        self._stop = threading.Event()
+
+    def pending(self) -> list:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in names if n.endswith(".csv") and not n.startswith(".") and n not in self.seen)
+
+    def scan(self):
+        """Append every file not read yet, as one new version."""
+        frames, names = [], []
+        for name in self.pending():
+            self.seen.add(name)
+            try:
+                frames.append(read_raw(os.path.join(self.directory, name)))
+                names.append(name)
+            except Exception as e:
+                self._fail(name, e)
+        if not frames:
+            return None
+        try:
+            return self.dataset.append(pd.concat(frames, ignore_index=True), source=",".join(names))
+        except Exception as e:
+            self._fail(",".join(names), e)
+
+    def _fail(self, name: str, error: Exception):
+        # A bad file is reported once and skipped, not retried every poll
+        self.failed.append(name)
+        print(f"Ingest of {name} failed: {error!r}", file=sys.stderr)
+
+    def _run(self):
+        # Started from on_ready, which runs just before the dataset is marked ready
+        self.dataset.ready.wait()
+        self.scan()
+        while not self._stop.wait(self.poll):
+            self.scan()
+
+    def start(self) -> "DropDirWatcher":
+        threading.Thread(target=self._run, name="dataset-ingest", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+_watchers = {}  # id(dataset) -> DropDirWatcher
+
+
+def watch_drop_dir(dataset: Dataset):
+    """Start the drop-directory watcher once the dataset is loaded (once per dataset)."""
+    if DATASET_INGEST_POLL <= 0 or id(dataset) in _watchers:
+        return
+    watcher = _watchers[id(dataset)] = DropDirWatcher(dataset)
+    dataset.on_ready(watcher.start)
+
+
+def parse_rows(rows: list) -> pd.DataFrame:
+    """Raw DataCo rows from a list of {column: value} records."""
+    return pd.DataFrame.from_records(rows)
+
+
+def register_ingestion(mcp, dataset: Dataset):
+    """The admin_append_orders tool and the drop-directory watcher; the router
+    and client never offer `admin_` tools to the model."""
+    @mcp.tool()
+    async def admin_append_orders(rows: list[dict]) -> dict:
+        """Append orders (records with the DataCo CSV columns) to this process's
+        dataset. Returns the new dataset version and row counts."""
+        if not dataset.ready.is_set():
+            await asyncio.to_thread(dataset.ready.wait, DATASET_WAIT_TIMEOUT)
+        return await asyncio.to_thread(dataset.append, parse_rows(rows), "admin_append_orders")
+
+    watch_drop_dir(dataset)
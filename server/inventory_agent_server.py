@@ -5,37 +5,86 @@ from mcp.server.fastmcp import FastMCP
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from server.aggregates import (Aggregates, add, counts_of, normalized, plain_keys, register_dataset_hooks,
+                               register_stats_resource)
+from server.dataset import normalize, register_dataset_resource, requires_dataset, shared_dataset
+from server.profiling import register_profiling_tools
+from server.transport import serve
+
 mcp = FastMCP("InventoryAgent")
 
-df = pd.read_csv("data/DataCoSupplyChainDataset.csv", encoding="ISO-8859-1")
+dataset = shared_dataset()
+register_dataset_resource(mcp, dataset)
+register_profiling_tools(mcp)
+aggregates = Aggregates(dataset)
+register_stats_resource(mcp, aggregates)
+
+def _quantities_frame(quantities):
+    stock_df = quantities.astype("int64").sort_index().reset_index()
+    stock_df.columns = ["Product", "QuantitySold"]
+    return stock_df
+
+@aggregates.define("product_quantities", merge=add, finish=_quantities_frame)
+def _product_quantities(df):
+    return plain_keys(df.groupby("Product Name", observed=True)["Order Item Quantity"].sum())
+
+def _top_products(counts):
+    top = {}
+    for region, products in counts.astype("int64").sort_index().groupby(level=0):
+        products = products.droplevel(0).sort_values(ascending=False, kind="stable").head(5)
+        top[region] = [{"Product": name, "TimesOrdered": int(n)} for name, n in products.items()]
+    return top
+
+@aggregates.define("region_top_products", merge=add, finish=_top_products)
+def _region_top_products(df):
+    return plain_keys(df.groupby([normalized(df["Order Region"]), "Product Name"], observed=True).size())
+
+def _gap(state):
+    # Products never seen available have no supply figure and are left out
+    state = state[state["available_rows"] > 0]
+    return (state["demand"] - state["available"]).astype("int64").sort_values(ascending=False)
+
+@aggregates.define("demand_supply_gap", merge=add, finish=_gap)
+def _demand_supply_gap(df):
+    demand = df.groupby("Product Name", observed=True)["Order Item Quantity"].sum()
+    availability = (
+        df[df["Product Status"] == 0]
+        .groupby("Product Name", observed=True)["Order Item Quantity"]
+        .agg(["sum", "count"])
+    )
+    return plain_keys(pd.DataFrame({
+        "demand": demand,
+        "available": availability["sum"],
+        "available_rows": availability["count"],
+    }).fillna(0))
+
+@aggregates.define("status_counts", merge=add, finish=lambda counts: counts.astype("int64").to_dict())
+def _status_counts(df):
+    return counts_of(df["Product Status"])
+
+register_dataset_hooks(mcp, dataset, aggregates)
 
 @mcp.tool()
+@requires_dataset(dataset)
 def low_stock_products(threshold: int = 10) -> list:
     """
     List products with stock below a threshold.
     """
     # Fake inventory: use quantity sold as proxy
-    stock_df = df.groupby("Product Name")["Order Item Quantity"].sum().reset_index()
-    stock_df.columns = ["Product", "QuantitySold"]
+    stock_df = aggregates["product_quantities"]
     low_stock = stock_df[stock_df["QuantitySold"] < threshold]
     return low_stock.to_dict(orient="records")
 
 @mcp.tool()
+@requires_dataset(dataset)
 def restock_suggestion(region: str) -> list:
     """
     Suggest top products to restock in a region.
     """
-    regional_orders = df[df["Order Region"].str.lower() == region.lower()]
-    top_products = (
-        regional_orders["Product Name"]
-        .value_counts()
-        .head(5)
-        .reset_index()
-    )
-    top_products.columns = ["Product", "TimesOrdered"]
-    return top_products.to_dict(orient="records")
+    return aggregates["region_top_products"].get(normalize(region), [])
 
 @mcp.tool()
+@requires_dataset(dataset)
 def products_at_risk_of_stockout(min_orders: int = 5) -> list:
     """
     Identify products that are frequently ordered but have stock issues.
@@ -46,15 +95,16 @@ def products_at_risk_of_stockout(min_orders: int = 5) -> list:
     Returns:
         List of product names with high demand and low availability.
     """
+    df = dataset.df
     # Use Product Status: 1 = Not Available, 0 = Available
     stock_status = df[df["Product Status"] == 1]
     
     recent_orders = df[
-        pd.to_datetime(df["order date (DateOrders)"], errors="coerce") >= pd.Timestamp.now() - pd.Timedelta(days=30)
+        df["Order_Date"] >= pd.Timestamp.now() - pd.Timedelta(days=30)
     ]
 
     high_demand = (
-        recent_orders.groupby("Product Name")
+        recent_orders.groupby("Product Name", observed=True)
         .size()
         .reset_index(name="recent_orders")
         .query("recent_orders >= @min_orders")
@@ -64,6 +114,7 @@ def products_at_risk_of_stockout(min_orders: int = 5) -> list:
     return at_risk["Product Name"].drop_duplicates().tolist()
 
 @mcp.tool()
+@requires_dataset(dataset)
 def demand_supply_gap(top_n: int = 5) -> list:
     """
     Show products with the biggest demand/supply mismatch.
@@ -71,23 +122,17 @@ def demand_supply_gap(top_n: int = 5) -> list:
     Returns:
         List of products sorted by descending demand-supply gap.
     """
-    demand = df.groupby("Product Name")["Order Item Quantity"].sum()
-    availability = (
-        df[df["Product Status"] == 0]
-        .groupby("Product Name")["Order Item Quantity"]
-        .sum()
-    )
-
-    mismatch = (demand - availability).dropna().sort_values(ascending=False).head(top_n)
+    mismatch = aggregates["demand_supply_gap"].head(top_n)
     
     return [{"Product": name, "Gap": int(gap)} for name, gap in mismatch.items()]
 
 @mcp.tool()
+@requires_dataset(dataset)
 def product_status_overview() -> dict:
     """
     Returns total available vs. unavailable products in inventory.
     """
-    counts = df["Product Status"].value_counts().to_dict()
+    counts = aggregates["status_counts"]
     return {
         "Available Products": counts.get(0, 0),
         "Unavailable Products": counts.get(1, 0)
@@ -95,4 +140,4 @@ def product_status_overview() -> dict:
 
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    serve(mcp)
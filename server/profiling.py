@@ -0,0 +1,206 @@
+"""On-demand profiling of agent tool calls.
+
+Off by default. A sampled fraction of calls (PROFILE_SAMPLE_RATE) and every
+call to a flagged tool (PROFILE_TOOLS, or flagged at runtime through the
+admin_profiling tool) run under cProfile, with tracemalloc recording what
+they allocate. Each profiled call writes
+
+    PROFILE_DIR/<tool>-<timestamp>-<id>.prof
+
+which loads with pstats, snakeviz or flameprof (`flameprof x.prof > x.svg`
+for a flame graph), and appends a summary to PROFILE_DIR/profiles.jsonl:
+the hottest functions, the call's peak and net allocations, and the share
+allocated inside pandas/numpy. The latest summaries are also kept in memory
+for the admin_profiles tool.
+
+With nothing flagged and a zero sample rate, the only per-call cost is one
+attribute check in `requires_dataset`.
+"""
+import collections
+import cProfile
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+
+from telemetry.log_writer import LOGS
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOOLS = [t for t in os.getenv("PROFILE_TOOLS", "").split(",") if t]
+PROFILE_DIR = os.getenv("PROFILE_DIR", "logs/profiles")
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "1") == "1"
+# Summaries kept in memory for admin_profiles
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+# Functions / allocation sites listed per summary
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "15"))
+# Stack depth tracemalloc records; deeper attributes pandas allocations to tool code
+PROFILE_FRAMES = int(os.getenv("PROFILE_FRAMES", "8"))
+
+DATAFRAME_LIBS = (f"{os.sep}pandas{os.sep}", f"{os.sep}numpy{os.sep}", f"{os.sep}pyarrow{os.sep}")
+
+
+def _top_functions(profiler: cProfile.Profile, limit: int) -> list:
+    stats = pstats.Stats(profiler)
+    stats.sort_stats("cumulative")
+    rows = []
+    for func in stats.fcn_list[:limit]:
+        _, calls, self_seconds, cumulative, _ = stats.stats[func]
+        rows.append({
+            "function": pstats.func_std_string(func),
+            "calls": calls,
+            "self_s": round(self_seconds, 6),
+            "cumulative_s": round(cumulative, 6),
+        })
+    return rows
+
+
+# The profiler's own bookkeeping is not the tool's
+_OWN_FRAMES = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+
+
+def _memory_summary(before, after, peak: int, limit: int) -> dict:
+    """Net allocations between two snapshots, by line and by library."""
+    diff = after.filter_traces(_OWN_FRAMES).compare_to(before.filter_traces(_OWN_FRAMES), "traceback")
+    in_libs = 0
+    for stat in diff:
+        if any(lib in frame.filename for frame in stat.traceback for lib in DATAFRAME_LIBS):
+            in_libs += stat.size_diff
+    top = sorted(diff, key=lambda s: s.size_diff, reverse=True)[:limit]
+    return {
+        "peak_kb": round(peak / 1024, 1),
+        "net_kb": round(sum(s.size_diff for s in diff) / 1024, 1),
+        "dataframe_libs_net_kb": round(in_libs / 1024, 1),
+        "top_allocations": [
+            {
+                # Innermost frame first, then the caller that led there
+                "where": [f"{f.filename}:{f.lineno}" for f in list(s.traceback)[-3:][::-1]],
+                "net_kb": round(s.size_diff / 1024, 1),
+                "count": s.count_diff,
+            }
+            for s in top if s.size_diff > 0
+        ],
+    }
+
+
+class Profiler:
+    """Decides which tool calls to profile and keeps their summaries."""
+
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE, tools=PROFILE_TOOLS,
+                 directory: str = PROFILE_DIR, memory: bool = PROFILE_MEMORY, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.profiles = collections.deque(maxlen=keep)
+        # cProfile allows one active profiler per process; extra calls run plain
+        self._busy = threading.Lock()
+        self.skipped = 0
+        self.configure(sample_rate, tools, memory)
+
+    def configure(self, sample_rate: float = None, tools=None, memory: bool = None):
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, sample_rate))
+        if tools is not None:
+            self.tools = set(tools)
+        if memory is not None:
+            self.memory = memory
+        self.active = self.sample_rate > 0 or bool(self.tools)
+
+    def settings(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "tools": sorted(self.tools),
+            "memory": self.memory,
+            "directory": self.directory,
+            "profiled": len(self.profiles),
+            "skipped_busy": self.skipped,
+        }
+
+    def run(self, tool: str, fn, *args, **kwargs):
+        """Call `fn`, under the profiler if this call is flagged or sampled."""
+        flagged = tool in self.tools
+        if not flagged and random.random() >= self.sample_rate:
+            return fn(*args, **kwargs)
+        if not self._busy.acquire(blocking=False):
+            self.skipped += 1
+            return fn(*args, **kwargs)
+        try:
+            return self._profile(tool, "flagged" if flagged else "sampled", fn, args, kwargs)
+        finally:
+            self._busy.release()
+
+    def _profile(self, tool: str, reason: str, fn, args, kwargs):
+        memory = self.memory
+        started_tracing = False
+        if memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILE_FRAMES)
+                started_tracing = True
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        error = None
+        t0 = time.perf_counter()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            profiler.disable()
+            seconds = time.perf_counter() - t0
+            allocations = None
+            if memory:
+                _, peak = tracemalloc.get_traced_memory()
+                after = tracemalloc.take_snapshot()
+                if started_tracing:
+                    tracemalloc.stop()
+                allocations = _memory_summary(before, after, peak - base, PROFILE_TOP)
+            self._record(tool, reason, profiler, seconds, allocations, error)
+
+    def _record(self, tool: str, reason: str, profiler: cProfile.Profile, seconds: float,
+                allocations: dict, error: str):
+        profile_id = uuid.uuid4().hex[:8]
+        path = os.path.join(self.directory, f"{tool}-{time.strftime('%Y%m%dT%H%M%S')}-{profile_id}.prof")
+        profiler.create_stats()
+        # The same bytes pstats.Stats.dump_stats writes, but off the event loop
+        LOGS.write_file(path, marshal.dumps(profiler.stats))
+        summary = {
+            "id": profile_id,
+            "tool": tool,
+            "reason": reason,
+            "timestamp": time.time(),
+            "seconds": round(seconds, 6),
+            "path": path,
+            "top_functions": _top_functions(profiler, PROFILE_TOP),
+            "memory": allocations,
+        }
+        if error is not None:
+            summary["error"] = error
+        self.profiles.append(summary)
+        LOGS.write(os.path.join(self.directory, "profiles.jsonl"), summary)
+
+
+PROFILER = Profiler()
+
+
+def register_profiling_tools(mcp, profiler: Profiler = PROFILER):
+    """Operator tools for the profiler; the router and client never offer
+    `admin_` tools to the model."""
+    @mcp.tool()
+    def admin_profiling(sample_rate: float = None, tools: list[str] = None, memory: bool = None) -> dict:
+        """Set the fraction of tool calls profiled (0 turns sampling off), the tools
+        profiled on every call (an empty list clears them) and whether allocations
+        are recorded. Returns the current settings."""
+        profiler.configure(sample_rate, tools, memory)
+        return profiler.settings()
+
+    @mcp.tool()
+    def admin_profiles(tool: str = None, limit: int = 5, functions: int = 10) -> list:
+        """Summaries of the most recent profiled calls, newest first: duration,
+        hottest functions, allocations and the .prof file path."""
+        recent = [p for p in reversed(profiler.profiles) if tool is None or p["tool"] == tool][:limit]
+        return [{**p, "top_functions": p["top_functions"][:functions]} for p in recent]
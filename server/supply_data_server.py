@@ -3,60 +3,91 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from mcp.server.fastmcp import FastMCP
-import pandas as pd
+from server.aggregates import (Aggregates, add, counts_of, describe_counts, mean_of, normalized,
+                               register_dataset_hooks, register_stats_resource, sum_count)
+from server.dataset import normalize, register_dataset_resource, requires_dataset, shared_dataset
+from server.profiling import register_profiling_tools
+from server.transport import serve
 
 mcp = FastMCP("SupplyChainServer")
 
-df = pd.read_csv("data/DataCoSupplyChainDataset.csv", encoding="ISO-8859-1")
-df['Order_Date'] = pd.to_datetime(df['order date (DateOrders)'], errors='coerce')
-df['Ship_Date'] = pd.to_datetime(df['shipping date (DateOrders)'], errors='coerce')
-df['Scheduled_Ship_Date'] = df['Order_Date'] + pd.to_timedelta(df['Days for shipment (scheduled)'], unit='D')
-df['Delivery_Delay_Days'] = (df['Ship_Date'] - df['Scheduled_Ship_Date']).dt.days
+# Date and delay columns are derived once when the snapshot is built
+dataset = shared_dataset()
+register_dataset_resource(mcp, dataset)
+register_profiling_tools(mcp)
+aggregates = Aggregates(dataset)
+register_stats_resource(mcp, aggregates)
+
+
+@aggregates.define("delay_stats", merge=add, finish=describe_counts)
+def _delay_stats(df):
+    return counts_of(df['Delivery_Delay_Days'])
+
+@aggregates.define("shipping_mode_counts", merge=add,
+                   finish=lambda counts: counts.astype("int64").sort_values(ascending=False, kind="stable").to_dict())
+def _shipping_mode_counts(df):
+    return counts_of(df['Shipping Mode'])
+
+@aggregates.define("product_delays_desc", merge=add, finish=lambda state: mean_of(state).sort_values(ascending=False))
+def _product_delays_desc(df):
+    return sum_count(df, 'Product Name', 'Delivery_Delay_Days')
+
+@aggregates.define("shipping_mode_delays", merge=add, finish=lambda state: mean_of(state).round(2).to_dict())
+def _shipping_mode_delays(df):
+    return sum_count(df, "Shipping Mode", "Delivery_Delay_Days")
+
+def _by_region(state):
+    return {
+        region: stats.droplevel(0).sort_values()
+        for region, stats in mean_of(state).groupby(level=0)
+    }
+
+@aggregates.define("region_shipping_mode_delays", merge=add, finish=_by_region)
+def _region_shipping_mode_delays(df):
+    return sum_count(df, [normalized(df["Order Region"]), "Shipping Mode"], "Delivery_Delay_Days")
+
+register_dataset_hooks(mcp, dataset, aggregates)
+
 
 @mcp.tool()
+@requires_dataset(dataset)
 def get_delay_stats() -> dict:
-    return df['Delivery_Delay_Days'].describe().to_dict()
+    return aggregates["delay_stats"]
 
 @mcp.tool()
+@requires_dataset(dataset)
 def query_orders_by_region(region: str) -> list:
-    filtered = df[df['Order Region'].str.lower() == region.lower()]
-    return filtered[['Order Id', 'Order Region', 'Sales', 'Shipping Mode']].head(5).to_dict(orient='records')
+    positions = dataset.regions.positions(region)[:5]
+    filtered = dataset.df.iloc[positions]
+    return filtered[['Order Id', 'Order Region', 'Sales', 'Shipping Mode']].to_dict(orient='records')
 
 @mcp.tool()
+@requires_dataset(dataset)
 def get_shipping_mode_breakdown() -> dict:
-    return df['Shipping Mode'].value_counts().to_dict()
+    return aggregates["shipping_mode_counts"]
 
 @mcp.tool()
+@requires_dataset(dataset)
 def top_delayed_products(n: int = 5) -> list:
-    grouped = (
-        df.groupby('Product Name')['Delivery_Delay_Days']
-        .mean()
-        .sort_values(ascending=False)
-        .head(n)
-    )
-    return grouped.to_dict()
+    return aggregates["product_delays_desc"].head(n).to_dict()
 
 @mcp.tool()
+@requires_dataset(dataset)
 def avg_delay_by_shipping_mode() -> dict:
-    return df.groupby("Shipping Mode")["Delivery_Delay_Days"].mean().round(2).to_dict()
+    return aggregates["shipping_mode_delays"]
 
 @mcp.tool()
+@requires_dataset(dataset)
 def recommend_shipping_method(region: str) -> str:
     """
     Based on average delivery delays per shipping mode in `region`,
     recommend the fastest / most reliable mode.
     """
-    df_region = df[df["Order Region"].str.lower()==region.lower()]
-    if df_region.empty:
+    # average delay by shipping mode, precomputed per region
+    stats = aggregates["region_shipping_mode_delays"].get(normalize(region))
+    if stats is None:
         return f"No data for region: {region}"
 
-    # compute average delay by shipping mode
-    stats = (
-        df_region
-        .groupby("Shipping Mode")["Delivery_Delay_Days"]
-        .mean()
-        .sort_values()
-    )
     best_mode = stats.index[0]
     avg_delay = stats.iloc[0]
     return (
@@ -65,4 +96,4 @@ def recommend_shipping_method(region: str) -> str:
     )
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    serve(mcp)
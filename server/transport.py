@@ -0,0 +1,41 @@
+"""Run an agent's MCP server over stdio (the default) or the network.
+
+    python server/inventory_agent_server.py                                      # stdio, launched by the router
+    python server/inventory_agent_server.py --transport sse --port 8050          # http://HOST:8050/sse
+    python server/inventory_agent_server.py --transport streamable-http --port 8051   # http://HOST:8051/mcp
+
+Run as many copies as needed, on any nodes, and list one URL per replica on
+the agent card; the router spreads calls across them:
+
+    {"name": "InventoryAgent", "endpoint": "streamable-http",
+     "urls": ["http://node1:8051/mcp", "http://node2:8051/mcp"], "tools": [...]}
+"""
+import argparse
+import os
+import sys
+
+from mcp.server.fastmcp import FastMCP
+
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+MCP_PORT = int(os.getenv("MCP_PORT", "8050"))
+
+
+def add_transport_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"], default=MCP_TRANSPORT)
+    parser.add_argument("--host", default=MCP_HOST, help="bind address for network transports")
+    parser.add_argument("--port", type=int, default=MCP_PORT, help="port for network transports")
+
+
+def serve(mcp: FastMCP, args=None):
+    """Run `mcp` with the transport chosen on the command line (or MCP_TRANSPORT)."""
+    if args is None:
+        parser = argparse.ArgumentParser(description=f"Run the {mcp.name} MCP server")
+        add_transport_args(parser)
+        args = parser.parse_args()
+    if args.transport != "stdio":
+        mcp.settings.host = args.host
+        mcp.settings.port = args.port
+        path = mcp.settings.sse_path if args.transport == "sse" else mcp.settings.streamable_http_path
+        print(f"{mcp.name}: serving {args.transport} on http://{args.host}:{args.port}{path}", file=sys.stderr)
+    mcp.run(transport=args.transport)
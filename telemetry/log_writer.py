@@ -0,0 +1,190 @@
+"""Non-blocking, batched writer for the JSONL logs under logs/.
+
+Request handlers hand records to `LOGS.write(path, record)`, which only
+enqueues them. A background thread drains the queue, appends each file's
+records in one write once LOG_BATCH_SIZE records are waiting or
+LOG_FLUSH_INTERVAL has passed, and rotates a file (gzip-compressed) when it
+grows past LOG_ROTATE_BYTES or a new day starts. The queue is bounded: when
+the disk cannot keep up, new records are dropped and counted instead of
+blocking the request path.
+"""
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+LOG_ROTATE_BYTES = int(os.getenv("LOG_ROTATE_BYTES", str(50 * 1024 * 1024)))
+LOG_ROTATE_DAILY = os.getenv("LOG_ROTATE_DAILY", "1") == "1"
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "1") == "1"
+
+_STOP = object()
+
+
+class LogWriter:
+    def __init__(self, max_queue: int = LOG_QUEUE_SIZE, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL, rotate_bytes: int = LOG_ROTATE_BYTES,
+                 rotate_daily: bool = LOG_ROTATE_DAILY, compress: bool = LOG_COMPRESS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._flushed = threading.Condition()
+        self._enqueued = 0
+        self._written = 0
+        self.dropped = 0
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _put(self, item) -> bool:
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self._enqueued += 1
+        return True
+
+    def write(self, path: str, record: dict) -> bool:
+        """Queue one JSON record for `path`; returns False if it was dropped."""
+        return self._put(("line", path, json.dumps(record, default=str) + "\n"))
+
+    def write_file(self, path: str, data: bytes, on_done=None) -> bool:
+        """Queue a whole file (e.g. an uploaded image) to be written as-is.
+
+        `on_done(ok)` is called on the writer thread once the write succeeded
+        or failed; it is not called when the file is dropped (False returned).
+        """
+        return self._put(("file", path, (data, on_done)))
+
+    def _run(self):
+        lines = {}  # path -> [str]
+        pending = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(lines)
+                return
+            if item is not None:
+                kind, path, payload = item
+                if kind == "line":
+                    lines.setdefault(path, []).append(payload)
+                    pending += 1
+                else:
+                    data, on_done = payload
+                    ok = self._write_file(path, data)
+                    if on_done is not None:
+                        try:
+                            on_done(ok)
+                        except Exception:
+                            pass
+                    self._mark_written(1)
+
+            if pending >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(lines)
+                lines, pending = {}, 0
+                deadline = time.monotonic() + self.flush_interval
+
+    def _mark_written(self, n: int):
+        with self._flushed:
+            self._written += n
+            self._flushed.notify_all()
+
+    def _flush(self, lines: dict):
+        for path, batch in lines.items():
+            try:
+                self._maybe_rotate(path)
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "a") as f:
+                    f.write("".join(batch))
+            except OSError:
+                self.dropped += len(batch)
+            self._mark_written(len(batch))
+
+    def _write_file(self, path: str, data: bytes) -> bool:
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+        except OSError:
+            self.dropped += 1
+            return False
+        return True
+
+    def _maybe_rotate(self, path: str):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return
+        too_big = self.rotate_bytes > 0 and st.st_size >= self.rotate_bytes
+        new_day = self.rotate_daily and datetime.fromtimestamp(st.st_mtime).date() != datetime.now().date()
+        if not (too_big or new_day) or st.st_size == 0:
+            return
+        stamp = datetime.fromtimestamp(st.st_mtime).strftime("%Y%m%d-%H%M%S")
+        rotated = f"{path}.{stamp}"
+        n = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            rotated = f"{path}.{stamp}.{n}"
+            n += 1
+        os.replace(path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything queued so far is on disk (for shutdown/tests)."""
+        target = self._enqueued
+        self._ensure_thread()
+        deadline = time.monotonic() + timeout
+        with self._flushed:
+            while self._written < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._flushed.wait(min(remaining, self.flush_interval))
+        return True
+
+    def close(self, timeout: float = 5.0):
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self._written,
+            "dropped": self.dropped,
+        }
+
+
+LOGS = LogWriter()
+atexit.register(LOGS.close)
@@ -0,0 +1,279 @@
+"""Prometheus-style metrics and request spans, without extra dependencies.
+
+Histograms, counters and gauges live in the process-wide METRICS registry
+and render in the Prometheus text exposition format for `/metrics`. Agent
+servers run in their own processes, so they publish `METRICS.snapshot()`
+as the `metrics://server` resource and the API merges those snapshots into
+its own output, labelled with the agent process they came from.
+
+Spans time one step of a request (an LLM turn, a tool call, an agent
+spawn). They share the request's trace_id, link to their parent, are
+written to logs/spans.jsonl when they end, and their span_id is stored on
+the matching trace entry so a slow request can be taken apart step by step.
+Code that cannot be handed a span explicitly (the agent pool, the LLM
+gateway) picks up the active one through `current_span()`.
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SPAN_LOG = os.getenv("SPAN_LOG", "logs/spans.jsonl")
+SPAN_LOG_ENABLED = os.getenv("SPAN_LOG_ENABLED", "1") == "1"
+PREFIX = "intellichain_"
+
+# Seconds; spans tool bodies of a few ms up to LLM calls of tens of seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def snapshot(self) -> dict:
+        return {"type": self.type, "help": self.help, "labels": list(self.labelnames),
+                "samples": self._samples()}
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        if METRICS_ENABLED:
+            key = self._key(labels)
+            with self._lock:
+                self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> list:
+        with self._lock:
+            return [[list(k), v] for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """A gauge read from `fn()` at scrape time: a number, or {label values: number}."""
+    type = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def _samples(self) -> list:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return [[list(k) if isinstance(k, tuple) else [k], v] for k, v in value.items() if v is not None]
+        return [] if value is None else [[[], value]]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [per-bucket counts, sum, count]
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def _samples(self) -> list:
+        with self._lock:
+            return [[list(k), {"buckets": list(self.buckets), "counts": list(v[0]), "sum": v[1], "count": v[2]}]
+                    for k, v in self._values.items()]
+
+
+def _render_family(name: str, family: dict, sources) -> list:
+    """Text lines for one metric family; `sources` is [(extra labels, samples)]."""
+    lines = [f"# HELP {name} {family['help']}", f"# TYPE {name} {family['type']}"]
+    for extra, samples in sources:
+        for values, value in samples:
+            if family["type"] != "histogram":
+                suffix = name if family["type"] == "gauge" or name.endswith("_total") else f"{name}_total"
+                lines.append(f"{suffix}{_labels(family['labels'], values, extra)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(value["buckets"], value["counts"]):
+                cumulative += count
+                le = {**(extra or {}), "le": repr(float(bound))}
+                lines.append(f"{name}_bucket{_labels(family['labels'], values, le)} {cumulative}")
+            le = {**(extra or {}), "le": "+Inf"}
+            lines.append(f"{name}_bucket{_labels(family['labels'], values, le)} {value['count']}")
+            lines.append(f"{name}_sum{_labels(family['labels'], values, extra)} {round(value['sum'], 6)}")
+            lines.append(f"{name}_count{_labels(family['labels'], values, extra)} {value['count']}")
+    return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, cls, name, help, labels, **kwargs):
+        metric = self._metrics.get(PREFIX + name)
+        if metric is None:
+            metric = self._metrics[PREFIX + name] = cls(name, help, labels, **kwargs)
+        return metric
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, fn, labels=()) -> Gauge:
+        return self._register(Gauge, name, help, labels, fn=fn)
+
+    def histogram(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labels, buckets=buckets)
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render(self, remote=()) -> str:
+        """Prometheus text for this process plus `remote` [(extra labels, snapshot)]."""
+        families = {}
+        for extra, snapshot in [({}, self.snapshot()), *remote]:
+            for name, family in snapshot.items():
+                entry = families.setdefault(name, {"family": family, "sources": []})
+                entry["sources"].append((extra, family["samples"]))
+        lines = []
+        for name, entry in families.items():
+            lines += _render_family(name, entry["family"], entry["sources"])
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+# Metrics shared by several modules are declared here so every process
+# registers them under one definition
+HTTP_SECONDS = METRICS.histogram("http_request_seconds", "API request latency by endpoint", ["endpoint", "method", "status"])
+REQUEST_SECONDS = METRICS.histogram("agent_request_seconds", "Router / tool-chaining request latency", ["entry", "path"])
+LLM_SECONDS = METRICS.histogram("llm_request_seconds", "Chat completion latency, excluding queue wait", ["kind", "outcome"])
+LLM_QUEUE_SECONDS = METRICS.histogram("llm_queue_wait_seconds", "Time a chat completion waited for admission", ["priority"])
+LLM_TOKENS = METRICS.counter("llm_tokens_total", "Tokens reported by the model", ["type"])
+PLANNER_SECONDS = METRICS.histogram("planner_turn_seconds", "Router planner turn latency", ["cache"])
+TOOL_SECONDS = METRICS.histogram("tool_call_seconds", "MCP tool call latency seen by the caller", ["agent", "tool", "outcome"])
+TOOL_CACHE_LOOKUPS = METRICS.counter("tool_cache_lookups_total", "Tool result cache lookups", ["tool", "result"])
+SPAWN_SECONDS = METRICS.histogram("agent_spawn_seconds", "Agent spawn or connect plus MCP initialize", ["agent", "transport"])
+TOOL_BODY_SECONDS = METRICS.histogram("tool_body_seconds", "Time inside a tool function, measured in the agent server", ["tool"])
+
+
+# -- spans -------------------------------------------------------------------
+
+_CURRENT = contextvars.ContextVar("span", default=None)
+
+
+def _new_id(chars: int) -> str:
+    return uuid.uuid4().hex[:chars]
+
+
+class Span:
+    def __init__(self, name: str, parent: "Span" = None, **attrs):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else _new_id(32)
+        self.span_id = _new_id(16)
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration = None
+
+    def child(self, name: str, **attrs) -> "Span":
+        return Span(name, self, **attrs)
+
+    def end(self, **attrs) -> "Span":
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._t0
+            self.attrs.update(attrs)
+            if SPAN_LOG_ENABLED:
+                from telemetry.log_writer import LOGS
+
+                LOGS.write(SPAN_LOG, self.record())
+        return self
+
+    def record(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": None if self.duration is None else round(self.duration, 6),
+            "attrs": self.attrs,
+        }
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Make this the current span for code awaited inside the block.
+
+        Only use it where the block has no `yield`: an async generator's
+        steps run in their consumer's context.
+        """
+        token = _CURRENT.set(self)
+        try:
+            yield self
+        finally:
+            _CURRENT.reset(token)
+
+
+def current_span():
+    return _CURRENT.get()
+
+
+def start_span(name: str, **attrs) -> Span:
+    """A child of the current span, or a new root if there is none."""
+    return Span(name, current_span(), **attrs)
+
+
+def remote_snapshot(text: str) -> dict:
+    """Parse a `metrics://server` resource body (tolerating garbage)."""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
@@ -0,0 +1,13 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# The OpenAI clients are created at import; tests never reach the endpoint
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "test")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "http://127.0.0.1:9")
+os.environ.setdefault("AZURE_OPENAI_API_VERSION", "2024-06-01")
+os.environ.setdefault("AZURE_OPENAI_MODEL", "test")
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+# No drop-directory watcher threads while the agent servers are imported
+os.environ.setdefault("DATASET_INGEST_POLL", "0")
@@ -0,0 +1,145 @@
+import asyncio
+from types import SimpleNamespace
+
+import anyio
+import httpx
+import pytest
+from mcp.shared.exceptions import McpError
+from mcp.types import ErrorData
+
+from router.agent_pool import AgentPool
+
+CARD = {"name": "DelayStatsAgent", "endpoint": "python", "args": ["server/supply_data_server.py"]}
+
+
+class FakeSession:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    async def call_tool(self, name, arguments=None, read_timeout_seconds=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(isError=False, content=[name, arguments])
+
+
+class FakeAgent:
+    """Stands in for an AgentSession: alive until the pool closes it."""
+
+    def __init__(self, pool, error=None, url=None):
+        self.session = FakeSession(error)
+        self.card = CARD
+        self.key = pool.key(CARD)
+        self.url = url
+        self.label = url or "fake"
+        self.in_flight = 0
+        self.calls = 0
+        self.closed = False
+        self.hung = False
+        self.spawn_duration = 0.0
+        pool._sessions.setdefault(self.key, []).append(self)
+
+    @property
+    def alive(self) -> bool:
+        return not self.closed
+
+    async def ping(self):
+        if self.hung:
+            raise asyncio.TimeoutError()
+
+    async def close(self):
+        self.closed = True
+
+
+def _spawning_pool() -> tuple:
+    """A pool whose spawns create FakeAgents; returns (pool, spawned agents)."""
+    pool = AgentPool(replicas=1, host_mode=False)
+    spawned = []
+
+    async def spawn(card, key, url=None):
+        spawned.append(FakeAgent(pool, url=url))
+        return spawned[-1]
+
+    pool._spawn = spawn
+    return pool, spawned
+
+
+def _pool(*agents_args) -> tuple:
+    pool = AgentPool(replicas=1, host_mode=False)
+    agents = [FakeAgent(pool, **kwargs) for kwargs in agents_args]
+    queue = list(agents)
+
+    async def acquire(card):
+        return queue.pop(0), 0.0
+
+    pool.acquire = acquire
+    return pool, agents
+
+
+@pytest.mark.parametrize("first", [
+    {"error": anyio.BrokenResourceError()},
+    {"error": ConnectionError("pipe closed")},
+    # A replica that stopped answering over HTTP surfaces as a timeout
+    {"error": McpError(ErrorData(code=httpx.codes.REQUEST_TIMEOUT, message="timed out")),
+     "url": "http://127.0.0.1:9/mcp"},
+])
+def test_call_retries_on_a_fresh_session(first):
+    pool, (dead, fresh) = _pool(first, {})
+
+    res, timings, served = asyncio.run(pool.call_tool(CARD, "get_delay_stats", {}))
+
+    assert served is fresh
+    assert res.content == ["get_delay_stats", {}]
+    assert dead.closed and dead not in pool._sessions[pool.key(CARD)]
+    assert pool.restarts[pool.key(CARD)] == 1
+    assert dead.in_flight == 0 and fresh.in_flight == 0
+
+
+def test_second_transport_error_is_raised():
+    pool, agents = _pool({"error": anyio.BrokenResourceError()}, {"error": anyio.BrokenResourceError()})
+
+    with pytest.raises(anyio.BrokenResourceError):
+        asyncio.run(pool.call_tool(CARD, "get_delay_stats", {}))
+    assert all(a.closed and a.in_flight == 0 for a in agents)
+
+
+def test_stdio_timeout_is_not_retried():
+    error = McpError(ErrorData(code=httpx.codes.REQUEST_TIMEOUT, message="timed out"))
+    pool, (hung, spare) = _pool({"error": error}, {})
+
+    with pytest.raises(McpError):
+        asyncio.run(pool.call_tool(CARD, "get_delay_stats", {}))
+    assert hung.closed and hung.in_flight == 0
+    assert spare.session.calls == 0
+
+
+def test_dead_session_is_respawned_on_acquire():
+    pool, spawned = _spawning_pool()
+
+    async def main():
+        first, _ = await pool.acquire(CARD)
+        assert (await pool.acquire(CARD))[0] is first
+        first.closed = True  # the agent process exited
+        fresh, _ = await pool.acquire(CARD)
+        return first, fresh
+
+    first, fresh = asyncio.run(main())
+    assert spawned == [first, fresh]
+    assert pool._sessions[pool.key(CARD)] == [fresh]
+    assert pool.restarts[pool.key(CARD)] == 1
+
+
+def test_health_check_respawns_a_hung_session():
+    pool, spawned = _spawning_pool()
+
+    async def main():
+        hung, _ = await pool.acquire(CARD)
+        hung.hung = True
+        return await pool.health_check()
+
+    status = asyncio.run(main())
+    hung, fresh = spawned
+    assert status == {"fake#0": False}
+    assert hung.closed and pool._sessions[pool.key(CARD)] == [fresh]
+    assert pool.restarts[pool.key(CARD)] == 1
@@ -0,0 +1,67 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench.synthetic import chunk, generate
+from server.aggregates import Aggregates
+from server.dataset import Dataset, read_raw
+from server.forecasting import DemandModel
+
+SERVERS = ["server.supply_data_server", "server.forecast_agent_server", "server.inventory_agent_server"]
+
+
+@pytest.fixture(scope="module")
+def appended(tmp_path_factory):
+    """A synthetic dataset and a raw batch to append with a new region and product."""
+    directory = tmp_path_factory.mktemp("aggregates")
+    csv_path = generate(str(directory / "dataco.csv"), rows=3000, seed=1)
+    rows = chunk(np.random.default_rng(2), 10_000, 500)
+    rows.loc[:20, "Order Region"] = "Atlantis"
+    rows.loc[10:30, "Product Name"] = "Hoverboard"
+    rows.to_csv(directory / "rows.csv", index=False, encoding="ISO-8859-1")
+    return csv_path, str(directory / "dataco.feather"), read_raw(str(directory / "rows.csv"))
+
+
+def _state(state):
+    # Demand models are compared by their history; the fit reuses cached parameters
+    return state.sums if isinstance(state, DemandModel) else state
+
+
+def _assert_same(incremental, rebuilt):
+    incremental, rebuilt = _state(incremental), _state(rebuilt)
+    if isinstance(rebuilt, pd.Series):
+        pd.testing.assert_series_equal(incremental.sort_index(), rebuilt.sort_index(),
+                                       check_dtype=False, check_index_type=False, check_categorical=False)
+    elif isinstance(rebuilt, pd.DataFrame):
+        pd.testing.assert_frame_equal(incremental.sort_index(), rebuilt.sort_index(),
+                                      check_dtype=False, check_index_type=False, check_categorical=False)
+    elif isinstance(rebuilt, dict):
+        assert sorted(incremental) == sorted(rebuilt)
+        for key, value in rebuilt.items():
+            _assert_same(incremental[key], value)
+    else:
+        assert incremental == rebuilt
+
+
+@pytest.mark.parametrize("server", SERVERS)
+def test_extend_matches_a_full_rebuild(appended, server):
+    csv_path, snapshot_path, rows = appended
+    dataset = Dataset(csv_path, snapshot_path).start(background=False)
+    aggregates = Aggregates(dataset)
+    # The server's own builders, run over this test's dataset
+    aggregates._builders = dict(importlib.import_module(server).aggregates._builders)
+    aggregates.materialize()
+    dataset.on_append(aggregates.extend)
+
+    result = dataset.append(rows, "test")
+
+    assert result["rows"] == 3500
+    latest = dataset.latest
+    incremental = aggregates._versions[latest.version]
+    for name in aggregates._builders:
+        state, value = aggregates._build(name, latest.df)
+        _assert_same(incremental[name][0], state)
+        if not isinstance(state, DemandModel):
+            _assert_same(incremental[name][1], value)
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+import asgi
+from asgi import AdmissionLimiter, sse_response
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = AdmissionLimiter(max_concurrency=1, max_queue=0, queue_timeout=0.1)
+    monkeypatch.setattr(asgi, "limiter", limiter)
+    return limiter
+
+
+async def _events():
+    yield {"event": "reasoning", "data": {"step": 1}}
+    yield {"event": "final", "data": {"response": "done"}}
+
+
+def _scope():
+    return {"type": "http", "method": "GET", "path": "/query/stream", "headers": [], "asgi": {"spec_version": "2.4"}}
+
+
+async def _receive():
+    await asyncio.sleep(3600)
+    return {"type": "http.disconnect"}
+
+
+def test_slot_released_after_stream(limiter):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def main():
+        response = await sse_response(_events())
+        await response(_scope(), _receive, send)
+
+    asyncio.run(main())
+    assert sent[0]["status"] == 200
+    assert b"done" in b"".join(m.get("body", b"") for m in sent)
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_no_slot_held_until_the_response_is_sent(limiter):
+    async def main():
+        # Built but never sent (e.g. the client went away first)
+        await sse_response(_events())
+        assert limiter.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_slot_released_when_the_client_disconnects(limiter):
+    async def send(message):
+        if message["type"] == "http.response.body":
+            raise OSError("client disconnected")
+
+    async def main():
+        response = await sse_response(_events())
+        with pytest.raises(Exception):
+            await response(_scope(), _receive, send)
+
+    asyncio.run(main())
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_saturated_stream_gets_429(limiter):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def main():
+        async with limiter.slot():
+            response = await sse_response(_events())
+            await response(_scope(), _receive, send)
+
+    asyncio.run(main())
+    assert sent[0]["status"] == 429
+    assert limiter.stats()["in_flight"] == 0
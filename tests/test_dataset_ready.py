@@ -0,0 +1,62 @@
+import threading
+
+from server.dataset import Dataset
+
+
+class GatedDataset(Dataset):
+    """Loads nothing; `load` blocks until the test lets it finish."""
+
+    def __init__(self):
+        super().__init__(csv_path="unused.csv", snapshot_path="unused.parquet")
+        self.release = threading.Event()
+
+    def load(self):
+        self.release.wait(5)
+        return self
+
+
+def test_callback_registered_during_callbacks_runs():
+    dataset = GatedDataset()
+    calls = []
+    dataset.on_ready(lambda: dataset.on_ready(lambda: calls.append("late")))
+    dataset.on_ready(lambda: calls.append("early"))
+    dataset.release.set()
+    dataset.start(background=False)
+    assert calls == ["early", "late"]
+    assert dataset.state == "ready"
+
+
+def test_no_callback_is_lost_while_loading():
+    dataset = GatedDataset()
+    calls = []
+    dataset.start(background=True)
+    for i in range(200):
+        dataset.on_ready(lambda i=i: calls.append(i))
+        if i == 100:
+            dataset.release.set()
+    assert dataset.ready.wait(5)
+    assert sorted(calls) == list(range(200))
+
+
+def test_callback_after_ready_runs_right_away():
+    dataset = GatedDataset()
+    dataset.release.set()
+    dataset.start(background=False)
+    calls = []
+    dataset.on_ready(lambda: calls.append("now"))
+    assert calls == ["now"]
+
+
+def test_failed_callback_marks_the_dataset_failed():
+    dataset = GatedDataset()
+
+    def boom():
+        raise RuntimeError("boom")
+
+    calls = []
+    dataset.on_ready(boom)
+    dataset.release.set()
+    dataset.start(background=False)
+    dataset.on_ready(lambda: calls.append("skipped"))
+    assert dataset.state == "failed"
+    assert calls == []
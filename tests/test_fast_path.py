@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from router.fast_path import IntentMatcher
+from router.registry import ToolCatalog
+
+SERVERS = ["server.supply_data_server", "server.forecast_agent_server", "server.inventory_agent_server"]
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    import importlib
+
+    catalog = ToolCatalog()
+    for name in SERVERS:
+        mcp = importlib.import_module(name).mcp
+        catalog.update(mcp.name, asyncio.run(mcp.list_tools()))
+    matcher = IntentMatcher()
+    matcher.index(catalog)
+    matcher.vocabulary.update({"regions": ["Europe", "Western Europe", "South Asia"], "products": ["Smart watch"]})
+    return matcher
+
+
+@pytest.mark.parametrize("query", [
+    # Region the tool cannot filter by
+    "demand supply gap for Europe",
+    "low stock products in Europe",
+    "what is the top delayed product in Europe",
+    "average delay by shipping mode in Europe",
+    # Numbers that are not the tool's argument
+    "top delayed products in 2017",
+    "forecast demand in Europe for 2 years",
+])
+def test_unused_entities_and_numbers_go_to_the_llm(matcher, query):
+    assert matcher.match(query) is None
+
+
+@pytest.mark.parametrize("query, tool, args", [
+    ("shipping mode breakdown", "get_shipping_mode_breakdown", {}),
+    ("demand supply gap", "demand_supply_gap", {}),
+    ("restock suggestion for Western Europe", "restock_suggestion", {"region": "Western Europe"}),
+    ("top 3 delayed products", "top_delayed_products", {"n": 3}),
+    ("low stock products below 20", "low_stock_products", {"threshold": 20}),
+    ("forecast demand in Europe and South Asia", "forecast_demand", {"regions": ["Europe", "South Asia"]}),
+])
+def test_single_tool_queries_match(matcher, query, tool, args):
+    match = matcher.match(query)
+    assert match is not None and (match["tool"], match["args"]) == (tool, args)
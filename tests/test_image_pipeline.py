@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+import client.image_pipeline as image_pipeline
+from client.image_pipeline import ImagePipeline
+from telemetry.log_writer import LogWriter
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    writer = LogWriter(flush_interval=0.05)
+    monkeypatch.setattr(image_pipeline, "LOGS", writer)
+    yield writer
+    writer.close()
+
+
+def test_failed_write_is_retried(writer, tmp_path):
+    blocker = tmp_path / "images"
+    blocker.write_text("not a directory")
+    pipeline = ImagePipeline(store_dir=str(blocker))
+
+    path = pipeline.store("abc", "image/png", b"png bytes")
+    assert writer.flush()
+    assert not os.path.exists(path)
+
+    blocker.unlink()
+    assert pipeline.store("abc", "image/png", b"png bytes") == path
+    assert writer.flush()
+    with open(path, "rb") as f:
+        assert f.read() == b"png bytes"
+
+
+def test_dropped_write_is_retried(writer, tmp_path):
+    pipeline = ImagePipeline(store_dir=str(tmp_path))
+    writer._put = lambda item: False  # queue full
+    path = pipeline.store("abc", "image/png", b"png bytes")
+    del writer._put
+
+    pipeline.store("abc", "image/png", b"png bytes")
+    assert writer.flush()
+    assert os.path.exists(path)
+
+
+def test_stored_image_is_written_once(writer, tmp_path):
+    pipeline = ImagePipeline(store_dir=str(tmp_path))
+    path = pipeline.store("abc", "image/png", b"first")
+    assert writer.flush()
+    pipeline.store("abc", "image/png", b"second")
+    assert writer.flush()
+    with open(path, "rb") as f:
+        assert f.read() == b"first"
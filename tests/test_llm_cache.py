@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+
+from client.llm_cache import LLMResponseCache
+
+
+def _cache(tmp_path, **kwargs) -> LLMResponseCache:
+    return LLMResponseCache(path=str(tmp_path / "cache.db"), enabled=True, **kwargs)
+
+
+def test_replies_survive_a_restart(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("k", {"final_response": "hi"})
+    assert asyncio.run(cache.aget("k")) == {"final_response": "hi"}
+    cache.close()
+
+    reopened = _cache(tmp_path)
+    assert asyncio.run(reopened.aget("k")) == {"final_response": "hi"}
+    assert asyncio.run(reopened.aget("other")) is None
+    assert reopened.stats()["hits"] == 1 and reopened.stats()["misses"] == 1
+    reopened.close()
+
+
+def test_sqlite_is_never_read_on_the_event_loop(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("k", {"final_response": "hi"})
+    cache.close()
+    cache = _cache(tmp_path)
+    threads = []
+    read = cache._from_db
+
+    def from_db(key, now):
+        threads.append(threading.get_ident())
+        return read(key, now)
+
+    cache._from_db = from_db
+
+    async def main():
+        loop_thread = threading.get_ident()
+        assert await cache.aget("k") == {"final_response": "hi"}  # from SQLite
+        assert await cache.aget("k") == {"final_response": "hi"}  # from memory
+        return loop_thread
+
+    loop_thread = asyncio.run(main())
+    assert len(threads) == 1 and threads[0] != loop_thread
+    cache.close()
+
+
+def test_expired_replies_miss(tmp_path):
+    cache = _cache(tmp_path, ttl=0.01)
+    cache.put("k", {"final_response": "hi"})
+    time.sleep(0.05)
+    assert asyncio.run(cache.aget("k")) is None
+    cache.close()
@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import client.llm_gateway as llm_gateway
+from client.llm_gateway import LLMGateway
+
+
+def _gateway(create, max_concurrency: int = 2) -> LLMGateway:
+    gateway = LLMGateway(max_concurrency=max_concurrency)
+    gateway.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return gateway
+
+
+async def _drain(gateway, messages):
+    return [chunk async for chunk in gateway.stream(messages)]
+
+
+@pytest.mark.parametrize("error", [
+    ValueError("not retryable"),
+    openai.APIConnectionError(request=httpx.Request("POST", "http://127.0.0.1:9")),
+])
+def test_failed_stream_releases_slot(monkeypatch, error):
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_RETRIES", 0)
+
+    async def create(**kwargs):
+        raise error
+
+    gateway = _gateway(create)
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(type(error)):
+                await _drain(gateway, [{"role": "user", "content": "hi"}])
+        assert gateway.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_stream_holds_slot_until_consumed():
+    async def chunks():
+        yield "a"
+        yield "b"
+
+    async def create(**kwargs):
+        return chunks()
+
+    gateway = _gateway(create)
+
+    async def main():
+        stream = gateway.stream([{"role": "user", "content": "hi"}])
+        assert await stream.__anext__() == "a"
+        assert gateway.in_flight == 1
+        assert [c async for c in stream] == ["b"]
+        assert gateway.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_failed_chat_releases_slot(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_MAX_RETRIES", 0)
+
+    async def create(**kwargs):
+        raise ValueError("boom")
+
+    gateway = _gateway(create, max_concurrency=1)
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await gateway.chat([{"role": "user", "content": "hi"}])
+        assert gateway.stats()["in_flight"] == 0
+
+    asyncio.run(main())
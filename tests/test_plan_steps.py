@@ -0,0 +1,59 @@
+import pytest
+
+import router.router as router
+from router.router import _plan_steps
+
+TOOLS = {"get_delay_stats": "DelayStatsAgent", "forecast_demand": "ForecastAgent",
+         "low_stock_products": "InventoryAgent"}
+
+
+def _plan(*steps) -> dict:
+    return {"reasoning": "r", "plan": list(steps)}
+
+
+def test_next_tool_is_a_one_step_plan():
+    steps = _plan_steps({"next_tool": "get_delay_stats", "args": {}}, TOOLS, first_step=3)
+    assert steps == [{"id": "1", "step": 3, "agent": "DelayStatsAgent", "tool": "get_delay_stats",
+                      "args": {}, "depends_on": []}]
+
+
+def test_steps_keep_the_listed_order_whatever_their_dependencies():
+    steps = _plan_steps(_plan(
+        {"id": "b", "tool": "forecast_demand", "args": {"regions": ["Europe"]}, "depends_on": ["a"]},
+        {"id": "a", "tool": "get_delay_stats"},
+        {"id": "c", "tool": "low_stock_products", "depends_on": ["a", "b"]},
+    ), TOOLS, first_step=1)
+    assert [(s["id"], s["step"], s["depends_on"]) for s in steps] == [
+        ("b", 1, ["a"]), ("a", 2, []), ("c", 3, ["a", "b"]),
+    ]
+
+
+@pytest.mark.parametrize("steps", [
+    [{"id": "a", "tool": "get_delay_stats", "depends_on": ["a"]}],
+    [{"id": "a", "tool": "get_delay_stats", "depends_on": ["b"]},
+     {"id": "b", "tool": "forecast_demand", "depends_on": ["a"]}],
+    # A cycle behind a step that is fine on its own
+    [{"id": "a", "tool": "get_delay_stats"},
+     {"id": "b", "tool": "forecast_demand", "depends_on": ["a", "c"]},
+     {"id": "c", "tool": "low_stock_products", "depends_on": ["b"]}],
+])
+def test_cycles_are_rejected(steps):
+    with pytest.raises(ValueError, match="cycle"):
+        _plan_steps(_plan(*steps), TOOLS, first_step=1)
+
+
+@pytest.mark.parametrize("choice, message", [
+    (_plan({"id": "a", "tool": "delete_everything"}), "Unknown tool"),
+    (_plan({"id": "a", "tool": "get_delay_stats"}, {"id": "a", "tool": "forecast_demand"}), "unique"),
+    (_plan({"id": "a", "tool": "get_delay_stats", "depends_on": ["z"]}), "unknown steps"),
+    ({"reasoning": "r", "plan": []}, "non-empty"),
+])
+def test_invalid_plans_are_rejected(choice, message):
+    with pytest.raises(ValueError, match=message):
+        _plan_steps(choice, TOOLS, first_step=1)
+
+
+def test_plan_size_is_capped(monkeypatch):
+    monkeypatch.setattr(router, "PLAN_MAX_STEPS", 2)
+    with pytest.raises(ValueError, match="at most 2"):
+        _plan_steps(_plan(*[{"id": str(i), "tool": "get_delay_stats"} for i in range(3)]), TOOLS, first_step=1)
@@ -0,0 +1,72 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import memory.session_memory as session_memory
+from memory.session_memory import MemoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MemoryStore(path=str(tmp_path / "memory.db"), legacy_path=None)
+    yield store
+    store.close()
+
+
+def test_reads_do_not_wait_for_a_blocked_flush(store, monkeypatch):
+    monkeypatch.setattr(session_memory, "MEMORY_FLUSH_BATCH", 2)
+    # Another process holds the write lock, so the flush waits on the database
+    blocker = sqlite3.connect(store.path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        t0 = time.monotonic()
+        store.set("u1", "region", "Europe")
+        store.append_to_list("u1", "recent_queries", "q1")  # fills the batch
+        time.sleep(0.2)
+        assert store.get("u1") == {"region": "Europe", "recent_queries": ["q1"]}
+        store.set("u2", "region", "Asia")
+        assert time.monotonic() - t0 < 2
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    store.flush()
+    assert MemoryStore(path=store.path, legacy_path=None).get("u1") == {"region": "Europe", "recent_queries": ["q1"]}
+
+
+def test_failed_write_is_queued_again(store, monkeypatch):
+    store.set("u1", "region", "Europe")
+    original = store._write
+
+    def fail(pending):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(store, "_write", fail)
+    with pytest.raises(sqlite3.OperationalError):
+        store.flush()
+    monkeypatch.setattr(store, "_write", original)
+    store.set("u1", "segment", "retail")
+    store.flush()
+    assert MemoryStore(path=store.path, legacy_path=None).get("u1") == {"region": "Europe", "segment": "retail"}
+
+
+def test_flush_does_not_hold_the_store_lock(store):
+    store.set("u1", "region", "Europe")
+    entered, release = threading.Event(), threading.Event()
+    original = store._write
+
+    def slow(pending):
+        entered.set()
+        release.wait(5)
+        original(pending)
+
+    store._write = slow
+    flusher = threading.Thread(target=store.flush)
+    flusher.start()
+    assert entered.wait(5)
+    acquired = store._lock.acquire(timeout=1)
+    assert acquired
+    store._lock.release()
+    release.set()
+    flusher.join()
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from router.streaming import FinalResponseExtractor
+
+REPLY = json.dumps({
+    "reasoning": 'The user asked about "final_response" handling',
+    "final_response": 'Ship via "Same Day" \\ tab:\there\nline two é ✓ done',
+})
+
+
+def _stream(reply: str, size: int) -> str:
+    extractor = FinalResponseExtractor()
+    return "".join(extractor.feed(reply[i:i + size]) for i in range(0, len(reply), size))
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(REPLY)])
+def test_decodes_the_value_across_any_chunking(size):
+    assert _stream(REPLY, size) == json.loads(REPLY)["final_response"]
+
+
+def test_stops_at_the_closing_quote():
+    extractor = FinalResponseExtractor()
+    assert extractor.feed('{"final_response": "done", "x": "more"') == "done"
+    assert extractor.feed(', "y": "tail"}') == ""
+
+
+def test_each_character_is_decoded_once(monkeypatch):
+    decoded = []
+    decode = FinalResponseExtractor._decode
+    monkeypatch.setattr(FinalResponseExtractor, "_decode",
+                        staticmethod(lambda raw: decoded.append(len(raw)) or decode(raw)))
+    answer = "word \\n " * 5000
+    reply = '{"reasoning": "r", "final_response": "' + answer + '"}'
+
+    assert _stream(reply, 4) == json.loads(reply)["final_response"]
+    # Only a split escape is carried over into the next chunk
+    assert sum(decoded) < len(answer) * 1.5
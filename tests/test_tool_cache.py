@@ -0,0 +1,88 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import router.router as router
+from client.tool_cache import DatasetVersions, ToolResultCache
+
+
+class FakeSession:
+    """Serves dataset://info; `version` changes when the test appends."""
+
+    def __init__(self, version: str = "v1"):
+        self.version = version
+        self.reads = 0
+
+    async def read_resource(self, uri):
+        self.reads += 1
+        info = {"ready": True, "version": self.version}
+        return SimpleNamespace(contents=[SimpleNamespace(text=json.dumps(info))])
+
+
+class FakePool:
+    """One agent whose tool reports the version it ran on; `during_call` runs mid-call."""
+
+    def __init__(self, session: FakeSession, during_call=None):
+        self.agent = SimpleNamespace(session=session)
+        self.during_call = during_call
+        self.calls = 0
+
+    async def acquire(self, card):
+        return self.agent, 0.0
+
+    async def call_tool(self, card, tool_name, args, agent=None):
+        self.calls += 1
+        ran_on = self.agent.session.version
+        if self.during_call is not None:
+            self.during_call()
+        res = SimpleNamespace(isError=False, content=[SimpleNamespace(text=ran_on)])
+        return res, {"spawn": 0.0, "tool": 0.0}, self.agent
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ToolResultCache(ttl=300)
+    monkeypatch.setattr(router, "TOOL_CACHE", cache)
+    monkeypatch.setattr(router, "DATASET_VERSIONS", DatasetVersions())
+    return cache
+
+
+def _call(tool_name: str = "get_delay_stats"):
+    return asyncio.run(router._call_or_cached({"name": "DelayStatsAgent"}, tool_name, {}))
+
+
+def test_append_invalidates_cached_results(cache, monkeypatch):
+    session = FakeSession("v1")
+    pool = FakePool(session)
+    monkeypatch.setattr(router, "POOL", pool)
+
+    assert _call()[0] == "v1"
+    output, _, cache_hit, _ = _call()
+    assert (output, cache_hit) == ("v1", True)
+
+    session.version = "v2"  # an append landed on the agent
+    output, _, cache_hit, _ = _call()
+    assert (output, cache_hit) == ("v2", False)
+    assert pool.calls == 2
+
+
+def test_result_from_before_an_append_is_not_cached(cache, monkeypatch):
+    session = FakeSession("v1")
+    pool = FakePool(session, during_call=lambda: setattr(session, "version", "v2"))
+    monkeypatch.setattr(router, "POOL", pool)
+
+    assert _call()[0] == "v1"
+    assert cache.get("get_delay_stats", {}, "v1") is None
+    assert cache.get("get_delay_stats", {}, "v2") is None
+
+
+def test_version_refresh_bounds_staleness():
+    session = FakeSession("v1")
+    versions = DatasetVersions(refresh=60)
+    assert asyncio.run(versions.get(session)) == "v1"
+    session.version = "v2"
+    assert asyncio.run(versions.get(session)) == "v1"
+    assert session.reads == 1
+    assert asyncio.run(DatasetVersions(refresh=0).get(session)) == "v2"
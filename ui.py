@@ -2,6 +2,7 @@ import streamlit as st
 import requests
 import uuid
 import base64
+import json
 
 # Set the backend URL
 BACKEND_URL = "http://localhost:5001"  # Update if different
@@ -25,12 +26,86 @@ st.session_state.chat_mode = st.sidebar.radio(
     }[x]
 )
 
+stream_responses = st.sidebar.checkbox("Stream responses", value=True)
+
 st.sidebar.markdown("---")
 st.sidebar.markdown("Built with ❤️ using Streamlit")
 
 # Main title
 st.title("🤖 MCP Supply Chain Assistant")
 
+def render_trace_step(step):
+    if "type" in step:
+        if step["type"] == "reasoning":
+            st.markdown(f"**Step {step['step']} - Reasoning:** {step['reasoning']}")
+            if step.get("prompt_tokens"):
+                st.markdown(f"- **Prompt Tokens:** ~{step['prompt_tokens']}")
+            if step.get("llm_cache_hit"):
+                st.markdown("- **Cached planner reply**")
+        elif step["type"] == "tool":
+            st.markdown(f"**Step {step['step']} - Tool Used:** `{step['tool']}`")
+            st.markdown(f"- **Agent:** {step['agent']}")
+            if step.get("plan_id"):
+                after = f" (after {', '.join(step['depends_on'])})" if step.get("depends_on") else ""
+                st.markdown(f"- **Plan Step:** `{step['plan_id']}`{after}")
+            st.markdown(f"- **Arguments:** `{step['args']}`")
+            st.markdown(f"- **Result:** `{step['result']}`")
+            st.markdown(f"- **Duration:** {step['duration']} seconds")
+            if step.get("cache_hit"):
+                st.markdown("- **Cached result**")
+            if step.get("fast_path"):
+                st.markdown(f"- **Fast path** (confidence {step['confidence']})")
+            if step.get("spawn_duration"):
+                st.markdown(f"- **Agent Startup:** {step['spawn_duration']} seconds")
+    else:
+        st.markdown(f"**Tool:** `{step.get('tool_name')}`")
+        st.markdown(f"- **Arguments:** `{step.get('tool_args')}`")
+        st.markdown(f"- **Response:** `{step.get('tool_response')}`")
+        if "duration" in step:
+            st.markdown(f"- **Duration:** {step['duration']} seconds")
+        if step.get("cache_hit"):
+            st.markdown("- **Cached result**")
+        if step.get("fast_path"):
+            st.markdown(f"- **Fast path** (confidence {step['confidence']})")
+
+
+def iter_sse(url, payload):
+    """Yield (event, data) pairs from a server-sent event stream."""
+    with requests.post(url, json=payload, stream=True) as response:
+        response.raise_for_status()
+        event = "message"
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                yield event, json.loads(line[len("data: "):])
+
+
+def stream_query(endpoint, prompt):
+    """Render trace steps and response tokens as they arrive; return the final payload."""
+    with st.chat_message("user"):
+        st.markdown(prompt)
+    with st.chat_message("assistant"):
+        status = st.status("Processing...", expanded=True)
+        answer = st.empty()
+        text = ""
+        for event, data in iter_sse(f"{BACKEND_URL}{endpoint}/stream", {"query": prompt}):
+            if event == "token":
+                text += data["text"]
+                answer.markdown(text)
+            elif event == "tool_start":
+                status.update(label=f"Running `{data.get('tool') or data.get('tool_name')}`...")
+            elif event in ("reasoning", "tool"):
+                with status:
+                    render_trace_step(data)
+            elif event == "error":
+                status.update(label="Failed", state="error")
+                raise requests.exceptions.RequestException(data["error"])
+            elif event == "final":
+                status.update(label="Done", state="complete", expanded=False)
+                return data
+
+
 # Display chat history
 for entry in st.session_state.chat_history:
     with st.chat_message("user"):
@@ -43,25 +118,26 @@ for entry in st.session_state.chat_history:
         if "trace" in entry:
             with st.expander("🔍 View Reasoning Trace"):
                 for step in entry["trace"]:
-                    if "type" in step:
-                        if step["type"] == "reasoning":
-                            st.markdown(f"**Step {step['step']} - Reasoning:** {step['reasoning']}")
-                        elif step["type"] == "tool":
-                            st.markdown(f"**Step {step['step']} - Tool Used:** `{step['tool']}`")
-                            st.markdown(f"- **Agent:** {step['agent']}")
-                            st.markdown(f"- **Arguments:** `{step['args']}`")
-                            st.markdown(f"- **Result:** `{step['result']}`")
-                            st.markdown(f"- **Duration:** {step['duration']} seconds")
-                    else:
-                        st.markdown(f"**Tool:** `{step.get('tool_name')}`")
-                        st.markdown(f"- **Arguments:** `{step.get('tool_args')}`")
-                        st.markdown(f"- **Response:** `{step.get('tool_response')}`")
+                    render_trace_step(step)
 
 
 # Chat input
 if st.session_state.chat_mode in ["multi-agent", "tool-chaining"]:
     prompt = st.chat_input("Type your query here...")
-    if prompt:
+    if prompt and stream_responses:
+        endpoint = "/multi-agent" if st.session_state.chat_mode == "multi-agent" else "/tool-chaining"
+        try:
+            data = stream_query(endpoint, prompt)
+            if data:
+                st.session_state.chat_history.append({
+                    "user": prompt,
+                    "response": data["response"],
+                    "trace": data.get("trace", [])
+                })
+                st.rerun()
+        except requests.exceptions.RequestException as e:
+            st.error(f"Error: {e}")
+    elif prompt:
         with st.spinner("Processing..."):
             endpoint = "/multi-agent" if st.session_state.chat_mode == "multi-agent" else "/tool-chaining"
             try: